@@ -0,0 +1 @@
+"""Data pipeline helpers for the PWC Community Opportunity Index dashboard."""
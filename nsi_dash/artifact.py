@@ -0,0 +1,153 @@
+"""
+Precompiled tract artifact: the merged, district-combined tracts written as
+uncompressed Feather files next to a JSON manifest, so the dashboard can
+memory-map them at startup instead of parsing the statewide shapefile.
+
+The store is partitioned by county FIPS code, one file per county under
+counties/, so a dashboard showing some counties reads (and keeps in memory)
+only their partitions.
+"""
+import datetime
+import hashlib
+import json
+import os
+
+import geopandas as gpd
+import pandas as pd
+
+# Bump whenever the artifact's layout, columns or their meaning change
+ARTIFACT_VERSION = 2
+
+ARTIFACT_DIR = 'artifacts'
+PARTITION_DIR = 'counties'
+MANIFEST_FILE = 'pwc_tracts.manifest.json'
+
+
+def _sha256(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def partition_file(county_fp):
+    """Path of a county's partition, relative to the artifact directory."""
+    return os.path.join(PARTITION_DIR, f"{county_fp}.feather")
+
+
+def write_artifact(grouped_data, sources, county_fps=None, out_dir=ARTIFACT_DIR, level='tract'):
+    """
+    Write the tract artifact, one partition per county (GEOID digits 3-5), and its manifest.
+    `sources` maps a source name to the (path, mtime_ns, sha256) fingerprint it was built from;
+    `county_fps` are the counties the build was asked for (None for all) and
+    `level` is the geography level of the rows (see nsi_dash.geography).
+    """
+    os.makedirs(os.path.join(out_dir, PARTITION_DIR), exist_ok=True)
+    manifest_path = os.path.join(out_dir, MANIFEST_FILE)
+
+    partitions = {}
+    for county_fp, county_data in grouped_data.groupby(grouped_data['GEOID'].str[2:5], sort=True):
+        relative_path = partition_file(county_fp)
+        artifact_path = os.path.join(out_dir, relative_path)
+        # Uncompressed so the file can be memory-mapped without a decode step
+        tmp_path = artifact_path + '.tmp'
+        county_data.reset_index(drop=True).to_feather(tmp_path, compression='uncompressed')
+        os.replace(tmp_path, artifact_path)
+        partitions[county_fp] = {
+            'file': relative_path,
+            'rows': int(len(county_data)),
+            'sha256': _sha256(artifact_path),
+            'bytes': os.path.getsize(artifact_path),
+        }
+
+    # Partitions of counties that are no longer in the data
+    for file_name in os.listdir(os.path.join(out_dir, PARTITION_DIR)):
+        if file_name.endswith('.feather') and file_name[:-len('.feather')] not in partitions:
+            os.remove(os.path.join(out_dir, PARTITION_DIR, file_name))
+
+    manifest = {
+        'artifact_version': ARTIFACT_VERSION,
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'county_fps': county_fps,
+        'level': level,
+        'rows': int(len(grouped_data)),
+        'columns': int(grouped_data.shape[1]),
+        'bytes': sum(partition['bytes'] for partition in partitions.values()),
+        'partitions': partitions,
+        'sources': {
+            name: {'path': os.path.relpath(path), 'sha256': digest}
+            for name, (path, mtime_ns, digest) in sources.items()
+        }
+    }
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
+
+def read_manifest(out_dir=ARTIFACT_DIR):
+    """Return the artifact manifest, or None if there is no usable artifact."""
+    manifest_path = os.path.join(out_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest.get('artifact_version') != ARTIFACT_VERSION:
+        return None
+    for partition in manifest['partitions'].values():
+        if not os.path.exists(os.path.join(out_dir, partition['file'])):
+            return None
+    return manifest
+
+
+def is_current(manifest, source_digests):
+    """
+    True if every source the artifact was built from (the profile CSV and the
+    boundaries) still has the content hash it was built with. `source_digests`
+    maps a source name to its sha256 on disk.
+    """
+    sources = manifest['sources']
+    return 'profile' in sources and all(
+        source_digests.get(name) == source['sha256'] for name, source in sources.items()
+    )
+
+
+def covers_counties(manifest, county_fps=None):
+    """True if the artifact was built for every county in `county_fps` (None for all)."""
+    built = manifest.get('county_fps')
+    return built is None or (county_fps is not None and set(county_fps) <= set(built))
+
+
+def selected_partitions(manifest, county_fps=None):
+    """County FIPS codes of the manifest's partitions among `county_fps` (None for all), sorted."""
+    available = sorted(manifest['partitions'])
+    if county_fps is None:
+        return available
+    return [county_fp for county_fp in available if county_fp in set(county_fps)]
+
+
+def selection_digest(manifest, county_fps=None):
+    """Content hash of the partitions read for `county_fps`, identifying that data version."""
+    partitions = manifest['partitions']
+    return hashlib.sha256(''.join(
+        f"{county_fp}:{partitions[county_fp]['sha256']};" for county_fp in selected_partitions(manifest, county_fps)
+    ).encode()).hexdigest()
+
+
+def read_artifact(out_dir=ARTIFACT_DIR, county_fps=None, manifest=None):
+    """
+    Memory-map the partitions of `county_fps` (None for all counties) into one
+    GeoDataFrame in CensusTract order, or None if none of them is in the store.
+    """
+    manifest = manifest or read_manifest(out_dir)
+    frames = [
+        gpd.read_feather(os.path.join(out_dir, manifest['partitions'][county_fp]['file']), memory_map=True)
+        for county_fp in selected_partitions(manifest, county_fps)
+    ]
+    if not frames:
+        return None
+    if len(frames) == 1:
+        return frames[0]
+    # GEOIDs start with the county code, so partitions in county order are in CensusTract order
+    return gpd.GeoDataFrame(pd.concat(frames, ignore_index=True), crs=frames[0].crs)
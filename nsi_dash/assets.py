@@ -0,0 +1,91 @@
+"""
+Content-hashed data assets for the map page.
+
+With Streamlit static serving on (`server.enableStaticServing` in
+.streamlit/config.toml) the page is a small HTML shell and the tract data
+is fetched from files under static/map/, named by their content hash. The
+static handler sends an ETag for every file and, because the URLs carry the
+hash as `?v=`, a ten year Cache-Control, so browsers and proxies download
+each version of the data once. Streamlit's static handler does not
+negotiate Content-Encoding, so the dashboard writes no precompressed
+variants; exported sites get them (nsi_dash.export).
+"""
+import hashlib
+import logging
+import os
+
+from nsi_dash.compress import ENCODINGS
+from nsi_dash.telemetry import event
+
+STATIC_DIR = 'static'
+ASSET_SUBDIR = 'map'
+# Where Streamlit serves STATIC_DIR, relative to the app's own URL
+STATIC_URL = 'app/static'
+
+
+def content_hash(data):
+    """Short content hash used in asset file names."""
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def plan_assets(payloads, url_prefix=STATIC_URL):
+    """
+    Name and URL for each payload ({name: JSON text or binary bytes}), without
+    writing anything. Returns ({name: url}, {relative file path: bytes}).
+    """
+    urls = {}
+    files = {}
+    for name, payload in payloads.items():
+        if isinstance(payload, bytes):
+            data, extension = payload, 'bin'
+        else:
+            data, extension = payload.encode('utf-8'), 'json'
+        digest = content_hash(data)
+        file_name = f"{name}.{digest}.{extension}"
+        urls[name] = f"{url_prefix}/{ASSET_SUBDIR}/{file_name}?v={digest}"
+        files[os.path.join(ASSET_SUBDIR, file_name)] = data
+    return urls, files
+
+
+def publish_assets(files, static_dir=STATIC_DIR):
+    """
+    Write planned asset files that are not there yet and remove other
+    versions of the same assets, with their precompressed variants.
+    Cheap when everything is already published.
+    """
+    written = []
+    for relative_path, data in files.items():
+        path = os.path.join(static_dir, relative_path)
+        if os.path.exists(path):
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        written.append(path)
+
+    if written:
+        _remove_stale_versions(files, static_dir)
+        event('published_assets', f"Published {len(written)} map data assets to "
+                                  f"{os.path.join(static_dir, ASSET_SUBDIR)}", logging.INFO, files=len(written))
+    return written
+
+
+def _remove_stale_versions(files, static_dir):
+    current = {os.path.basename(path) for path in files}
+    names = {name.split('.', 1)[0] for name in current}
+    asset_dir = os.path.join(static_dir, ASSET_SUBDIR)
+    for file_name in os.listdir(asset_dir):
+        if file_name.endswith('.tmp') or file_name.split('.', 1)[0] not in names:
+            continue
+        # A precompressed variant goes with its original
+        original_name = file_name
+        for suffix, encoding in ENCODINGS:
+            if file_name.endswith(suffix):
+                original_name = file_name[:-len(suffix)]
+        if original_name not in current:
+            try:
+                os.remove(os.path.join(asset_dir, file_name))
+            except OSError:
+                pass
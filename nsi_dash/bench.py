@@ -0,0 +1,312 @@
+"""
+Benchmarks of each stage of the dashboard pipeline at growing tract counts.
+
+    python -m nsi_dash.bench [--scales 1,10,100] [--repeat N] [--baseline FILE] [--save-baseline]
+                             [--tolerance FRACTION] [--out FILE]
+
+Synthetic profiles and boundaries are generated from the profile CSV and
+geojson_data.geojson: scale k holds k copies of every tract, laid out side by
+side and spread over the Northern Virginia counties, with each copy's
+indicator values shuffled between tracts so every copy scores differently.
+Tracts split over several districts keep their rows. The files are written
+to a temporary directory, so loading them is timed like the real ones.
+
+Stages, in the order NSI_Dash.py runs them:
+
+    csv_load          read_profile_data
+    shapefile_load    read_census_tracts of the synthetic shapefile
+    geojson_load      read_census_tracts of the synthetic GeoJSON
+    thresholds        compute_variable_thresholds
+    county_filter     filter_counties and filter_profile_counties
+    merge             merge_profile_with_tracts
+    combine_districts combine_districts
+    tract_data        district parsing and build_tract_data
+    payloads          build_map_payloads (tract_data included)
+    to_json           JSON of every payload
+    html              render_map_html
+
+Each stage reports its best wall time over --repeat runs and, from one more
+run under tracemalloc, its peak of newly allocated memory. The page and its
+payloads are measured in bytes. With --save-baseline the results are written
+to the baseline file; otherwise they are compared with it and the command
+exits with 1 if a stage got slower or bigger by more than --tolerance.
+"""
+import argparse
+import contextlib
+import gzip
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from shapely import affinity
+
+from nsi_dash.districts import district_proportions, district_strings, summarize_districts
+from nsi_dash.loaders import PROFILE_CSV, TRACTS_GEOJSON, read_census_tracts, read_profile_data
+from nsi_dash.map_html import render_map_html
+from nsi_dash.map_page import _payload_json, build_map_payloads
+from nsi_dash.pipeline import (DEFAULT_COUNTY_FP, REGIONS, combine_districts, filter_counties,
+                               filter_profile_counties, merge_profile_with_tracts)
+from nsi_dash.thresholds import compute_variable_thresholds
+from nsi_dash.tracts import build_tract_data
+from nsi_dash.variables import filter_domain_categories, reverse_variables
+
+BASELINE_FILE = 'bench_baseline.json'
+DEFAULT_SCALES = (1, 10, 100)
+DEFAULT_REPEAT = 3
+
+# Allowed growth over the baseline before a stage counts as a regression; changes
+# below the floors are noise whatever their share
+DEFAULT_TOLERANCE = 0.5
+SECONDS_FLOOR = 0.05
+MEMORY_FLOOR_MB = 2.0
+BYTES_TOLERANCE = 0.01
+
+# Synthetic copies are spread over these counties, Prince William first
+SYNTHETIC_COUNTIES = [DEFAULT_COUNTY_FP] + [fp for fp in REGIONS['northern_virginia'] if fp != DEFAULT_COUNTY_FP]
+# Copies per row of the synthetic layout, and the gap between copies as a share of the county's extent
+LAYOUT_COLUMNS = 10
+LAYOUT_GAP = 0.05
+
+
+def synthetic_inputs(scale, out_dir, profile_path=PROFILE_CSV, boundaries_path=TRACTS_GEOJSON, seed=0):
+    """
+    Write a profile CSV, shapefile and GeoJSON with `scale` copies of every
+    tract into `out_dir`. Returns (profile path, shapefile path, GeoJSON path, tract count).
+    """
+    rng = np.random.default_rng(seed)
+    profile = pd.read_csv(profile_path)
+    boundaries = gpd.read_file(boundaries_path)
+    boundaries['GEOID'] = boundaries['GEOID'].astype(str)
+    tracts = list(dict.fromkeys(profile['CensusTract'].tolist()))
+    tract_position = profile['CensusTract'].map({tract: i for i, tract in enumerate(tracts)}).to_numpy()
+    first_rows = pd.Series(tract_position).drop_duplicates().index
+    # Boundaries are matched to profile tracts by GEOID; outlines without a profile row are left out
+    outlines = boundaries.set_index('GEOID').reindex([str(tract) for tract in tracts])
+    outlines = outlines[outlines.geometry.notna()]
+    west, south, east, north = outlines.total_bounds
+    step_x = (east - west) * (1 + LAYOUT_GAP)
+    step_y = (north - south) * (1 + LAYOUT_GAP)
+
+    # Indicator columns are shuffled per copy, one value per tract so district rows stay alike
+    keys = {'CensusTract', 'GEOID', 'District', 'District_combined'}
+    shuffled_columns = [column for column in profile.columns if column not in keys]
+
+    profiles = []
+    shapes = []
+    for copy_number in range(scale):
+        county_fp = SYNTHETIC_COUNTIES[copy_number % len(SYNTHETIC_COUNTIES)]
+        prefix = copy_number // len(SYNTHETIC_COUNTIES)
+        geoids = [f"51{county_fp}{prefix * 1000 + i:06d}" for i in range(len(tracts))]
+
+        rows = profile.copy()
+        if copy_number:
+            order = rng.permutation(len(tracts))
+            rows[shuffled_columns] = profile[shuffled_columns].iloc[first_rows].to_numpy()[order][tract_position]
+        rows['CensusTract'] = [int(geoids[i]) for i in tract_position]
+        profiles.append(rows)
+
+        shifted = gpd.GeoDataFrame({
+            'STATEFP': '51',
+            'COUNTYFP': county_fp,
+            'GEOID': [geoids[tracts.index(int(geoid))] for geoid in outlines.index],
+        }, geometry=outlines.geometry.values, crs=boundaries.crs)
+        column, row = copy_number % LAYOUT_COLUMNS, copy_number // LAYOUT_COLUMNS
+        shifted['geometry'] = shifted.geometry.apply(affinity.translate, xoff=column * step_x, yoff=row * step_y)
+        shapes.append(shifted)
+
+    paths = (os.path.join(out_dir, 'profile.csv'), os.path.join(out_dir, 'tracts.shp'),
+             os.path.join(out_dir, 'tracts.geojson'))
+    pd.concat(profiles, ignore_index=True).to_csv(paths[0], index=False)
+    boundaries = gpd.GeoDataFrame(pd.concat(shapes, ignore_index=True), crs=boundaries.crs)
+    boundaries.to_file(paths[1])
+    boundaries.to_file(paths[2], driver='GeoJSON')
+    return paths + (len(tracts) * scale,)
+
+
+def _rows(name, value):
+    # Rows of a stage's frame (the profile's of the county filter) or tracts of tract_data
+    if isinstance(value, tuple):
+        value = value[0]
+    return len(value) if isinstance(value, pd.DataFrame) or name == 'tract_data' else None
+
+
+def pipeline_stages(profile_path, shapefile_path, geojson_path):
+    """
+    The stages as (name, function of the earlier stages' results); each
+    returns its result, which later stages read by stage name.
+    """
+    def tract_data(results):
+        grouped_data = results['combine_districts']
+        raw = district_strings(grouped_data)
+        table = district_proportions(raw)
+        return build_tract_data(grouped_data, raw, summarize_districts(table, raw.index))
+
+    def payloads(results):
+        profile = results['csv_load']
+        return build_map_payloads(results['combine_districts'], filter_domain_categories(profile.columns),
+                                  results['thresholds'])
+
+    return [
+        ('csv_load', lambda results: read_profile_data(profile_path)),
+        ('shapefile_load', lambda results: read_census_tracts(shapefile_path)),
+        ('geojson_load', lambda results: read_census_tracts(geojson_path)),
+        ('thresholds', lambda results: compute_variable_thresholds(
+            results['csv_load'],
+            [v for variables in filter_domain_categories(results['csv_load'].columns).values() for v in variables],
+            reverse_variables
+        )),
+        ('county_filter', lambda results: (
+            filter_profile_counties(results['csv_load'], SYNTHETIC_COUNTIES),
+            filter_counties(results['shapefile_load'], SYNTHETIC_COUNTIES),
+        )),
+        ('merge', lambda results: merge_profile_with_tracts(*results['county_filter'])),
+        ('combine_districts', lambda results: combine_districts(results['merge'])),
+        ('tract_data', tract_data),
+        ('payloads', payloads),
+        ('to_json', lambda results: {name: _payload_json(payload)
+                                     for name, payload in results['payloads'][0].items() if payload is not None}),
+        ('html', lambda results: render_map_html(results['to_json'], **results['payloads'][1])),
+    ]
+
+
+def run_stages(stages, repeat=DEFAULT_REPEAT):
+    """
+    {stage: {'seconds', 'peak_mb', 'rows'}}: the best wall time over `repeat`
+    runs of each stage and the peak memory it allocated in one traced run.
+    The stages' own progress messages and span log are dropped. Returns (metrics, results).
+    """
+    results = {}
+    metrics = {}
+    for name, stage in stages:
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            seconds = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                result = stage(results)
+                seconds.append(time.perf_counter() - start)
+                del result
+
+            tracemalloc.start()
+            try:
+                before = tracemalloc.get_traced_memory()[0]
+                result = stage(results)
+                peak = tracemalloc.get_traced_memory()[1] - before
+            finally:
+                tracemalloc.stop()
+        results[name] = result
+        metrics[name] = {'seconds': min(seconds), 'peak_mb': peak / 2 ** 20,
+                         'rows': _rows(name, result)}
+    return metrics, results
+
+
+def page_sizes(results):
+    """Bytes of the rendered page (raw and gzipped) and of each inlined payload."""
+    page = results['html'].encode('utf-8')
+    return {
+        'page': len(page),
+        'page_gzip': len(gzip.compress(page, compresslevel=6, mtime=0)),
+        'payloads': {name: len(payload if isinstance(payload, bytes) else payload.encode('utf-8'))
+                     for name, payload in results['to_json'].items()},
+    }
+
+
+def benchmark(scales=DEFAULT_SCALES, repeat=DEFAULT_REPEAT, seed=0):
+    """{scale: {'tracts', 'stages', 'bytes'}} for each scale, keyed by the scale as a string."""
+    report = {}
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as out_dir:
+            print(f"Generating {scale}x synthetic tracts...")
+            *paths, tracts = synthetic_inputs(scale, out_dir, seed=seed)
+            print(f"Timing {tracts} tracts...")
+            metrics, results = run_stages(pipeline_stages(*paths), repeat)
+        report[str(scale)] = {'tracts': tracts, 'stages': metrics, 'bytes': page_sizes(results)}
+    return report
+
+
+def regressions(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Messages for every stage and size of `report` that grew beyond the baseline's."""
+    messages = []
+    for scale, current in report.items():
+        previous = baseline.get(scale)
+        if previous is None:
+            continue
+        for stage, metrics in current['stages'].items():
+            before = previous['stages'].get(stage)
+            if before is None:
+                continue
+            for key, unit, floor in (('seconds', 's', SECONDS_FLOOR), ('peak_mb', 'MB', MEMORY_FLOOR_MB)):
+                if metrics[key] > before[key] * (1 + tolerance) and metrics[key] - before[key] > floor:
+                    messages.append(f"{scale}x {stage}: {metrics[key]:.3f} {unit}, baseline {before[key]:.3f} {unit}")
+        sizes = dict(current['bytes']['payloads'], page=current['bytes']['page'])
+        previous_sizes = dict(previous['bytes']['payloads'], page=previous['bytes']['page'])
+        for name, size in sizes.items():
+            if name in previous_sizes and size > previous_sizes[name] * (1 + BYTES_TOLERANCE):
+                messages.append(f"{scale}x {name}: {size} bytes, baseline {previous_sizes[name]} bytes")
+    return messages
+
+
+def bench_report(report, baseline=None):
+    """Text table of each scale's stage times and memory, with the baseline's times if given."""
+    lines = []
+    for scale, current in report.items():
+        previous = (baseline or {}).get(scale, {}).get('stages', {})
+        lines.append(f"{scale}x: {current['tracts']} tracts, page {current['bytes']['page'] / 1024:.1f} KB "
+                     f"({current['bytes']['page_gzip'] / 1024:.1f} KB gzipped)")
+        lines.append(f"  {'stage':<20}{'rows':>8}{'seconds':>10}{'baseline':>10}{'peak MB':>10}")
+        for stage, metrics in current['stages'].items():
+            before = previous.get(stage)
+            rows = '-' if metrics['rows'] is None else metrics['rows']
+            baseline_seconds = f"{before['seconds']:.3f}" if before else '-'
+            lines.append(f"  {stage:<20}{rows:>8}{metrics['seconds']:>10.3f}{baseline_seconds:>10}"
+                         f"{metrics['peak_mb']:>10.1f}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark each stage of the dashboard pipeline.")
+    parser.add_argument('--scales', default=','.join(map(str, DEFAULT_SCALES)),
+                        type=lambda text: [int(scale) for scale in text.split(',')],
+                        help="copies of the profile's tracts to benchmark, comma separated (default: %(default)s)")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help="timed runs per stage, the best counts (default: %(default)s)")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="baseline results file (default: %(default)s)")
+    parser.add_argument('--save-baseline', action='store_true', help="write the results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed growth over the baseline as a fraction (default: %(default)s)")
+    parser.add_argument('--out', help="also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    report = benchmark(args.scales, args.repeat)
+    baseline = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print(bench_report(report, baseline))
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=1)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=1)
+        print(f"Saved the baseline to {args.baseline}")
+        return 0
+    if baseline is None:
+        print(f"No baseline at {args.baseline}, save one with --save-baseline")
+        return 0
+
+    failed = regressions(report, baseline, args.tolerance)
+    for message in failed:
+        print(f"Regression: {message}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
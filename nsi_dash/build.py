@@ -0,0 +1,101 @@
+"""
+Offline build of the precompiled tract artifact.
+
+    python -m nsi_dash.build [--level {tract,block_group}] [--profile CSV] [--tracts SHAPEFILE]
+                             [--counties FIPS,...|REGION|all] [--out DIR]
+
+Reads the statewide tract shapefile once, filters it to the counties, merges it
+with the profile CSV and combines districts, then writes the result as one
+partition per county with a manifest, so the dashboard never has to touch the
+shapefile at runtime and reads only the counties it shows.
+With --level block_group the block group profile and boundaries are used
+instead and the artifact goes to artifacts/block_group/.
+"""
+import argparse
+import sys
+import time
+
+from nsi_dash.artifact import (ARTIFACT_DIR, covers_counties, is_current, read_artifact, read_manifest,
+                               write_artifact)
+from nsi_dash.geography import DEFAULT_LEVEL, GEOGRAPHY_LEVELS, geography_level, level_artifact_dir
+from nsi_dash.loaders import file_fingerprint, read_census_tracts, read_profile_data, source_digests
+from nsi_dash.pipeline import REGIONS, county_list, prepare_tracts
+
+
+def build(profile_path=None, tracts_path=None, county_fps=None, out_dir=None, level=DEFAULT_LEVEL):
+    """
+    Build the artifact for a geography level and return its manifest, or None
+    if nothing matched. `county_fps` is anything pipeline.county_list takes,
+    None for every county in the profile. Paths default to the level's
+    profile, boundaries and artifact directory.
+    """
+    county_fps = county_list(county_fps)
+    profile_path = profile_path or geography_level(level)['profile']
+    tracts_path = tracts_path or geography_level(level)['boundaries']
+    out_dir = out_dir or level_artifact_dir(level)
+
+    start = time.perf_counter()
+    profile_data = read_profile_data(profile_path, level)
+    census_tracts = read_census_tracts(tracts_path)
+    print(f"Read {len(profile_data)} profile rows and {len(census_tracts)} tract boundaries "
+          f"in {time.perf_counter() - start:.2f}s")
+
+    grouped_data = prepare_tracts(profile_data, census_tracts, county_fps)
+    if grouped_data is None:
+        print("No data available after merging. Please check your data files.")
+        return None
+
+    sources = {
+        'profile': file_fingerprint(profile_path),
+        'tracts': file_fingerprint(tracts_path)
+    }
+    manifest = write_artifact(grouped_data, sources, county_fps, out_dir, level)
+    label = geography_level(level)['label'].lower()
+    print(f"Wrote {manifest['rows']} {label} rows in {len(manifest['partitions'])} county partitions "
+          f"({manifest['bytes'] / 1024:.0f} KB) to {out_dir} in {time.perf_counter() - start:.2f}s")
+    return manifest
+
+
+def load_prepared_data(level=DEFAULT_LEVEL, profile_path=None, tracts_path=None, artifact_dir=None,
+                       profile_data=None, county_fps=None):
+    """
+    The prepared rows of a level in the counties `county_fps` (anything
+    pipeline.county_list takes, None for all): the artifact partitions when
+    they are current with the profile CSV and boundaries, otherwise prepared
+    in memory from the boundaries. Paths default to the level's; pass `profile_data` if the
+    profile is already read. Returns None when no profile row matched a boundary.
+    """
+    county_fps = county_list(county_fps)
+    profile_path = profile_path or geography_level(level)['profile']
+    tracts_path = tracts_path or geography_level(level)['boundaries']
+    artifact_dir = artifact_dir or level_artifact_dir(level)
+
+    manifest = read_manifest(artifact_dir)
+    if (manifest is not None and is_current(manifest, source_digests(manifest, profile_path, tracts_path))
+            and covers_counties(manifest, county_fps)):
+        grouped_data = read_artifact(artifact_dir, county_fps, manifest)
+        if grouped_data is not None:
+            return grouped_data
+    if profile_data is None:
+        profile_data = read_profile_data(profile_path, level)
+    return prepare_tracts(profile_data, read_census_tracts(tracts_path), county_fps)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompile the merged tract artifact for the dashboard.")
+    parser.add_argument('--level', choices=tuple(GEOGRAPHY_LEVELS), default=DEFAULT_LEVEL,
+                        help="geography level (default: %(default)s)")
+    parser.add_argument('--profile', help="opportunity profile CSV (default: the level's)")
+    parser.add_argument('--tracts', help="TIGER boundary shapefile (default: the level's)")
+    parser.add_argument('--counties', '--county', default='all',
+                        help="county FIPS codes to keep, comma separated, or a region "
+                             f"({', '.join(REGIONS)}) (default: every county in the profile)")
+    parser.add_argument('--out', help=f"output directory (default: {ARTIFACT_DIR}/ or {ARTIFACT_DIR}/LEVEL/)")
+    args = parser.parse_args(argv)
+
+    manifest = build(args.profile, args.tracts, args.counties, args.out, args.level)
+    return 0 if manifest is not None else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+Binary columnar encoding of per-tract data for the browser.
+
+The file is a small JSON header followed by one typed array per column, so
+the page can wrap each column in an Int32Array/Int8Array view of the fetched
+buffer without parsing or copying it:
+
+    'NSIC' | uint32 header length | header JSON | padding | columns...
+
+The header is {"rows": n, "strings": [...], "columns": [{"table", "name",
+"type", "offset"}]}. Offsets are from the start of the file and 8-byte
+aligned; everything is little-endian. Text columns ('str') hold Int32 codes
+into the shared string dictionary, -1 for missing; 'i8' columns hold small
+integers such as flags. Variable values reach the page as display strings
+and flags (nsi_dash.display), so there are no float columns.
+"""
+import json
+import struct
+
+import numpy as np
+import pandas as pd
+
+MAGIC = b'NSIC'
+
+DTYPES = {'str': '<i4', 'i8': '<i1'}
+
+
+def _column(frame, name):
+    """(type, array) for one column."""
+    series = frame[name]
+    if series.dtype == np.int8:
+        return 'i8', series.to_numpy()
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        raise ValueError(f"column {name!r} is numeric; only text and int8 columns are encoded")
+    return 'str', series
+
+
+def encode_columns(tables):
+    """
+    Encode {table name: DataFrame} (all with the same rows, in tract ordinal
+    order) into the binary format. int8 columns stay int8 and object columns
+    are text; other numeric columns raise ValueError.
+    """
+    rows = None
+    strings = {}
+    columns = []
+    for table_name, frame in tables.items():
+        if rows is None:
+            rows = len(frame)
+        elif len(frame) != rows:
+            raise ValueError(f"table {table_name!r} has {len(frame)} rows, expected {rows}")
+        for name in frame.columns:
+            kind, values = _column(frame, name)
+            if kind == 'str':
+                codes = [-1 if value is None or (isinstance(value, float) and np.isnan(value))
+                         else strings.setdefault(str(value), len(strings)) for value in values.tolist()]
+                values = np.array(codes, dtype=np.int64)
+            columns.append((table_name, name, kind, np.ascontiguousarray(values, dtype=DTYPES[kind])))
+
+    def header_bytes(offsets):
+        header = {
+            'rows': rows or 0,
+            'strings': list(strings),
+            'columns': [{'table': table_name, 'name': name, 'type': kind, 'offset': offset}
+                        for (table_name, name, kind, values), offset in zip(columns, offsets)],
+        }
+        return json.dumps(header, separators=(',', ':')).encode('utf-8')
+
+    def align(n):
+        return (n + 7) // 8 * 8
+
+    # Offsets depend on the header length and the header holds the offsets:
+    # lay out until the header stops growing
+    offsets = [0] * len(columns)
+    while True:
+        header = header_bytes(offsets)
+        position = align(8 + len(header))
+        new_offsets = []
+        for table_name, name, kind, values in columns:
+            new_offsets.append(position)
+            position = align(position + values.nbytes)
+        if new_offsets == offsets:
+            break
+        offsets = new_offsets
+
+    out = bytearray(position)
+    out[0:4] = MAGIC
+    out[4:8] = struct.pack('<I', len(header))
+    out[8:8 + len(header)] = header
+    for (table_name, name, kind, values), offset in zip(columns, offsets):
+        out[offset:offset + values.nbytes] = values.tobytes()
+    return bytes(out)
+
+
+def decode_columns(data):
+    """Inverse of encode_columns: {table: {name: numpy array or list of str/None}}."""
+    if data[0:4] != MAGIC:
+        raise ValueError("not a tract column file")
+    header_length = struct.unpack('<I', data[4:8])[0]
+    header = json.loads(data[8:8 + header_length])
+    rows = header['rows']
+    strings = header['strings']
+    tables = {}
+    for column in header['columns']:
+        values = np.frombuffer(data, dtype=DTYPES[column['type']], count=rows, offset=column['offset'])
+        if column['type'] == 'str':
+            values = [strings[code] if code >= 0 else None for code in values.tolist()]
+        tables.setdefault(column['table'], {})[column['name']] = values
+    return tables
@@ -0,0 +1,118 @@
+"""
+Precompressed variants of the map page and its data assets.
+
+Every file gets a .gz next to it and, when the optional `brotli` package is
+installed, a .br. nsi_dash.serve (or a reverse proxy such as nginx with
+gzip_static/brotli_static) picks the variant matching the request's
+Accept-Encoding, so nothing is compressed per request.
+"""
+import gzip
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Variant suffix and Content-Encoding, in order of preference
+ENCODINGS = (('.br', 'br'), ('.gz', 'gzip'))
+
+
+def available_encodings():
+    """Content-Encodings we can produce here."""
+    return [encoding for suffix, encoding in ENCODINGS if encoding != 'br' or brotli is not None]
+
+
+def compress(data, encoding):
+    if encoding == 'gzip':
+        # mtime=0 keeps the output identical for identical input
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    raise ValueError(f"Unknown encoding {encoding!r}")
+
+
+def precompress_file(path):
+    """
+    Write the .gz/.br variants of a file that are missing or older than it.
+    Returns {'file': path, 'bytes': n, 'gzip': n, 'br': n} (missing encodings are None).
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    sizes = {'file': path, 'bytes': len(data), 'gzip': None, 'br': None}
+    for suffix, encoding in ENCODINGS:
+        if encoding not in available_encodings():
+            continue
+        variant_path = path + suffix
+        if not os.path.exists(variant_path) or os.path.getmtime(variant_path) < os.path.getmtime(path):
+            tmp_path = f"{variant_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(compress(data, encoding))
+            os.replace(tmp_path, variant_path)
+        sizes[encoding] = os.path.getsize(variant_path)
+    return sizes
+
+
+def precompress(paths):
+    """precompress_file for each path, returning the size rows for size_report."""
+    return [precompress_file(path) for path in paths]
+
+
+def size_report(rows):
+    """Text table of original and compressed sizes with compression ratios."""
+    def kb(n):
+        return f"{n / 1024:9.1f}" if n is not None else f"{'-':>9}"
+
+    def ratio(n, total):
+        return f"{total / n:6.1f}x" if n else f"{'-':>7}"
+
+    lines = [f"{'file':<48}{'KB':>9}{'gzip KB':>9}{'ratio':>7}{'br KB':>9}{'ratio':>7}"]
+    for row in rows + [{
+        'file': 'total',
+        'bytes': sum(row['bytes'] for row in rows),
+        'gzip': sum(row['gzip'] for row in rows) if all(row['gzip'] for row in rows) else None,
+        'br': sum(row['br'] for row in rows) if all(row['br'] for row in rows) else None,
+    }]:
+        name = os.path.basename(row['file'])
+        lines.append(f"{name:<48}{kb(row['bytes'])}{kb(row['gzip'])}{ratio(row['gzip'], row['bytes'])}"
+                     f"{kb(row['br'])}{ratio(row['br'], row['bytes'])}")
+    if brotli is None:
+        lines.append("(install the brotli package for .br variants)")
+    return '\n'.join(lines)
+
+
+def parse_accept_encoding(header):
+    """{coding: q} from an Accept-Encoding header."""
+    accepted = {}
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def select_variant(path, accept_encoding):
+    """
+    The precompressed variant of `path` to send for an Accept-Encoding header,
+    as (file path, Content-Encoding), or (path, None) for the original.
+    Prefers the highest q-value, then br over gzip.
+    """
+    accepted = parse_accept_encoding(accept_encoding)
+    best = (path, None)
+    best_q = 0.0
+    for suffix, encoding in ENCODINGS:
+        q = accepted.get(encoding, accepted.get('*', 0.0))
+        if q > best_q and os.path.exists(path + suffix):
+            best = (path + suffix, encoding)
+            best_q = q
+    return best
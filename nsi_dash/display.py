@@ -0,0 +1,159 @@
+"""
+Display strings and above/below-average flags for the variables in the
+details panel, computed once per tract and variable instead of on every click.
+
+The formatting reproduces what the page did in JavaScript (Math.round,
+toFixed and Number-to-string), so the panel text does not change.
+"""
+import decimal
+import math
+import re
+
+import numpy as np
+import pandas as pd
+
+MISSING_TEXT = 'N/A'
+
+# Direction flags: above the midpoint of the p33/p67 thresholds, at or below
+# it, or no value or thresholds to compare with
+ABOVE_AVERAGE = 1
+BELOW_AVERAGE = -1
+NEAR_AVERAGE = 0
+
+# A variable is shown as a percentage if its name has one of these and none of the exceptions
+PERCENT_MARKERS = ('PCT', '_P', 'Percent_', 'percent_', 'Work_', 'With_', 'Owner_occupied', 'House_Vacant', 'Prop_')
+NOT_PERCENT_MARKERS = ('Calls', '_Calls', 'EMS', 'Medical', 'Violence', 'Opioid', 'Fires', 'Homeless', 'VMC', 'SFPC',
+                       'Vegetation', 'LIFEEXPPCT', 'PM25', 'OZONE', 'NO2', 'PTRAF', 'Total_Population', 'Median_Age')
+
+# The leading number JavaScript's parseFloat reads from a string
+_LEADING_NUMBER = re.compile(r'^\s*([+-]?(?:Infinity|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?))')
+
+
+def format_class(variable):
+    """How a variable's values are written: 'percent', 'years', 'ratio' or 'number'."""
+    if (any(marker in variable for marker in PERCENT_MARKERS)
+            and not any(marker in variable for marker in NOT_PERCENT_MARKERS)):
+        return 'percent'
+    if variable == 'Median_Age':
+        return 'years'
+    if 'Ratio' in variable:
+        return 'ratio'
+    return 'number'
+
+
+def js_round(values):
+    """Math.round: the nearest integer, halves towards +infinity."""
+    floor = np.floor(values)
+    return floor + (values - floor >= 0.5)
+
+
+def js_number(value):
+    """A number written the way JavaScript's String(number) writes it."""
+    if value == 0:
+        return '0'
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return 'Infinity' if value > 0 else '-Infinity'
+    # repr gives the shortest digits that round-trip, like JavaScript
+    sign, digits, exponent = decimal.Decimal(repr(float(value))).normalize().as_tuple()
+    digits = ''.join(map(str, digits))
+    k = len(digits)
+    n = exponent + k
+    if k <= n <= 21:
+        text = digits + '0' * (n - k)
+    elif 0 < n <= 21:
+        text = digits[:n] + '.' + digits[n:]
+    elif -6 < n <= 0:
+        text = '0.' + '0' * -n + digits
+    else:
+        mantissa = digits[0] + ('.' + digits[1:] if k > 1 else '')
+        text = f"{mantissa}e{'+' if n - 1 >= 0 else '-'}{abs(n - 1)}"
+    return ('-' if sign else '') + text
+
+
+def js_to_fixed(value, places=2):
+    """Number.prototype.toFixed: exact value rounded half away from zero."""
+    if abs(value) >= 1e21 or math.isnan(value):
+        return js_number(value)
+    text = str(decimal.Decimal(value).quantize(decimal.Decimal(1).scaleb(-places), rounding=decimal.ROUND_HALF_UP))
+    # -0 is written without its sign
+    return text[1:] if value == 0 and text.startswith('-') else text
+
+
+def parse_float(value):
+    """JavaScript's parseFloat of a table value: NaN for missing or unreadable values."""
+    if value is None:
+        return math.nan
+    if isinstance(value, (bool, np.bool_)):
+        return math.nan
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return float(value)
+    match = _LEADING_NUMBER.match(str(value))
+    return float(match.group(1).replace('Infinity', 'inf')) if match else math.nan
+
+
+def format_values(values, fmt):
+    """Display strings for an array of numbers (NaN for missing) in a format class."""
+    values = np.asarray(values, dtype=np.float64)
+    if fmt == 'percent':
+        numbers = js_round(np.where(values < 1, values * 100, values))
+        suffix = '%'
+    elif fmt == 'years':
+        numbers = js_round(values)
+        suffix = ' years'
+    elif fmt == 'number':
+        numbers = js_round(values * 100) / 100
+        suffix = ''
+    else:
+        numbers = values
+        suffix = ''
+
+    # Write each distinct value once
+    texts = {}
+    out = []
+    for value in numbers.tolist():
+        if value not in texts:
+            texts[value] = (js_to_fixed(value) if fmt == 'ratio' else js_number(value)) + suffix
+        out.append(texts[value])
+    return out
+
+
+def direction_flags(values, thresholds):
+    """ABOVE_AVERAGE/BELOW_AVERAGE against the midpoint of a variable's p33 and p67, NEAR_AVERAGE without a value."""
+    values = np.asarray(values, dtype=np.float64)
+    if not thresholds:
+        return np.full(len(values), NEAR_AVERAGE, dtype=np.int8)
+    median = (thresholds['p33'] + thresholds['p67']) / 2
+    flags = np.where(values > median, ABOVE_AVERAGE, BELOW_AVERAGE).astype(np.int8)
+    flags[np.isnan(values)] = NEAR_AVERAGE
+    return flags
+
+
+def display_frames(frame, variable_thresholds):
+    """
+    Display strings and direction flags for every column of `frame`, one row per tract.
+    Returns (DataFrame of str, DataFrame of int8 flags) with the same columns.
+    """
+    display = {}
+    direction = {}
+    for variable in frame.columns:
+        series = frame[variable]
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            numbers = series.to_numpy(dtype=np.float64, na_value=np.nan)
+            texts = format_values(numbers, format_class(variable))
+            text_values = [None] * len(series)
+        else:
+            text_values = series.tolist()
+            numbers = np.array([parse_float(value) for value in text_values], dtype=np.float64)
+            texts = format_values(numbers, format_class(variable))
+        missing = series.isna().to_numpy() | (series.astype(str) == '').to_numpy()
+        display[variable] = [
+            MISSING_TEXT if is_missing
+            else str(text) if text is not None and math.isnan(number)
+            else formatted
+            for is_missing, number, formatted, text in zip(missing, numbers.tolist(), texts, text_values)
+        ]
+        direction[variable] = direction_flags(numbers, variable_thresholds.get(variable))
+    return (pd.DataFrame(display, index=frame.index, columns=frame.columns),
+            pd.DataFrame(direction, index=frame.index, columns=frame.columns))
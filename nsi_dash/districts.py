@@ -0,0 +1,165 @@
+"""
+Columnar parsing of district assignments such as 'WOODBRIDGE:100%',
+'COLES:39.91%,POTOMAC:60.09%' or 'GAINESVILLE15.18%'.
+
+The strings are parsed once into a long tract x district proportion table,
+which the tract JSON builder and the district filters read directly.
+"""
+import pandas as pd
+import shapely
+from shapely.ops import polylabel
+
+NOT_AVAILABLE = 'Not Available'
+
+# A proportion written straight after the name, e.g. 'GAINESVILLE15.18%'
+_TRAILING_PROPORTION = r'(?s)^(?P<name>.*?)(?P<proportion>\d+\.?\d*)%$'
+
+
+def clean_text(frame, column, default=NOT_AVAILABLE):
+    """Stripped text of a column, with missing or blank values (or a missing column) as the default."""
+    if column not in frame.columns:
+        return pd.Series(default, index=frame.index, dtype=object)
+    values = frame[column]
+    text = values.astype(str).str.strip()
+    return text.where(values.notna() & (text != ''), default)
+
+
+def district_strings(grouped_data):
+    """
+    Raw district string per tract, indexed by CensusTract.
+    Uses District_combined when present, otherwise District; blanks become 'Not Available'.
+    """
+    column = 'District_combined' if 'District_combined' in grouped_data.columns else 'District'
+    text = clean_text(grouped_data, column)
+    text.index = pd.Index(grouped_data['CensusTract'], name='CensusTract')
+    return text
+
+
+def district_proportions(district_raw):
+    """
+    Parse district strings (indexed by tract) into one row per tract and district.
+
+    Returns a DataFrame with columns CensusTract, position, district and proportion.
+    Parts without a readable proportion count as 100%. Tracts that are
+    'Not Available' have no rows.
+    """
+    district_raw = district_raw[(district_raw != NOT_AVAILABLE) & (district_raw != '')]
+
+    # One row per comma separated part, keeping its position within the string
+    parts = district_raw.str.split(',').explode().str.strip()
+    parts.index.name = 'CensusTract'
+    parts = parts.reset_index(name='part')
+    parts['position'] = parts.groupby('CensusTract').cumcount()
+
+    # 'DISTRICT:PROPORTION%'
+    has_colon = parts['part'].str.contains(':', regex=False)
+    colon = parts.loc[has_colon, 'part'].str.split(':', n=1, expand=True)
+    if colon.empty:
+        colon = pd.DataFrame({0: pd.Series(dtype=object), 1: pd.Series(dtype=object)})
+    colon_proportion = pd.to_numeric(colon[1].str.strip().str.replace('%', '', regex=False),
+                                     errors='coerce')
+
+    # 'DISTRICTPROPORTION%' or a bare 'DISTRICT'
+    trailing = parts.loc[~has_colon, 'part'].str.extract(_TRAILING_PROPORTION)
+    matched = trailing['proportion'].notna()
+
+    district = parts['part'].copy()
+    district.loc[colon.index] = colon[0].str.strip()
+    district.loc[trailing.index[matched]] = trailing.loc[matched, 'name'].str.strip()
+
+    proportion = pd.Series(float('nan'), index=parts.index)
+    proportion.loc[colon.index] = colon_proportion
+    proportion.loc[trailing.index[matched]] = pd.to_numeric(trailing.loc[matched, 'proportion'])
+
+    return pd.DataFrame({
+        'CensusTract': parts['CensusTract'],
+        'position': parts['position'],
+        'district': district,
+        'proportion': proportion.fillna(100.0)
+    })
+
+
+def summarize_districts(table, tracts):
+    """
+    Per-tract district summary from a proportion table.
+
+    Returns a DataFrame indexed by tract with the columns districts (list),
+    proportions (dict of district to proportion), display_text,
+    is_multi_district and primary_district.
+    """
+    tracts = pd.Index(tracts, name='CensusTract')
+
+    # A district listed twice keeps its first position and its last proportion
+    first_position = table.groupby(['CensusTract', 'district'])['position'].transform('min')
+    unique = (table.assign(position=first_position)
+                   .drop_duplicates(['CensusTract', 'district'], keep='last')
+                   .sort_values(['CensusTract', 'position']))
+
+    by_tract = table.groupby('CensusTract', sort=False)
+    districts = by_tract['district'].agg(list)
+    counts = by_tract.size()
+
+    unique_by_tract = unique.groupby('CensusTract', sort=False)
+    proportions = pd.Series({
+        tract: dict(zip(group['district'], group['proportion']))
+        for tract, group in unique_by_tract[['district', 'proportion']]
+    }, dtype=object)
+
+    # Primary district is the first one with the highest proportion
+    primary = unique.loc[unique_by_tract['proportion'].idxmax()].set_index('CensusTract')['district']
+
+    # Display text lists districts by proportion (descending), with the
+    # percentage unless a district covers the whole tract
+    shown = table.merge(unique[['CensusTract', 'district', 'proportion']].rename(columns={'proportion': 'share'}),
+                        on=['CensusTract', 'district'])
+    shown = shown.sort_values(['CensusTract', 'share', 'position'], ascending=[True, False, True], kind='stable')
+    label = shown['district'].where(
+        shown['share'] == 100.0,
+        shown['district'] + ' (' + shown['share'].map('{:.2f}'.format) + '%)'
+    )
+    display_text = label.groupby(shown['CensusTract'], sort=False).agg(', '.join)
+    single = counts[counts == 1].index
+    display_text.loc[single] = districts.loc[single].str[0]
+
+    summary = pd.DataFrame({
+        'districts': districts.reindex(tracts),
+        'proportions': proportions.reindex(tracts),
+        'display_text': display_text.reindex(tracts),
+        'is_multi_district': counts.reindex(tracts).fillna(0) > 1,
+        'primary_district': primary.reindex(tracts)
+    }, index=tracts)
+
+    # Tracts without any district
+    missing = summary['districts'].isna()
+    summary.loc[missing, 'districts'] = pd.Series([[] for _ in range(missing.sum())],
+                                                  index=summary.index[missing], dtype=object)
+    summary.loc[missing, 'proportions'] = pd.Series([{} for _ in range(missing.sum())],
+                                                    index=summary.index[missing], dtype=object)
+    summary.loc[missing, ['display_text', 'primary_district']] = NOT_AVAILABLE
+    return summary
+
+
+def district_names(table):
+    """Sorted names of the districts in a proportion table (see district_proportions)."""
+    return sorted(table['district'].unique().tolist())
+
+
+def district_label_points(grouped_data, district_info):
+    """
+    Where to label each district on the map: the pole of inaccessibility of the
+    largest piece of the tracts it is the primary district of. `district_info`
+    is the summarize_districts table in grouped_data's row order. Returns
+    [{'name': 'Woodbridge', 'location': [lat, lon]}] sorted by name.
+    """
+    primary = district_info['primary_district'].to_numpy()
+    geometries = grouped_data.geometry.values
+    labels = []
+    for name in sorted(set(primary) - {NOT_AVAILABLE}):
+        area = shapely.union_all(geometries[primary == name])
+        pieces = [piece for piece in getattr(area, 'geoms', [area])
+                  if piece.geom_type == 'Polygon' and not piece.is_empty]
+        if not pieces:
+            continue
+        point = polylabel(max(pieces, key=lambda piece: piece.area), tolerance=1e-4)
+        labels.append({'name': name.title(), 'location': [round(point.y, 6), round(point.x, 6)]})
+    return labels
@@ -0,0 +1,156 @@
+"""
+Export the map page to a standalone HTML file.
+
+    python -m nsi_dash.export [--out FILE | --site DIR] [--level {tract,block_group}] [--profile CSV]
+                              [--tracts SHAPEFILE] [--artifacts DIR] [--counties FIPS,...|REGION|all]
+                              [--geometry-format {topojson,geojson,tiles}] [--tiles DIR_OR_MBTILES]
+                              [--attribute-format {json,binary}] [--renderer {auto,svg,canvas}]
+                              [--weights DOMAIN=WEIGHT,...]
+
+The dashboard renders the page in memory; this is for anyone who wants the
+file itself, e.g. to share or host it elsewhere. With --site the page is
+written as DIR/index.html over content-hashed data assets in DIR/map/, all
+with precompressed .gz/.br variants, ready for `python -m nsi_dash.serve DIR`.
+Site data assets hold the variable values as binary columns unless
+--attribute-format json is given.
+
+--geometry-format tiles (sites only) draws the outlines from the vector
+tiles of --tiles, built by `python -m nsi_dash.tiles`: a tile directory is
+copied to DIR/tiles/, an MBTiles file is served with
+`python -m nsi_dash.serve DIR --mbtiles FILE`.
+
+--weights recomputes the index, tiers and top domains under other domain
+weights (nsi_dash.weighting) before the page is rendered, e.g.
+--weights "Housing=2,Public Health=0"; domains not listed weigh 1.
+"""
+import argparse
+import os
+import shutil
+import sys
+
+from nsi_dash.assets import publish_assets
+from nsi_dash.build import load_prepared_data
+from nsi_dash.compress import precompress, size_report
+from nsi_dash.geography import DEFAULT_LEVEL, GEOGRAPHY_LEVELS, geography_level
+from nsi_dash.loaders import read_profile_data
+from nsi_dash.map_page import (ATTRIBUTE_FORMATS, DEFAULT_ATTRIBUTE_FORMAT, DEFAULT_GEOMETRY_FORMAT,
+                               GEOMETRY_FORMATS, RENDERERS, build_map_html, build_map_shell)
+from nsi_dash.thresholds import compute_variable_thresholds
+from nsi_dash.tiles import TILE_DIR, TILE_SUBDIR, read_tileset
+from nsi_dash.variables import filter_domain_categories, reverse_variables
+from nsi_dash.weighting import apply_weights, parse_weights
+
+OUTPUT_FILE = 'PWC_Community_Opportunity_Index_Multi_Select_Legend_Map.html'
+
+
+def export(out_path=OUTPUT_FILE, profile_path=None, tracts_path=None, artifact_dir=None,
+           geometry_format=DEFAULT_GEOMETRY_FORMAT, site_dir=None, attribute_format=DEFAULT_ATTRIBUTE_FORMAT,
+           renderer='auto', level=DEFAULT_LEVEL, tiles_path=TILE_DIR, county_fps=None, weights=None):
+    """
+    Render the map page of the counties `county_fps` (None for all) and write
+    it to `out_path`, or as a precompressed site to `site_dir`. Paths default
+    to the geography level's. `weights` ({domain: weight}) recomputes the index
+    with nsi_dash.weighting first. Returns False if there was no data or no usable tile set.
+    """
+    if geometry_format == 'tiles' and site_dir is None:
+        print("Vector tiles are fetched by the page, export them with --site")
+        return False
+
+    profile_path = profile_path or geography_level(level)['profile']
+    profile_data = read_profile_data(profile_path, level)
+    filtered_domain_categories = filter_domain_categories(profile_data.columns)
+    variable_thresholds = compute_variable_thresholds(
+        profile_data,
+        [variable for variables in filtered_domain_categories.values() for variable in variables],
+        reverse_variables
+    )
+
+    grouped_data = load_prepared_data(level, profile_path, tracts_path, artifact_dir, profile_data, county_fps)
+    if grouped_data is None or len(grouped_data) == 0:
+        print("No data available after merging. Please check your data files.")
+        return False
+    if weights:
+        grouped_data = apply_weights(grouped_data, filtered_domain_categories, reverse_variables, weights)
+
+    if site_dir is not None:
+        tileset = None
+        if geometry_format == 'tiles':
+            tileset = read_tileset(tiles_path)
+            if tileset is None:
+                print(f"No vector tiles at {tiles_path}, run python -m nsi_dash.tiles first")
+                return False
+        export_site(site_dir, grouped_data, filtered_domain_categories, variable_thresholds,
+                    geometry_format, attribute_format, renderer, level, tileset, tiles_path)
+        return True
+
+    html_content = build_map_html(grouped_data, filtered_domain_categories, variable_thresholds,
+                                  geometry_format=geometry_format, renderer=renderer, level=level)
+    with open(out_path, 'w') as f:
+        f.write(html_content)
+    print(f"Wrote {out_path} ({len(html_content.encode('utf-8')) / 1024:.0f} KB)")
+    return True
+
+
+def export_site(site_dir, grouped_data, filtered_domain_categories, variable_thresholds,
+                geometry_format=DEFAULT_GEOMETRY_FORMAT, attribute_format=DEFAULT_ATTRIBUTE_FORMAT,
+                renderer='auto', level=DEFAULT_LEVEL, tileset=None, tiles_path=TILE_DIR):
+    """
+    Write the page shell, its data assets and their precompressed variants, and print their sizes.
+    A tile directory `tiles_path` is copied along when the page draws vector tiles.
+    """
+    html_content, files = build_map_shell(grouped_data, filtered_domain_categories, variable_thresholds,
+                                          url_prefix='.', geometry_format=geometry_format,
+                                          attribute_format=attribute_format, renderer=renderer,
+                                          tileset=tileset, level=level)
+    os.makedirs(site_dir, exist_ok=True)
+    index_path = os.path.join(site_dir, 'index.html')
+    with open(index_path, 'w') as f:
+        f.write(html_content)
+    publish_assets(files, static_dir=site_dir)
+
+    if tileset is not None:
+        site_tiles = os.path.join(site_dir, TILE_SUBDIR)
+        if tiles_path.endswith('.mbtiles'):
+            print(f"Serve the tiles with python -m nsi_dash.serve {site_dir} --mbtiles {tiles_path}")
+        elif read_tileset(site_tiles) != tileset:
+            shutil.rmtree(site_tiles, ignore_errors=True)
+            shutil.copytree(tiles_path, site_tiles)
+            print(f"Copied {tileset['tiles']} vector tiles to {site_tiles}")
+
+    rows = precompress([index_path] + [os.path.join(site_dir, path) for path in files])
+    print(f"Wrote {site_dir}")
+    print(size_report(rows))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the opportunity index map to an HTML file.")
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument('--out', default=OUTPUT_FILE, help="HTML file to write")
+    output.add_argument('--site', help="directory to write a precompressed page shell and data assets to")
+    parser.add_argument('--level', choices=tuple(GEOGRAPHY_LEVELS), default=DEFAULT_LEVEL,
+                        help="geography level (default: %(default)s)")
+    parser.add_argument('--profile', help="opportunity profile CSV (default: the level's)")
+    parser.add_argument('--tracts', help="TIGER boundary shapefile (default: the level's)")
+    parser.add_argument('--artifacts', help="precompiled artifact directory (default: the level's)")
+    parser.add_argument('--counties', default='all',
+                        help="county FIPS codes to map, comma separated, or a region (default: all)")
+    parser.add_argument('--geometry-format', choices=GEOMETRY_FORMATS, default=DEFAULT_GEOMETRY_FORMAT,
+                        help="how tract outlines reach the page; tiles needs --site (default: %(default)s)")
+    parser.add_argument('--tiles', default=TILE_DIR,
+                        help="vector tile directory or .mbtiles file for --geometry-format tiles "
+                             "(default: %(default)s)")
+    parser.add_argument('--attribute-format', choices=ATTRIBUTE_FORMATS, default=DEFAULT_ATTRIBUTE_FORMAT,
+                        help="encoding of variable values in --site data assets (default: %(default)s)")
+    parser.add_argument('--renderer', choices=RENDERERS, default='auto',
+                        help="how the map draws tracts; auto uses canvas for large maps (default: %(default)s)")
+    parser.add_argument('--weights', type=parse_weights, default=None,
+                        help="domain weights for the index, e.g. 'Housing=2,Public Health=0' (default: published index)")
+    args = parser.parse_args(argv)
+
+    return 0 if export(args.out, args.profile, args.tracts, args.artifacts, args.geometry_format, args.site,
+                       args.attribute_format, args.renderer, args.level, args.tiles, args.counties,
+                       args.weights) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,57 @@
+"""
+Geography levels the pipeline can run at: census tracts or block groups.
+
+A level names its TIGER boundary file, the profile CSV with one row per unit,
+the profile column holding each unit's GEOID and how many digits a GEOID has.
+Whatever the level, rows keep their GEOID in the CensusTract column the rest
+of the dashboard is keyed on, so the map page and the tract data code work
+unchanged on block groups.
+"""
+import os
+
+from nsi_dash.artifact import ARTIFACT_DIR
+
+GEOGRAPHY_LEVELS = {
+    'tract': {
+        'label': 'Census Tract',
+        'boundaries': 'Demographic_files/tl_2024_51_tract.shp',
+        'profile': 'PWC_Census_Tract_Opportunity_Profile.csv',
+        'id_column': 'CensusTract',
+        'geoid_length': 11,
+    },
+    'block_group': {
+        'label': 'Block Group',
+        'boundaries': 'Demographic_files/tl_2024_51_bg.shp',
+        'profile': 'PWC_Block_Group_Opportunity_Profile.csv',
+        'id_column': 'BlockGroup',
+        'geoid_length': 12,
+    },
+}
+DEFAULT_LEVEL = 'tract'
+
+
+def geography_level(name=DEFAULT_LEVEL):
+    """The GEOGRAPHY_LEVELS entry for a level name."""
+    if name not in GEOGRAPHY_LEVELS:
+        raise ValueError(f"geography level must be one of {tuple(GEOGRAPHY_LEVELS)}, not {name!r}")
+    return GEOGRAPHY_LEVELS[name]
+
+
+def level_artifact_dir(name=DEFAULT_LEVEL, artifact_dir=ARTIFACT_DIR):
+    """Artifact directory of a level; tracts keep the top-level directory."""
+    return artifact_dir if name == DEFAULT_LEVEL else os.path.join(artifact_dir, name)
+
+
+def profile_keys(profile_data, name=DEFAULT_LEVEL):
+    """
+    Give a profile read at a level its string GEOID join key and the
+    CensusTract row key. A GEOID already in the profile is kept.
+    """
+    level = geography_level(name)
+    if 'GEOID' not in profile_data.columns:
+        # Assuming the level's id column from the CSV is the GEOID
+        profile_data["GEOID"] = profile_data[level['id_column']].astype(str)
+    profile_data["GEOID"] = profile_data["GEOID"].astype(str).str.zfill(level['geoid_length'])
+    if level['id_column'] != 'CensusTract':
+        profile_data["CensusTract"] = profile_data["GEOID"]
+    return profile_data
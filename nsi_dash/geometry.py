@@ -0,0 +1,239 @@
+"""
+Geometry preparation for the map payload: coordinate quantization and
+topology-preserving simplification at several zoom-dependent tolerances.
+
+Tract rings are cut into arcs at the points where neighbouring tracts meet,
+and every shared arc is stored and simplified once, so adjacent tracts keep
+identical boundaries (no slivers or gaps) however far they are simplified.
+"""
+import numpy as np
+import shapely
+
+# Decimal places kept in coordinates; 5 is about 1 m at this latitude
+DEFAULT_PRECISION = 5
+
+# Simplification tolerance in degrees, used from each zoom level up.
+# Both stay below a quarter of a screen pixel at the zoom where they start.
+DEFAULT_ZOOM_TOLERANCES = {0: 0.0001, 13: 0.00002}
+
+
+def _polygons(geometry):
+    if geometry is None or geometry.is_empty:
+        return []
+    if geometry.geom_type == 'Polygon':
+        return [geometry]
+    if geometry.geom_type == 'MultiPolygon':
+        return list(geometry.geoms)
+    return []
+
+
+def _ring_points(ring, scale):
+    """Ring coordinates on the integer grid, without the closing point or repeated vertices."""
+    points = np.round(np.asarray(ring.coords)[:, :2] * scale).astype(np.int64)
+    if len(points) > 1:
+        repeated = np.all(points[1:] == points[:-1], axis=1)
+        points = points[np.concatenate([[True], ~repeated])]
+    if len(points) > 1 and np.all(points[0] == points[-1]):
+        points = points[:-1]
+    return [tuple(p) for p in points.tolist()]
+
+
+def _simplify_arcs(arcs, tolerance):
+    """
+    Douglas-Peucker simplification of every arc in one GEOS call. Lines keep
+    their end points, closed arcs too, so arcs still meet at the junctions.
+    """
+    if tolerance <= 0 or not arcs:
+        return list(arcs)
+    lines = shapely.linestrings(np.concatenate(arcs),
+                                indices=np.repeat(np.arange(len(arcs)), [len(arc) for arc in arcs]))
+    simplified = shapely.simplify(lines, tolerance, preserve_topology=False)
+    coordinates, index = shapely.get_coordinates(simplified, return_index=True)
+    # Grid coordinates are integers, exact in float64
+    return np.split(np.rint(coordinates).astype(np.int64), np.searchsorted(index, np.arange(1, len(arcs))))
+
+
+class TractTopology:
+    """
+    Shared-arc topology of a sequence of (multi)polygons.
+
+    `arcs` holds integer grid coordinates (degrees x 10**precision). Each
+    feature is a list of polygons, each polygon a list of rings, each ring a
+    list of arc references; a reference ~i means arc i reversed.
+    """
+
+    def __init__(self, geometries, precision=DEFAULT_PRECISION):
+        self.precision = precision
+        self.scale = 10 ** precision
+
+        rings_by_feature = [
+            [[_ring_points(ring, self.scale) for ring in [polygon.exterior, *polygon.interiors]]
+             for polygon in _polygons(geometry)]
+            for geometry in geometries
+        ]
+
+        junctions = self._find_junctions(
+            ring for polygons in rings_by_feature for rings in polygons for ring in rings
+        )
+
+        self.arcs = []
+        self._arc_index = {}
+        self.features = [
+            [[self._cut_ring(ring, junctions) for ring in rings if len(ring) >= 3]
+             for rings in polygons]
+            for polygons in rings_by_feature
+        ]
+        self.arcs = [np.array(arc, dtype=np.int64) for arc in self.arcs]
+
+    @staticmethod
+    def _find_junctions(rings):
+        """Points where the rings passing through them do not all share the same neighbours."""
+        neighbours = {}
+        junctions = set()
+        for ring in rings:
+            n = len(ring)
+            for i, point in enumerate(ring):
+                pair = frozenset((ring[i - 1], ring[(i + 1) % n]))
+                seen = neighbours.setdefault(point, pair)
+                if seen != pair:
+                    junctions.add(point)
+        return junctions
+
+    def _add_arc(self, points):
+        """Reference to an arc, reusing an existing arc or its reverse."""
+        key = tuple(points)
+        index = self._arc_index.get(key)
+        if index is not None:
+            return index
+        index = self._arc_index.get(key[::-1])
+        if index is not None:
+            return ~index
+        self._arc_index[key] = len(self.arcs)
+        self.arcs.append(points)
+        return len(self.arcs) - 1
+
+    def _cut_ring(self, ring, junctions):
+        cuts = [i for i, point in enumerate(ring) if point in junctions]
+        if not cuts:
+            # A ring nobody else touches is one closed arc, started at its
+            # smallest point so an identical ring elsewhere maps to the same arc
+            start = ring.index(min(ring))
+            rotated = ring[start:] + ring[:start]
+            return [self._add_arc(rotated + [rotated[0]])]
+
+        rotated = ring[cuts[0]:] + ring[:cuts[0]]
+        cuts = [i - cuts[0] for i in cuts] + [len(ring)]
+        rotated = rotated + [rotated[0]]
+        return [self._add_arc(rotated[a:b + 1]) for a, b in zip(cuts[:-1], cuts[1:])]
+
+    def simplified_arcs(self, tolerance):
+        """
+        Arcs simplified with a tolerance in degrees. Arcs of a shell that would
+        collapse keep full detail, so no tract disappears and its neighbours
+        still share the same edge.
+        """
+        arcs = _simplify_arcs(self.arcs, tolerance * self.scale)
+        for polygons in self.features:
+            for rings in polygons:
+                if rings and len(self._ring(rings[0], arcs)) < 4:
+                    for ref in rings[0]:
+                        index = ref if ref >= 0 else ~ref
+                        arcs[index] = self.arcs[index]
+        return arcs
+
+    @staticmethod
+    def _ring(refs, arcs):
+        parts = [arcs[ref] if ref >= 0 else arcs[~ref][::-1] for ref in refs]
+        return np.concatenate([parts[0]] + [part[1:] for part in parts[1:]])
+
+    def geometry_type(self, index):
+        """'Polygon' or 'MultiPolygon' for a feature."""
+        return 'Polygon' if len(self.features[index]) == 1 else 'MultiPolygon'
+
+    def coordinates(self, tolerance=0):
+        """
+        GeoJSON-style coordinates per feature at a simplification tolerance,
+        as (geometry type, nested lists of [lon, lat]).
+        """
+        arcs = self.simplified_arcs(tolerance)
+        features = []
+        for polygons in self.features:
+            polygon_coords = []
+            for rings in polygons:
+                ring_coords = []
+                for position, refs in enumerate(rings):
+                    ring = self._ring(refs, arcs)
+                    # Holes simplified away are dropped
+                    if position > 0 and len(ring) < 4:
+                        continue
+                    ring_coords.append((ring / self.scale).tolist())
+                if ring_coords:
+                    polygon_coords.append(ring_coords)
+            if len(polygon_coords) == 1:
+                features.append(('Polygon', polygon_coords[0]))
+            else:
+                features.append(('MultiPolygon', polygon_coords))
+        return features
+
+    def to_topojson(self, zoom_tolerances=DEFAULT_ZOOM_TOLERANCES, properties=None, ids=None,
+                    object_name='tracts'):
+        """
+        TopoJSON topology with quantized, delta-encoded arcs.
+
+        The coarsest zoom level goes into `arcs`; finer levels go into a
+        `levels` member ({min_zoom: arcs}) that uses the same arc references,
+        since simplification keeps every arc's end points. `properties` and
+        `ids` are optional per-feature lists.
+        """
+        points = np.concatenate(self.arcs) if self.arcs else np.zeros((1, 2), dtype=np.int64)
+        origin = points.min(axis=0)
+
+        def encode(arcs):
+            return [np.diff(arc - origin, axis=0, prepend=[[0, 0]]).tolist() for arc in arcs]
+
+        zooms = sorted(zoom_tolerances)
+        levels = {zoom: encode(self.simplified_arcs(zoom_tolerances[zoom])) for zoom in zooms}
+
+        geometries = []
+        for index, polygons in enumerate(self.features):
+            geometry_type = self.geometry_type(index)
+            geometry = {
+                'type': geometry_type,
+                'arcs': polygons[0] if geometry_type == 'Polygon' else polygons,
+            }
+            if ids is not None:
+                geometry['id'] = ids[index]
+            if properties is not None:
+                geometry['properties'] = properties[index]
+            geometries.append(geometry)
+
+        return {
+            'type': 'Topology',
+            'transform': {
+                'scale': [1 / self.scale, 1 / self.scale],
+                'translate': (origin / self.scale).tolist(),
+            },
+            'objects': {object_name: {'type': 'GeometryCollection', 'geometries': geometries}},
+            'arcs': levels[zooms[0]],
+            'levels': {zoom: levels[zoom] for zoom in zooms[1:]},
+        }
+
+
+def to_shapely(coordinates):
+    """Shapely geometries from TractTopology.coordinates output."""
+    geometries = []
+    for geometry_type, coords in coordinates:
+        if geometry_type == 'Polygon':
+            geometries.append(shapely.Polygon(coords[0], coords[1:]))
+        else:
+            geometries.append(shapely.MultiPolygon([(rings[0], rings[1:]) for rings in coords]))
+    return geometries
+
+
+def prepare_geometry_levels(geometries, zoom_tolerances=DEFAULT_ZOOM_TOLERANCES, precision=DEFAULT_PRECISION):
+    """
+    Quantize and simplify geometries once per zoom level.
+    Returns {min_zoom: TractTopology.coordinates(...)} in ascending zoom order.
+    """
+    topology = TractTopology(geometries, precision)
+    return {zoom: topology.coordinates(zoom_tolerances[zoom]) for zoom in sorted(zoom_tolerances)}
@@ -0,0 +1,192 @@
+"""
+Cached data loaders shared by every Streamlit session in the process.
+
+Each loader is keyed on the file's absolute path, mtime and content hash, so
+an edited file is picked up on the next rerun while unchanged files are
+parsed once per process. Copies of earlier versions are not cleared, since
+other sessions may still use them; each loader's max_entries evicts them
+once they are no longer requested. Returned objects are shared between sessions and
+must be treated as read-only - copy them before adding or changing columns.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import geopandas as gpd
+import pandas as pd
+import streamlit as st
+
+from nsi_dash.artifact import (ARTIFACT_DIR, covers_counties, is_current, read_artifact, read_manifest,
+                               selection_digest)
+from nsi_dash.geography import DEFAULT_LEVEL, profile_keys
+from nsi_dash.scoring import with_indicator_scores
+from nsi_dash.telemetry import counted_cache, event
+from nsi_dash.variables import domain_categories, reverse_variables
+
+PROFILE_CSV = 'PWC_Census_Tract_Opportunity_Profile.csv'
+TRACTS_GEOJSON = 'geojson_data.geojson'
+TRACTS_SHAPEFILE = 'Demographic_files/tl_2024_51_tract.shp'
+
+# Sidecar files that make up a shapefile; a change to any of them changes the data
+SHAPEFILE_PARTS = ['.shp', '.shx', '.dbf', '.prj', '.cpg']
+
+# Content hashes are remembered per (path, size, mtime) so a rerun only
+# re-hashes a file after it has been touched on disk
+_digest_cache = {}
+_digest_lock = threading.Lock()
+
+
+def _file_digest(path, stat):
+    stat_key = (path, stat.st_size, stat.st_mtime_ns)
+    with _digest_lock:
+        digest = _digest_cache.get(stat_key)
+    if digest is not None:
+        return digest
+
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+
+    with _digest_lock:
+        # Forget digests of earlier versions of this file
+        for key in [k for k in _digest_cache if k[0] == path]:
+            del _digest_cache[key]
+        _digest_cache[stat_key] = digest
+    return digest
+
+
+def file_fingerprint(path):
+    """
+    Return (path, mtime_ns, sha256) identifying the current contents of a file.
+    For a shapefile the mtime and hash cover all of its sidecar files.
+    """
+    path = os.path.abspath(path)
+    stem, ext = os.path.splitext(path)
+    if ext.lower() == '.shp':
+        parts = [stem + part for part in SHAPEFILE_PARTS if os.path.exists(stem + part)]
+        if path not in parts:
+            # Let the missing .shp raise the usual FileNotFoundError
+            parts.insert(0, path)
+    else:
+        parts = [path]
+
+    mtime_ns = 0
+    digests = []
+    for part in parts:
+        stat = os.stat(part)
+        mtime_ns = max(mtime_ns, stat.st_mtime_ns)
+        digests.append(_file_digest(part, stat))
+
+    if len(digests) == 1:
+        return path, mtime_ns, digests[0]
+    return path, mtime_ns, hashlib.sha256(''.join(digests).encode()).hexdigest()
+
+
+def _cached_load(loader, path):
+    """Call a cached loader with the file's fingerprint, its cache key."""
+    return loader(*file_fingerprint(path))
+
+
+def read_profile_data(path=PROFILE_CSV, level=DEFAULT_LEVEL):
+    """
+    Read an opportunity profile CSV at a geography level (tracts by default),
+    uncached. Scoring columns it lacks are derived from its indicator columns
+    (nsi_dash.scoring).
+    """
+    return with_indicator_scores(profile_keys(pd.read_csv(path), level), domain_categories, reverse_variables)
+
+
+def read_census_tracts(path=TRACTS_SHAPEFILE):
+    """Read census tract (or block group) boundaries, uncached."""
+    census_tracts = gpd.read_file(path)
+    census_tracts["GEOID"] = census_tracts["GEOID"].astype(str)
+    return census_tracts
+
+
+@counted_cache('profile_csv', st.cache_resource(max_entries=4))
+def _read_profile_csv(path, mtime_ns, digest):
+    return read_profile_data(path)
+
+
+@counted_cache('geojson', st.cache_resource(max_entries=4))
+def _read_geojson(path, mtime_ns, digest):
+    with open(path) as f:
+        return json.load(f)
+
+
+@counted_cache('census_tracts', st.cache_resource(max_entries=4))
+def _read_census_tracts(path, mtime_ns, digest):
+    return read_census_tracts(path)
+
+
+@counted_cache('tract_artifact', st.cache_resource(max_entries=4))
+def _read_tract_artifact(out_dir, county_fps, digest):
+    return read_artifact(out_dir, None if county_fps is None else list(county_fps))
+
+
+def load_profile_data(path=PROFILE_CSV):
+    """Load the tract opportunity profile CSV with a string GEOID column."""
+    return _cached_load(_read_profile_csv, path)
+
+
+def load_geojson(path=TRACTS_GEOJSON):
+    """Load a GeoJSON file as a plain dictionary."""
+    return _cached_load(_read_geojson, path)
+
+
+def load_census_tracts(path=TRACTS_SHAPEFILE):
+    """Load census tract boundaries with a string GEOID column."""
+    return _cached_load(_read_census_tracts, path)
+
+
+def source_digests(manifest, profile_path=PROFILE_CSV, tracts_path=None):
+    """
+    Content hashes on disk of the sources an artifact manifest records, for
+    artifact.is_current. The boundaries are read from `tracts_path`, or from
+    the path the manifest recorded. A source whose file is not on disk keeps
+    its recorded hash: deployments may ship the artifact without the
+    statewide shapefile it was built from.
+    """
+    paths = {'profile': profile_path, 'tracts': tracts_path}
+    digests = {}
+    for name, source in manifest['sources'].items():
+        path = paths.get(name) or source['path']
+        digests[name] = file_fingerprint(path)[2] if os.path.exists(path) else source['sha256']
+    return digests
+
+
+def tract_artifact_version(out_dir=ARTIFACT_DIR, profile_path=PROFILE_CSV, county_fps=None, tracts_path=None):
+    """
+    Content hash of the artifact partitions of `county_fps` (None for all
+    counties), or None when the artifact is missing, from another artifact
+    version, built from a different profile CSV or boundaries than the ones
+    on disk, or not built for all of those counties.
+    """
+    manifest = read_manifest(out_dir)
+    if manifest is None:
+        return None
+    if not is_current(manifest, source_digests(manifest, profile_path, tracts_path)):
+        event('stale_artifact', "Tract artifact is out of date with the profile CSV or boundaries; "
+                                "rebuilding in memory", logging.INFO)
+        return None
+    if not covers_counties(manifest, county_fps):
+        return None
+    return selection_digest(manifest, county_fps)
+
+
+def load_tract_artifact(out_dir=ARTIFACT_DIR, profile_path=PROFILE_CSV, county_fps=None, tracts_path=None):
+    """
+    Load the counties `county_fps` (None for all) of the precompiled tract
+    artifact written by `python -m nsi_dash.build`, reading only their
+    partitions. Returns (tracts, version) with the tract_artifact_version of
+    the data, or (None, None) when there is no current artifact for them.
+    """
+    digest = tract_artifact_version(out_dir, profile_path, county_fps, tracts_path)
+    if digest is None:
+        return None, None
+    county_fps = None if county_fps is None else tuple(sorted(county_fps))
+    return _read_tract_artifact(os.path.abspath(out_dir), county_fps, digest), digest
@@ -0,0 +1,2453 @@
+"""
+HTML template for the Leaflet opportunity index map.
+"""
+import json
+
+from nsi_dash.weighting import INDEX_LEVELS, TIER_NAMES
+
+# Tract payloads the page loads up front, inlined or fetched
+MAP_DATA_NAMES = ('tract_data', 'tract_columns', 'tract_topology', 'geo_data', 'geometry_levels', 'tract_bounds')
+
+# Payloads named with this prefix and a domain's tab id hold that domain's
+# variables; the page loads them when the tab is first shown
+DOMAIN_DATA_PREFIX = 'domain_'
+
+# Payload of the domain scores behind the domain weight sliders (nsi_dash.weighting),
+# loaded when a weight is first changed
+DOMAIN_SCORES_DATA = 'weighting_scores'
+
+
+def render_map_html(map_data, domain_categories_json, variable_name_map_json,
+                    center_lat, center_lon, district_names_json='[]', district_labels_json='[]',
+                    fit_bounds=None, data_urls=None, renderer='svg', tiles=None, geography_label='Census Tract',
+                    weighted_domains_json='[]'):
+    """
+    Fill the map page template.
+
+    `map_data` maps payload names (MAP_DATA_NAMES, or DOMAIN_DATA_PREFIX and
+    a domain's tab id) to JSON text inlined in the page. Payloads in
+    `data_urls` ({name: url}) are fetched instead, so the page stays a small
+    shell, the domain payloads only once their tab is shown; binary payloads
+    are only ever fetched. Feature ids are tract ordinals into the payloads.
+    `renderer` is 'svg' or 'canvas' (see nsi_dash.map_page.choose_renderer).
+    `tiles` ({url, layer, minZoom, maxZoom, bounds}) makes the page draw the
+    outlines from vector tiles instead of tract_topology/geo_data.
+    `geography_label` names one map unit, e.g. 'Block Group'.
+    `district_names_json` lists the districts of the filter and
+    `district_labels_json` their labels ([{name, location: [lat, lon]}]);
+    `fit_bounds` ([[south, west], [north, east]]) zooms the map to that extent.
+    `weighted_domains_json` lists the domains of the DOMAIN_SCORES_DATA
+    payload, one weight slider each; without them the sliders are left out.
+    """
+    inline_data = ',\n'.join(
+        f"            {name}: {map_data.get(name, 'null')}" for name in MAP_DATA_NAMES
+    )
+    inline_domain_data = ',\n'.join(
+        f"            {json.dumps(name[len(DOMAIN_DATA_PREFIX):])}: {text}"
+        for name, text in map_data.items() if name.startswith(DOMAIN_DATA_PREFIX)
+    )
+    data_urls = data_urls or {}
+    domain_data_urls = {name[len(DOMAIN_DATA_PREFIX):]: url for name, url in data_urls.items()
+                        if name.startswith(DOMAIN_DATA_PREFIX)}
+    data_urls = {name: url for name, url in data_urls.items() if not name.startswith(DOMAIN_DATA_PREFIX)}
+    inline_domain_scores = map_data.get(DOMAIN_SCORES_DATA, 'null')
+    domain_scores_url_json = json.dumps(data_urls.pop(DOMAIN_SCORES_DATA, None))
+    data_urls_json = json.dumps(data_urls) if data_urls else 'null'
+    domain_data_urls_json = json.dumps(domain_data_urls)
+    tiles_json = json.dumps(tiles) if tiles else 'null'
+    fit_bounds_json = json.dumps(fit_bounds) if fit_bounds else 'null'
+    geography_noun = geography_label.lower()
+    return f'''<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>PWC Community Opportunity Index Map</title>
+    <link rel="stylesheet" href="https://unpkg.com/leaflet@1.7.1/dist/leaflet.css"/>
+    <script src="https://unpkg.com/leaflet@1.7.1/dist/leaflet.js"></script>
+    <link href="https://fonts.googleapis.com/css2?family=Roboto:wght@300;400;500;700&display=swap" rel="stylesheet">
+    <style>
+        * {{
+            margin: 0;
+            padding: 0;
+            box-sizing: border-box;
+            font-family: 'Roboto', sans-serif;
+        }}
+
+        html, body {{
+            margin: 0;
+            padding: 0;
+            width: 100%;
+            height: 100%;
+            overflow: hidden;
+        }}
+
+        body {{
+            display: flex;
+            height: 100vh;
+            width: 100vw;
+            margin: 0;
+            padding: 0;
+            overflow: hidden;
+            background-color: #1f2937;
+            color: #f3f4f6;
+            position: fixed;
+            top: 0;
+            left: 0;
+        }}
+
+        #map {{
+            flex: 1;
+            height: 100vh;
+            width: calc(100vw - 400px);
+            z-index: 1;
+            position: absolute;
+            top: 0;
+            left: 0;
+        }}
+
+        #panel {{
+            width: 400px;
+            height: 100vh;
+            padding: 20px;
+            background-color: #1f2937;
+            box-shadow: -3px 0 10px rgba(0,0,0,0.2);
+            overflow-y: auto;
+            display: flex;
+            flex-direction: column;
+            z-index: 2;
+            border-left: 1px solid #374151;
+            position: fixed;
+            right: 0;
+            top: 0;
+        }}
+
+        #panel.hidden {{
+            display: none;
+        }}
+
+        h1 {{
+            margin-top: 0;
+            margin-bottom: 15px;
+            font-size: 22px;
+            font-weight: 500;
+            text-align: center;
+            color: #f3f4f6;
+        }}
+
+        h2 {{
+            margin-top: 0;
+            font-size: 18px;
+            font-weight: 500;
+            color: #f3f4f6;
+        }}
+
+        h3 {{
+            margin-top: 20px;
+            margin-bottom: 10px;
+            font-size: 16px;
+            font-weight: 500;
+            color: #f3f4f6;
+        }}
+
+        hr {{
+            border: 0;
+            height: 1px;
+            background: #374151;
+            margin: 15px 0;
+        }}
+
+        table {{
+            width: 100%;
+            border-collapse: collapse;
+            margin-bottom: 15px;
+            background-color: #283548;
+            border-radius: 8px;
+            overflow: hidden;
+        }}
+
+        td {{
+            padding: 10px;
+            border-bottom: 1px solid #374151;
+        }}
+
+        tr:last-child td {{
+            border-bottom: none;
+        }}
+
+        ul {{
+            margin-top: 8px;
+            margin-bottom: 15px;
+            padding-left: 25px;
+        }}
+
+        li {{
+            margin-bottom: 6px;
+            color: #e5e7eb;
+        }}
+
+        .info {{
+            padding: 8px 10px;
+            font: 14px/16px 'Roboto', sans-serif;
+            background: #283548;
+            color: #f3f4f6;
+            box-shadow: 0 0 15px rgba(0,0,0,0.2);
+            border-radius: 8px;
+            border: 1px solid #374151;
+            min-width: 200px;
+            width: auto;
+        }}
+
+        .info h4 {{
+            margin: 0 0 8px;
+            color: #9ca3af;
+            font-weight: 500;
+        }}
+
+        .legend {{
+            line-height: 20px;
+            color: #e5e7eb;
+        }}
+
+        .legend i {{
+            width: 18px;
+            height: 18px;
+            float: left;
+            margin-right: 8px;
+            opacity: 0.85;
+        }}
+
+        /* Interactive legend styles */
+        .legend {{
+            min-width: 220px;
+            max-width: 280px;
+            width: auto;
+        }}
+        
+        .legend h4 {{
+            white-space: nowrap;
+            overflow: visible;
+            text-overflow: unset;
+            width: 100%;
+            margin: 0 0 8px 0;
+            padding: 0;
+            font-size: 14px;
+        }}
+        
+        .legend-item {{
+            display: flex;
+            align-items: center;
+            cursor: pointer;
+            padding: 2px 0;
+            border-radius: 4px;
+            transition: background-color 0.2s;
+        }}
+
+        .legend-item:hover {{
+            background-color: rgba(55, 65, 81, 0.5);
+        }}
+
+        .legend-item.active {{
+            background-color: rgba(96, 165, 250, 0.3);
+            border: 1px solid #60a5fa;
+        }}
+
+        .legend-color {{
+            width: 18px;
+            height: 18px;
+            margin-right: 8px;
+            border: 1px solid #374151;
+            flex-shrink: 0;
+        }}
+
+        .legend-text {{
+            flex: 1;
+        }}
+
+        .legend-reset {{
+            background: #374151;
+            color: #f3f4f6;
+            border: none;
+            padding: 6px 12px;
+            border-radius: 4px;
+            cursor: pointer;
+            font-size: 12px;
+            margin-top: 8px;
+            transition: background-color 0.2s;
+        }}
+
+        .legend-reset:hover {{
+            background: #4b5563;
+        }}
+
+        /* District filter styles - exactly matching legend styles */
+        .district-filter {{
+            line-height: 20px;
+            color: #e5e7eb;
+            width: 320px; /* Match legend width exactly */
+        }}
+
+        .district-filter-item {{
+            display: flex;
+            align-items: center;
+            cursor: pointer;
+            padding: 2px 0;
+            border-radius: 4px;
+            transition: background-color 0.2s;
+        }}
+
+        .district-filter-item:hover {{
+            background-color: rgba(55, 65, 81, 0.5);
+        }}
+
+        .district-filter-item.active {{
+            background-color: rgba(96, 165, 250, 0.3);
+            border: 1px solid #60a5fa;
+        }}
+
+        .district-filter-color {{
+            width: 18px;
+            height: 18px;
+            margin-right: 8px;
+            border: 1px solid #374151;
+            flex-shrink: 0;
+            background: #6b7280; /* Gray color for districts */
+        }}
+
+        .district-filter-text {{
+            flex: 1;
+        }}
+
+        .district-filter-reset {{
+            background: #374151;
+            color: #f3f4f6;
+            border: none;
+            padding: 6px 12px;
+            border-radius: 4px;
+            cursor: pointer;
+            font-size: 12px;
+            margin-top: 8px;
+            transition: background-color 0.2s;
+        }}
+
+        .district-filter-reset:hover {{
+            background: #4b5563;
+        }}
+
+        /* Domain weight sliders */
+        .domain-weights {{
+            line-height: 20px;
+            color: #e5e7eb;
+            width: 260px;
+        }}
+
+        .domain-weight {{
+            display: flex;
+            align-items: center;
+            padding: 2px 0;
+            font-size: 12px;
+        }}
+
+        .domain-weight-name {{
+            flex: 1;
+        }}
+
+        .domain-weight input {{
+            width: 90px;
+            margin: 0 8px;
+        }}
+
+        .domain-weight-value {{
+            width: 24px;
+            text-align: right;
+        }}
+
+        .domain-weights-status {{
+            margin-top: 6px;
+            font-size: 11px;
+            color: #9ca3af;
+        }}
+
+        .place-label {{
+            background-color: transparent;
+            border: none;
+            white-space: nowrap;
+        }}
+
+        .subtitle {{
+            text-align: center;
+            font-size: 14px;
+            margin-bottom: 20px;
+            color: #9ca3af;
+            font-weight: 300;
+        }}
+
+        .panel-header {{
+            text-align: center;
+            margin-bottom: 25px;
+        }}
+
+        .district-note {{
+            background-color: #283548;
+            border: 1px solid #374151;
+            border-radius: 8px;
+            padding: 12px;
+            margin-top: 15px;
+            font-size: 12px;
+            line-height: 1.4;
+        }}
+
+        .district-note p {{
+            margin: 0;
+            color: #e5e7eb;
+        }}
+
+        .district-note strong {{
+            color: #f3f4f6;
+            font-weight: 500;
+        }}
+
+        .panel-content {{
+            flex: 1;
+        }}
+
+        .info-box {{
+            background-color: #283548;
+            border: 1px solid #374151;
+            border-radius: 8px;
+            padding: 15px;
+            margin-bottom: 20px;
+            box-shadow: 0 2px 5px rgba(0,0,0,0.1);
+        }}
+
+        .info-box p {{
+            margin-bottom: 8px;
+            color: #e5e7eb;
+        }}
+
+        .info-box p:last-child {{
+            margin-bottom: 0;
+        }}
+
+        .info-box strong {{
+            color: #f3f4f6;
+            font-weight: 500;
+        }}
+
+        .domain-section {{
+            background-color: #283548;
+            border-radius: 8px;
+            padding: 12px;
+            margin-bottom: 12px;
+        }}
+
+        .domain-section strong {{
+            color: #f3f4f6;
+            font-weight: 500;
+        }}
+
+        .welcome-message {{
+            padding: 30px;
+            text-align: center;
+            font-size: 16px;
+            color: #9ca3af;
+            height: 100%;
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            font-weight: 300;
+        }}
+
+        .close-button {{
+            position: absolute;
+            top: 15px;
+            right: 15px;
+            border: none;
+            background: none;
+            font-size: 20px;
+            font-weight: 300;
+            color: #9ca3af;
+            cursor: pointer;
+            transition: color 0.2s;
+        }}
+
+        .close-button:hover {{
+            color: #f3f4f6;
+        }}
+
+        .opportunity-value {{
+            display: flex;
+            align-items: center;
+            margin: 15px 0;
+        }}
+
+        .opportunity-value-number {{
+            font-size: 24px;
+            font-weight: 700;
+            margin-right: 10px;
+            color: #f3f4f6;
+        }}
+
+        .opportunity-value-label {{
+            font-size: 14px;
+            color: #9ca3af;
+        }}
+
+        .opportunity-tier {{
+            display: inline-block;
+            padding: 3px 10px;
+            border-radius: 12px;
+            font-size: 14px;
+            font-weight: 500;
+            margin-top: 5px;
+            margin-bottom: 10px;
+        }}
+
+        .tier-less {{
+            background-color: rgba(220, 38, 38, 0.2);
+            color: #ef4444;
+        }}
+
+        .tier-moderate {{
+            background-color: rgba(245, 158, 11, 0.2);
+            color: #f59e0b;
+        }}
+
+        .tier-high {{
+            background-color: rgba(16, 185, 129, 0.2);
+            color: #10b981;
+        }}
+
+        .tier-exceptional {{
+            background-color: rgba(5, 150, 105, 0.2);
+            color: #059669;
+        }}
+
+        .rank-number {{
+            display: inline-block;
+            width: 24px;
+            height: 24px;
+            border-radius: 50%;
+            background-color: #374151;
+            color: #f3f4f6;
+            text-align: center;
+            line-height: 24px;
+            margin-right: 8px;
+            font-weight: 500;
+        }}
+
+        .geographic-info {{
+            background-color: #374151;
+            border-radius: 8px;
+            padding: 12px;
+            margin-bottom: 15px;
+        }}
+
+        .geographic-info .geo-item {{
+            display: flex;
+            justify-content: space-between;
+            margin-bottom: 6px;
+            padding: 2px 0;
+        }}
+
+        .geographic-info .geo-item:last-child {{
+            margin-bottom: 0;
+        }}
+
+        .geographic-info .geo-label {{
+            font-weight: 500;
+            color: #9ca3af;
+            min-width: 120px;
+        }}
+
+        .geographic-info .geo-value {{
+            color: #f3f4f6;
+            text-align: right;
+            flex: 1;
+        }}
+
+        .leaflet-container {{
+            background-color: #111827;
+        }}
+
+        .leaflet-control-zoom a {{
+            background-color: #283548;
+            color: #f3f4f6;
+            border-color: #374151;
+        }}
+
+        .leaflet-control-zoom a:hover {{
+            background-color: #374151;
+        }}
+
+        .leaflet-control-attribution {{
+            background-color: rgba(40, 53, 72, 0.8) !important;
+            color: #9ca3af !important;
+        }}
+
+        .leaflet-control-attribution a {{
+            color: #60a5fa !important;
+        }}
+
+        .district-label {{
+            font-weight: bold;
+            font-size: 18px; /* Increased from 15px */
+            background-color: rgba(40, 53, 72, 0.85);
+            border: 1px solid #4b5563;
+            border-radius: 4px;
+            padding: 6px 10px; /* Increased padding */
+            box-shadow: 0 2px 4px rgba(0,0,0,0.3);
+        }}
+
+        .tab-container {{
+            margin-top: 20px;
+            background-color: #283548;
+            border-radius: 8px;
+            overflow: hidden;
+        }}
+
+        .tab-header {{
+            display: flex;
+            flex-wrap: wrap;
+            background-color: #1f2937;
+            border-bottom: 1px solid #374151;
+        }}
+
+        .tab-button {{
+            flex: 1;
+            min-width: 85px;
+            padding: 8px 6px;
+            border: none;
+            background: none;
+            color: #9ca3af;
+            cursor: pointer;
+            font-size: 10px;
+            font-weight: 500;
+            transition: all 0.2s;
+            border-bottom: 2px solid transparent;
+        }}
+
+        .tab-button:hover {{
+            color: #f3f4f6;
+            background-color: rgba(55, 65, 81, 0.3);
+        }}
+
+        .tab-button.active {{
+            color: #f3f4f6;
+            border-bottom-color: #60a5fa;
+            background-color: rgba(55, 65, 81, 0.5);
+        }}
+
+        .tab-content {{
+            display: none;
+            padding: 15px;
+            max-height: 300px;
+            overflow-y: auto;
+        }}
+
+        .tab-content.active {{
+            display: block;
+        }}
+
+        .variable-item {{
+            display: flex;
+            justify-content: space-between;
+            align-items: center;
+            padding: 8px 0;
+            border-bottom: 1px solid #374151;
+        }}
+
+        .variable-item:last-child {{
+            border-bottom: none;
+        }}
+
+        .variable-name {{
+            font-size: 13px;
+            color: #e5e7eb;
+            flex: 1;
+            margin-right: 10px;
+        }}
+
+        .variable-value {{
+            display: flex;
+            align-items: center;
+            gap: 6px;
+            flex-wrap: wrap;
+        }}
+
+        .value {{
+            font-weight: 600;
+            color: #f3f4f6;
+            min-width: 50px;
+            text-align: right;
+        }}
+
+        .risk-direction {{
+            display: flex;
+            align-items: center;
+            gap: 4px;
+        }}
+
+        .risk-arrow {{
+            font-size: 12px;
+            font-weight: bold;
+        }}
+
+        .above-average {{
+            color: #10b981;
+        }}
+
+        .below-average {{
+            color: #9ca3af;
+        }}
+
+        .near-average {{
+            color: #9ca3af;
+        }}
+
+        .risk-text {{
+            font-size: 9px;
+            font-weight: 500;
+        }}
+
+        .demographic-value {{
+            display: flex;
+            align-items: center;
+            gap: 6px;
+            flex-wrap: wrap;
+        }}
+
+        .demographic-item {{
+            display: flex;
+            justify-content: space-between;
+            align-items: center;
+            padding: 8px 0;
+            border-bottom: 1px solid #374151;
+        }}
+
+        .demographic-item:last-child {{
+            border-bottom: none;
+        }}
+    </style>
+</head>
+<body>
+    <div id="map"></div>
+    <div id="panel">
+        <button class="close-button" onclick="document.getElementById('panel').classList.add('hidden')">X</button>
+        <div class="panel-header">
+            <h1>PWC Community Opportunity Index</h1>
+            <div class="subtitle">{geography_label} Details</div>
+            <div class="district-note">
+                <p><strong>District Categorization:</strong> Census tracts are assigned to districts based on the proportion of area within each district. The primary district is the one with the highest proportion. Tracts marked with * span multiple districts and show the detailed percentage breakdown below.</p>
+            </div>
+        </div>
+        <div class="panel-content" id="panel-content">
+            <div class="welcome-message">
+                Click on a {geography_noun} to view detailed information
+            </div>
+        </div>
+    </div>
+
+    <script>
+        // 'svg' draws one DOM path per tract; 'canvas' draws all tracts on one canvas
+        var tractRenderer = '{renderer}';
+
+        // Vector tile source ({{url, layer, minZoom, maxZoom, bounds}}) when the
+        // outlines are drawn from tiles fetched for the view, else null
+        var tractTiles = {tiles_json};
+
+        var map = L.map('map', {{
+            center: [{center_lat}, {center_lon}],
+            zoom: 10,
+            zoomControl: false,
+            preferCanvas: tractRenderer === 'canvas'
+        }});
+
+        L.tileLayer('https://cartodb-basemaps-{{s}}.global.ssl.fastly.net/dark_all/{{z}}/{{x}}/{{y}}{{r}}.png', {{
+            attribution: '&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> &copy; <a href="https://carto.com/attributions">CARTO</a>',
+            subdomains: 'abcd',
+            maxZoom: 19
+        }}).addTo(map);
+
+        L.control.zoom({{position: 'topright'}}).addTo(map);
+
+        // Extent of the rows when they span several counties
+        var fitBounds = {fit_bounds_json};
+        if (fitBounds) map.fitBounds(fitBounds);
+
+        var selectedLayer = null;
+        var selectedStyle = {{
+            weight: 4,
+            color: '#60a5fa',
+            dashArray: '',
+            fillOpacity: 0.9
+        }};
+        var domainCategories = {domain_categories_json};
+        var variableNameMap = {variable_name_map_json};
+        var activeFilters = []; // Track multiple selected score ranges
+        var activeDistrictFilters = []; // Track multiple selected districts
+        var currentActiveTab = 'socioeconomic'; // Track the currently active tab
+
+        // Arrow and label of each direction flag (nsi_dash.display)
+        var opportunityDirections = {{
+            '1': {{ arrow: '↑', text: 'Above Average', class: 'above-average' }},
+            '-1': {{ arrow: '↓', text: 'Below Average', class: 'below-average' }},
+            '0': {{ arrow: '→', text: 'Average', class: 'near-average' }}
+        }};
+
+        function showTab(tabName) {{
+            var contents = document.querySelectorAll('.tab-content');
+            contents.forEach(function(content) {{
+                content.classList.remove('active');
+            }});
+
+            var buttons = document.querySelectorAll('.tab-button');
+            buttons.forEach(function(button) {{
+                button.classList.remove('active');
+            }});
+
+            document.getElementById(tabName + '-content').classList.add('active');
+            document.getElementById(tabName + '-button').classList.add('active');
+
+            // Update the current active tab variable
+            currentActiveTab = tabName;
+
+            renderTab(tabName);
+        }}
+
+        // Domain of each details tab
+        var domainTabs = {{
+            'socioeconomic': 'Socioeconomic',
+            'housing': 'Housing',
+            'mobility': 'Mobility',
+            'transportation-safety': 'Transportation Safety',
+            'environmental': 'Environmental',
+            'public-health': 'Public Health',
+            'demographics': 'Demographics'
+        }};
+
+        var panelOrdinal = null; // Tract shown in the details panel
+        var renderedTabs = {{}}; // Tabs of the current panel that have their variable list
+        var panelTabCache = {{}}; // Tract ordinal -> {{tab id: variable list HTML}}
+
+        // Fill a tab of the details panel the first time it is shown, from the
+        // tract's memoized HTML or its domain's table, loading that first if needed
+        function renderTab(tab) {{
+            if (panelOrdinal === null || renderedTabs[tab]) return;
+            renderedTabs[tab] = true;
+            var ordinal = panelOrdinal;
+            var cache = panelTabCache[ordinal] = panelTabCache[ordinal] || {{}};
+            var content = document.getElementById(tab + '-content');
+            if (tab in cache) {{
+                content.innerHTML = cache[tab];
+                return;
+            }}
+            if (tab in domainTables || !(tab in domainDataUrls)) {{
+                cache[tab] = createVariableList(ordinal, domainTabs[tab], domainTables[tab] || null);
+                content.innerHTML = cache[tab];
+                return;
+            }}
+            content.innerHTML = '<div class="variable-item"><div class="variable-name">Loading...</div></div>';
+            loadDomainTable(tab).then(function(table) {{
+                cache[tab] = createVariableList(ordinal, domainTabs[tab], table);
+                if (panelOrdinal === ordinal) document.getElementById(tab + '-content').innerHTML = cache[tab];
+            }}).catch(function(error) {{
+                console.error('Could not load the ' + domainTabs[tab] + ' data', error);
+                if (panelOrdinal !== ordinal) return;
+                renderedTabs[tab] = false;
+                document.getElementById(tab + '-content').innerHTML =
+                    '<div class="variable-item"><div class="variable-name">Data could not be loaded</div></div>';
+            }});
+        }}
+
+        // YlGnBu color scheme: Light Yellow to Dark Blue
+        function getColor(d) {{
+            return d > 7 ? '#08519c' :   // Darkest blue
+                   d > 6 ? '#3182bd' :   // Dark blue
+                   d > 5 ? '#6baed6' :   // Medium blue
+                   d > 4 ? '#9ecae1' :   // Light blue
+                   d > 3 ? '#c7e9b4' :   // Light green
+                   d > 2 ? '#edf8b1' :   // Yellow-green
+                   d > 1 ? '#ffffcc' :   // Light yellow
+                            '#ffffe5';   // Lightest yellow
+        }}
+
+        // Per-tract filter state, indexed by tract ordinal (feature id) and
+        // filled in by indexTractFilters once the tract data has loaded
+        var tractBuckets = new Int8Array(0); // Math.floor(score), -1 outside the legend's range
+        var districtBits = {{}}; // District name -> bit in the district masks
+        var districtWords = 1; // 32-bit words per district mask
+        var tractDistrictMasks = new Uint32Array(0);
+        var tractVisible = new Uint8Array(0); // 1 unless dimmed by the active filters
+
+        // Bitmasks of the active score and district filters
+        var activeScoreMask = 0;
+        var activeDistrictMask = new Uint32Array(1);
+
+        function indexTractFilters(features) {{
+            var n = features.length;
+            districtBits = {{}};
+            var districtCount = 0;
+            features.forEach(function(feature) {{
+                (tractDataLookup[feature.properties.CensusTract].districts || []).forEach(function(district) {{
+                    if (!(district in districtBits)) districtBits[district] = districtCount++;
+                }});
+            }});
+            districtWords = Math.max(1, Math.ceil(districtCount / 32));
+
+            tractBuckets = new Int8Array(n);
+            tractDistrictMasks = new Uint32Array(n * districtWords);
+            tractVisible = new Uint8Array(n);
+            features.forEach(function(feature) {{
+                var i = Number(feature.id);
+                var tractData = tractDataLookup[feature.properties.CensusTract];
+                tractBuckets[i] = scoreBucket(tractField(tractData, i, 'opportunity_index'));
+                (tractData.districts || []).forEach(function(district) {{
+                    var bit = districtBits[district];
+                    tractDistrictMasks[i * districtWords + (bit >> 5)] |= 1 << (bit & 31);
+                }});
+            }});
+            updateActiveMasks();
+            for (var i = 0; i < n; i++) tractVisible[i] = isTractVisible(i) ? 1 : 0;
+        }}
+
+        // Legend bucket of an index value, -1 outside the legend's range
+        function scoreBucket(score) {{
+            var bucket = Math.floor(score);
+            return bucket >= 0 && bucket < 31 ? bucket : -1;
+        }}
+
+        function updateActiveMasks() {{
+            activeScoreMask = 0;
+            activeFilters.forEach(function(filter) {{
+                if (filter.value >= 0 && filter.value < 31) activeScoreMask |= 1 << filter.value;
+            }});
+            activeDistrictMask = new Uint32Array(districtWords);
+            activeDistrictFilters.forEach(function(filter) {{
+                var bit = districtBits[filter.value];
+                if (bit !== undefined) activeDistrictMask[bit >> 5] |= 1 << (bit & 31);
+            }});
+        }}
+
+        // A tract is shown if it matches any selected score and any selected district
+        function isTractVisible(i) {{
+            if (activeFilters.length > 0) {{
+                var bucket = tractBuckets[i];
+                if (bucket < 0 || (activeScoreMask & (1 << bucket)) === 0) return false;
+            }}
+            if (activeDistrictFilters.length > 0) {{
+                for (var w = 0; w < districtWords; w++) {{
+                    if (tractDistrictMasks[i * districtWords + w] & activeDistrictMask[w]) return true;
+                }}
+                return false;
+            }}
+            return true;
+        }}
+
+        // Restyle only the tracts whose visibility changed with the filters
+        function applyFilters() {{
+            updateActiveMasks();
+            for (var i = 0; i < tractVisible.length; i++) {{
+                var visible = isTractVisible(i) ? 1 : 0;
+                if (visible === tractVisible[i]) continue;
+                tractVisible[i] = visible;
+                var layer = featureLayers[i];
+                if (!layer) continue;
+                layer.setStyle(style(layer.feature));
+                // Keep the selected tract highlighted
+                if (layer === selectedLayer) layer.setStyle(selectedStyle);
+            }}
+        }}
+
+        function style(feature) {{
+            var tractData = tractDataLookup[feature.properties.CensusTract];
+            var score = tractField(tractData, Number(feature.id), 'opportunity_index');
+
+            var baseStyle = {{
+                fillColor: getColor(score),
+                weight: 1.5,
+                opacity: 1,
+                color: '#1f2937',
+                fillOpacity: 0.85
+            }};
+
+            // Dim tracts that do not match the active score and district filters
+            if (!tractVisible[Number(feature.id)]) {{
+                baseStyle.fillOpacity = 0.1;
+                baseStyle.opacity = 0.3;
+            }}
+
+            return baseStyle;
+        }}
+
+        function highlightFeature(e) {{
+            var layer = e.target;
+            layer.setStyle({{
+                weight: 3,
+                color: '#f3f4f6',
+                dashArray: '',
+                fillOpacity: 0.9
+            }});
+            if (!L.Browser.ie && !L.Browser.opera && !L.Browser.edge) {{
+                layer.bringToFront();
+            }}
+            info.update(layer.feature.properties, Number(layer.feature.id));
+        }}
+
+        function resetHighlight(e) {{
+            if (selectedLayer !== e.target) {{
+                geojson.resetStyle(e.target);
+            }}
+            info.update();
+        }}
+
+        function getTierClass(tier) {{
+            if (tier.includes('Less')) return 'tier-less';
+            if (tier.includes('Moderate')) return 'tier-moderate';
+            if (tier.includes('High') && !tier.includes('Exceptional')) return 'tier-high';
+            if (tier.includes('Exceptional')) return 'tier-exceptional';
+            return '';
+        }}
+
+        // Function to toggle filter selection for score value
+        function toggleScoreFilter(scoreValue, legendItem) {{
+            // Check if this filter is already active
+            var filterIndex = activeFilters.findIndex(function(filter) {{
+                return filter.value === scoreValue;
+            }});
+
+            if (filterIndex !== -1) {{
+                // Filter is active, remove it
+                activeFilters.splice(filterIndex, 1);
+                legendItem.classList.remove('active');
+            }} else {{
+                // Filter is not active, add it
+                activeFilters.push({{ value: scoreValue }});
+                legendItem.classList.add('active');
+            }}
+
+            // Restyle the tracts that changed visibility
+            applyFilters();
+
+            // Update district label visibility
+            updateDistrictLabels();
+        }}
+
+        // Function to toggle filter selection for district
+        function toggleDistrictFilter(districtValue, filterItem) {{
+            // Check if this filter is already active
+            var filterIndex = activeDistrictFilters.findIndex(function(filter) {{
+                return filter.value === districtValue;
+            }});
+
+            if (filterIndex !== -1) {{
+                // Filter is active, remove it
+                activeDistrictFilters.splice(filterIndex, 1);
+                filterItem.classList.remove('active');
+            }} else {{
+                // Filter is not active, add it
+                activeDistrictFilters.push({{ value: districtValue }});
+                filterItem.classList.add('active');
+            }}
+
+            // Restyle the tracts that changed visibility
+            applyFilters();
+
+            // Update district label visibility
+            updateDistrictLabels();
+        }}
+
+        // Function to update district label visibility based on active filters
+        function updateDistrictLabels() {{
+            var districtLabels = document.querySelectorAll('.district-label');
+            districtLabels.forEach(function(label) {{
+                var districtName = label.textContent;
+
+                // Show label only if its district is selected (or no district filters active)
+                if (activeDistrictFilters.length === 0) {{
+                    // No district filters active, show all labels
+                    label.style.display = 'block';
+                }} else {{
+                    // Check if this district is in active filters
+                    var isActive = activeDistrictFilters.some(function(filter) {{
+                        return filter.value.toUpperCase() === districtName.toUpperCase();
+                    }});
+
+                    label.style.display = isActive ? 'block' : 'none';
+                }}
+            }});
+        }}
+
+        // Function to reset all filters
+        function resetAllFilters() {{
+            activeFilters = [];
+            activeDistrictFilters = [];
+            document.querySelectorAll('.legend-item').forEach(function(item) {{
+                item.classList.remove('active');
+            }});
+            document.querySelectorAll('.district-filter-item').forEach(function(item) {{
+                item.classList.remove('active');
+            }});
+            applyFilters();
+            updateDistrictLabels();
+        }}
+
+        // Function to reset district filters only
+        function resetDistrictFilters() {{
+            activeDistrictFilters = [];
+            document.querySelectorAll('.district-filter-item').forEach(function(item) {{
+                item.classList.remove('active');
+            }});
+            applyFilters();
+            updateDistrictLabels();
+        }}
+
+        // Variable list of a domain for a tract, from the domain's display table
+        function createVariableList(ordinal, domain, table) {{
+            var html = '';
+            var variables = domainCategories[domain];
+
+            if (variables && variables.length > 0) {{
+                variables.forEach(function(variable) {{
+                    var displayName = variableNameMap[variable] || variable;
+                    var displayValue = variableDisplay(table, variable, ordinal);
+
+                    if (domain === 'Demographics') {{
+                        html += `
+                            <div class="demographic-item">
+                                <div class="variable-name">${{displayName}}</div>
+                                <div class="demographic-value">
+                                    <span class="value">${{displayValue}}</span>
+                                </div>
+                            </div>`;
+                    }} else {{
+                        var opportunityDir = opportunityDirections[variableDirection(table, variable, ordinal)];
+
+                        html += `
+                            <div class="variable-item">
+                                <div class="variable-name">${{displayName}}</div>
+                                <div class="variable-value">
+                                    <span class="value">${{displayValue}}</span>
+                                    <div class="risk-direction">
+                                        <span class="risk-arrow ${{opportunityDir.class}}">${{opportunityDir.arrow}}</span>
+                                        <span class="risk-text ${{opportunityDir.class}}">${{opportunityDir.text}}</span>
+                                    </div>
+                                </div>
+                            </div>`;
+                    }}
+                }});
+            }} else {{
+                html = '<div class="variable-item"><div class="variable-name">No variables available for this domain</div></div>';
+            }}
+
+            return html;
+        }}
+
+        function clickFeature(e) {{
+            if (selectedLayer) {{
+                geojson.resetStyle(selectedLayer);
+            }}
+
+            selectedLayer = e.target;
+            selectedLayer.setStyle(selectedStyle);
+
+            if (!L.Browser.ie && !L.Browser.opera && !L.Browser.edge) {{
+                selectedLayer.bringToFront();
+            }}
+
+            showPanel(e.target.feature.id);
+
+            // Pan to center on the clicked tract (but keep current zoom level)
+            var center = e.target.getBounds().getCenter();
+            map.panTo(center, {{
+                animate: true,
+                duration: 0.8
+            }});
+        }}
+
+        // Fill the details panel for a tract ordinal
+        function showPanel(ordinal) {{
+            var tractId = featureLayers[ordinal].feature.properties.CensusTract;
+            var tractData = tractDataLookup[tractId];
+            var score = tractField(tractData, ordinal, 'opportunity_index');
+
+            document.getElementById('panel').classList.remove('hidden');
+            var panelContent = document.getElementById('panel-content');
+
+            var html = `
+                <div class="info-box">
+                    <h2>{geography_label}: ${{tractData.display_tract_id}}</h2>
+                    <div class="opportunity-value">
+                        <div class="opportunity-value-number">${{isNaN(score) ? 'N/A' : score.toFixed(1)}}</div>
+                        <div class="opportunity-value-label">Service Opportunity Score<br/>(1-8 scale, higher = more opportunity)</div>
+                    </div>
+                    <div class="opportunity-tier ${{getTierClass(tractField(tractData, ordinal, 'opportunity_tier'))}}">${{tractField(tractData, ordinal, 'opportunity_tier')}}</div>
+                    <p><strong>Primary Contributing Factor:</strong> ${{tractField(tractData, ordinal, 'top_domain')}}</p>
+                </div>
+
+                <div class="geographic-info">
+                    <div class="geo-item">
+                        <span class="geo-label">{geography_label}:</span>
+                        <span class="geo-value">${{tractId}}</span>
+                    </div>
+                    <div class="geo-item">
+                        <span class="geo-label">${{tractData.is_multi_district ? 'Primary District:' : 'District:'}}</span>
+                        <span class="geo-value">${{tractField(tractData, ordinal, 'primary_district')}}</span>
+                    </div>`;
+            
+            // Add detailed district breakdown only if tract spans multiple districts
+            if (tractData.is_multi_district && tractData.districts && tractData.districts.length > 1) {{
+                html += `
+                    <div class="geo-item">
+                        <span class="geo-label">District Breakdown:</span>
+                        <span class="geo-value">`;
+                
+                tractData.districts.forEach(function(district, index) {{
+                    var proportion = tractData.proportions[district];
+                    if (index > 0) html += '<br/>';
+                    html += `${{district}}: ${{proportion.toFixed(2)}}%`;
+                }});
+                
+                html += `</span>
+                    </div>`;
+            }}
+            
+            html += `
+                    <div class="geo-item">
+                        <span class="geo-label">Neighborhood:</span>
+                        <span class="geo-value">${{tractField(tractData, ordinal, 'neighborhood')}}</span>
+                    </div>
+                    <div class="geo-item">
+                        <span class="geo-label">Primary Fire Station:</span>
+                        <span class="geo-value">${{tractField(tractData, ordinal, 'first_due')}}</span>
+                    </div>
+                </div>
+
+                <h3>Impact on Opportunity Score (by Category)</h3>
+                <table>`;
+
+            // Create static ranking display (Option A: 1,2,3 | 4,5,6)
+            var domainsByRank = [];
+            var domainRanks = tractField(tractData, ordinal, 'domain_ranks');
+            var domains = Object.keys(domainRanks);
+
+            // Sort domains by their ranking
+            domains.forEach(function(domain) {{
+                var rank = domainRanks[domain];
+                domainsByRank[rank - 1] = domain; // rank 1 goes to index 0
+            }});
+
+            // Fill empty slots with placeholders
+            for (var i = 0; i < 6; i++) {{
+                if (!domainsByRank[i]) {{
+                    domainsByRank[i] = "N/A";
+                }}
+            }}
+
+            // Create the static 3x2 table layout
+            for (var i = 0; i < 3; i++) {{
+                html += '<tr>';
+                // Left column: ranks 1, 2, 3
+                var leftRank = i + 1;
+                var leftDomain = domainsByRank[i];
+                html += `<td><span class="rank-number">${{leftRank}}</span> ${{leftDomain}}</td>`;
+
+                // Right column: ranks 4, 5, 6
+                var rightRank = i + 4;
+                var rightDomain = domainsByRank[i + 3];
+                html += `<td><span class="rank-number">${{rightRank}}</span> ${{rightDomain}}</td>`;
+                html += '</tr>';
+            }}
+
+            html += `</table>
+                    <h3>Strongest Opportunity Indicators</h3>`;
+
+            var domainVars = Object.keys(tractData.domain_variables);
+            for (var j = 0; j < domainVars.length; j++) {{
+                var domain = domainVars[j];
+                var variables = tractData.domain_variables[domain];
+                html += `
+                    <div class="domain-section">
+                        <strong>${{domain}}:</strong>
+                        <ul>`;
+                for (var k = 0; k < variables.length; k++) {{
+                    html += `<li>${{variables[k]}}</li>`;
+                }}
+                html += `</ul></div>`;
+            }}
+
+            html += `
+                <h3>All Domain Variables</h3>
+                <div class="tab-container">
+                    <div class="tab-header">
+                        <button id="socioeconomic-button" class="tab-button" onclick="showTab('socioeconomic')">Socioeconomic</button>
+                        <button id="housing-button" class="tab-button" onclick="showTab('housing')">Housing</button>
+                        <button id="mobility-button" class="tab-button" onclick="showTab('mobility')">Mobility</button>
+                        <button id="transportation-safety-button" class="tab-button" onclick="showTab('transportation-safety')">Transportation Safety</button>
+                        <button id="environmental-button" class="tab-button" onclick="showTab('environmental')">Environmental</button>
+                        <button id="public-health-button" class="tab-button" onclick="showTab('public-health')">Public Health</button>
+                        <button id="demographics-button" class="tab-button" onclick="showTab('demographics')">Demographics</button>
+                    </div>
+
+                    <div id="socioeconomic-content" class="tab-content"></div>
+                    <div id="housing-content" class="tab-content"></div>
+                    <div id="mobility-content" class="tab-content"></div>
+                    <div id="transportation-safety-content" class="tab-content"></div>
+                    <div id="environmental-content" class="tab-content"></div>
+                    <div id="public-health-content" class="tab-content"></div>
+                    <div id="demographics-content" class="tab-content"></div>
+                </div>`;
+
+            panelContent.innerHTML = html;
+            panelOrdinal = ordinal;
+            renderedTabs = {{}};
+
+            // Show the previously selected tab instead of defaulting to socioeconomic
+            showTab(currentActiveTab);
+        }}
+
+        var featureLayers = []; // Tract layers in feature (tract ordinal) order
+
+        // Tracts are not interactive; the map's own handlers below find the tract
+        // under the pointer in the spatial index
+        function onEachFeature(feature, layer) {{
+            featureLayers.push(layer);
+        }}
+
+        // Packed Hilbert R-tree over flat [west, south, east, north, ...] boxes, like
+        // Flatbush: items sorted along a Hilbert curve of their centers, then packed
+        // bottom-up into nodes of nodeSize children, all in two typed arrays
+        function PackedRTree(boxes, nodeSize) {{
+            var n = boxes.length / 4;
+            this.numItems = n;
+            this.nodeSize = nodeSize = nodeSize || 16;
+            this._levelBounds = [n * 4];
+            var count = n, numNodes = n;
+            while (count > 1) {{
+                count = Math.ceil(count / nodeSize);
+                numNodes += count;
+                this._levelBounds.push(numNodes * 4);
+            }}
+            this._boxes = new Float64Array(numNodes * 4);
+            this._indices = new Uint32Array(numNodes);
+            if (n === 0) return;
+
+            var west = Infinity, south = Infinity, east = -Infinity, north = -Infinity;
+            for (var i = 0; i < n; i++) {{
+                west = Math.min(west, boxes[4 * i]);
+                south = Math.min(south, boxes[4 * i + 1]);
+                east = Math.max(east, boxes[4 * i + 2]);
+                north = Math.max(north, boxes[4 * i + 3]);
+            }}
+            var width = (east - west) || 1, height = (north - south) || 1;
+            var hilbertValues = new Float64Array(n);
+            var order = new Uint32Array(n);
+            for (var i = 0; i < n; i++) {{
+                order[i] = i;
+                hilbertValues[i] = hilbertIndex(
+                    Math.floor(65535 * ((boxes[4 * i] + boxes[4 * i + 2]) / 2 - west) / width),
+                    Math.floor(65535 * ((boxes[4 * i + 1] + boxes[4 * i + 3]) / 2 - south) / height)
+                );
+            }}
+            order.sort(function(a, b) {{ return hilbertValues[a] - hilbertValues[b]; }});
+            for (var k = 0; k < n; k++) {{
+                this._boxes.set(boxes.slice(4 * order[k], 4 * order[k] + 4), 4 * k);
+                this._indices[k] = order[k];
+            }}
+
+            // Each parent's box covers its children; its index is the position of its first child
+            var pos = 0, parent = n * 4;
+            for (var level = 0; level < this._levelBounds.length - 1; level++) {{
+                var levelEnd = this._levelBounds[level];
+                while (pos < levelEnd) {{
+                    var nodeWest = Infinity, nodeSouth = Infinity, nodeEast = -Infinity, nodeNorth = -Infinity;
+                    this._indices[parent >> 2] = pos;
+                    for (var child = 0; child < nodeSize && pos < levelEnd; child++, pos += 4) {{
+                        nodeWest = Math.min(nodeWest, this._boxes[pos]);
+                        nodeSouth = Math.min(nodeSouth, this._boxes[pos + 1]);
+                        nodeEast = Math.max(nodeEast, this._boxes[pos + 2]);
+                        nodeNorth = Math.max(nodeNorth, this._boxes[pos + 3]);
+                    }}
+                    this._boxes[parent] = nodeWest;
+                    this._boxes[parent + 1] = nodeSouth;
+                    this._boxes[parent + 2] = nodeEast;
+                    this._boxes[parent + 3] = nodeNorth;
+                    parent += 4;
+                }}
+            }}
+        }}
+
+        // Items whose box intersects the query box, in no particular order
+        PackedRTree.prototype.search = function(west, south, east, north) {{
+            var results = [];
+            if (this.numItems === 0) return results;
+            var boxes = this._boxes, levelBounds = this._levelBounds;
+            var queue = [];
+            var nodeIndex = boxes.length - 4;
+            while (nodeIndex !== undefined) {{
+                // Children of a node end at its nodeSize-th child or at the end of their level
+                var levelEnd = levelBounds[0];
+                for (var l = 0; levelBounds[l] <= nodeIndex; l++) levelEnd = levelBounds[l + 1];
+                var end = Math.min(nodeIndex + this.nodeSize * 4, levelEnd);
+                for (var pos = nodeIndex; pos < end; pos += 4) {{
+                    if (east < boxes[pos] || north < boxes[pos + 1] || west > boxes[pos + 2] || south > boxes[pos + 3]) continue;
+                    if (nodeIndex >= this.numItems * 4) queue.push(this._indices[pos >> 2]);
+                    else results.push(this._indices[pos >> 2]);
+                }}
+                nodeIndex = queue.pop();
+            }}
+            return results;
+        }};
+
+        // Position of a point of a 65536 x 65536 grid along the Hilbert curve
+        function hilbertIndex(x, y) {{
+            var d = 0;
+            for (var s = 32768; s > 0; s >>= 1) {{
+                var rx = (x & s) > 0 ? 1 : 0, ry = (y & s) > 0 ? 1 : 0;
+                d += s * s * ((3 * rx) ^ ry);
+                if (ry === 0) {{
+                    if (rx === 1) {{
+                        x = 65535 - x;
+                        y = 65535 - y;
+                    }}
+                    var t = x;
+                    x = y;
+                    y = t;
+                }}
+            }}
+            return d;
+        }}
+
+        // Spatial index over the tract bounds (tract_bounds), used to find the
+        // tract under the pointer and the tracts near the view
+        var tractIndex = null;
+
+        // Tracts whose bounds touch the view, padded by this fraction of its
+        // size, stay on the map; the rest are not projected or drawn
+        var CULL_PADDING = 0.5;
+        var tractShown = new Uint8Array(0);
+
+        function cullTracts() {{
+            if (tractTiles || !tractIndex) return;
+            var view = map.getBounds().pad(CULL_PADDING);
+            var visible = new Uint8Array(featureLayers.length);
+            tractIndex.search(view.getWest(), view.getSouth(), view.getEast(), view.getNorth())
+                .forEach(function(i) {{ visible[i] = 1; }});
+            featureLayers.forEach(function(layer, i) {{
+                if (visible[i] === tractShown[i]) return;
+                if (visible[i]) geojson.addLayer(layer);
+                else geojson.removeLayer(layer);
+            }});
+            tractShown = visible;
+        }}
+
+        map.on('moveend', cullTracts);
+
+        // Even-odd test over all rings of a (multi)polygon layer's current outline
+        function layerContains(layer, latlng) {{
+            var latlngs = layer.getLatLngs();
+            var polygons = latlngs.length && Array.isArray(latlngs[0][0]) ? latlngs : [latlngs];
+            return polygons.some(function(rings) {{
+                var inside = false;
+                rings.forEach(function(ring) {{
+                    for (var i = 0, j = ring.length - 1; i < ring.length; j = i++) {{
+                        var a = ring[i], b = ring[j];
+                        if ((a.lat > latlng.lat) !== (b.lat > latlng.lat) &&
+                            latlng.lng < (b.lng - a.lng) * (latlng.lat - a.lat) / (b.lat - a.lat) + a.lng) {{
+                            inside = !inside;
+                        }}
+                    }}
+                }});
+                return inside;
+            }});
+        }}
+
+        // The tract under a point: the index gives the tracts whose bounds hold
+        // it, a point-in-polygon test on their outlines picks the first one
+        function tractAt(latlng) {{
+            if (!tractIndex) return null;
+            var candidates = tractIndex.search(latlng.lng, latlng.lat, latlng.lng, latlng.lat);
+            if (tractTiles) return geojson.tractAt(latlng, candidates);
+            candidates.sort(function(a, b) {{ return a - b; }});
+            for (var k = 0; k < candidates.length; k++) {{
+                if (layerContains(featureLayers[candidates[k]], latlng)) return featureLayers[candidates[k]];
+            }}
+            return null;
+        }}
+
+        var hoveredLayer = null;
+
+        function hoverTract(layer) {{
+            if (layer === hoveredLayer) return;
+            if (hoveredLayer) resetHighlight({{target: hoveredLayer}});
+            hoveredLayer = layer;
+            if (layer) highlightFeature({{target: layer}});
+            map.getContainer().style.cursor = layer ? 'pointer' : '';
+        }}
+
+        map.on('mousemove', function(e) {{ hoverTract(tractAt(e.latlng)); }});
+        map.on('mouseout', function() {{ hoverTract(null); }});
+        map.on('click', function(e) {{
+            var layer = tractAt(e.latlng);
+            if (layer) clickFeature({{target: layer, latlng: e.latlng}});
+        }});
+
+        // Decode quantized, delta-encoded TopoJSON arcs to [lon, lat] positions
+        function decodeArcs(topology, arcs) {{
+            var scale = topology.transform.scale;
+            var translate = topology.transform.translate;
+            return arcs.map(function(arc) {{
+                var x = 0, y = 0;
+                return arc.map(function(position) {{
+                    x += position[0];
+                    y += position[1];
+                    return [x * scale[0] + translate[0], y * scale[1] + translate[1]];
+                }});
+            }});
+        }}
+
+        // Join a ring's arcs (~i is arc i reversed), dropping the repeated joint points
+        function stitchRing(refs, arcs) {{
+            var ring = [];
+            refs.forEach(function(ref, i) {{
+                var arc = ref >= 0 ? arcs[ref] : arcs[~ref].slice().reverse();
+                for (var j = i > 0 ? 1 : 0; j < arc.length; j++) ring.push(arc[j]);
+            }});
+            return ring;
+        }}
+
+        function topologyCoordinates(geometry, arcs) {{
+            var polygons = geometry.type === 'Polygon' ? [geometry.arcs] : geometry.arcs;
+            var coordinates = polygons.map(function(rings) {{
+                // Holes simplified away are dropped
+                return rings.map(function(refs) {{ return stitchRing(refs, arcs); }})
+                    .filter(function(ring, i) {{ return i === 0 || ring.length >= 4; }});
+            }});
+            return geometry.type === 'Polygon' ? coordinates[0] : coordinates;
+        }}
+
+        // GeoJSON FeatureCollection for a topology object using the given (undecoded) arcs
+        function topologyFeatures(topology, name, arcs) {{
+            var decoded = decodeArcs(topology, arcs);
+            return {{
+                type: 'FeatureCollection',
+                features: topology.objects[name].geometries.map(function(geometry) {{
+                    return {{
+                        type: 'Feature',
+                        id: geometry.id,
+                        properties: geometry.properties || {{}},
+                        geometry: {{type: geometry.type, coordinates: topologyCoordinates(geometry, decoded)}}
+                    }};
+                }})
+            }};
+        }}
+
+        // Minimal Mapbox Vector Tile reader: {{layer name: {{extent, features}}}} with
+        // each polygon feature as {{id, rings: [[x0, y0, x1, y1, ...], ...]}} in tile units
+        function decodeVectorTile(buffer) {{
+            var bytes = new Uint8Array(buffer);
+            var pos = 0;
+
+            function varint() {{
+                var value = 0, shift = 1, b;
+                do {{
+                    b = bytes[pos++];
+                    value += (b & 0x7f) * shift;
+                    shift *= 128;
+                }} while (b & 0x80);
+                return value;
+            }}
+
+            function zigzag(n) {{
+                return (n >>> 1) ^ -(n & 1);
+            }}
+
+            function skip(wireType) {{
+                if (wireType === 0) varint();
+                else if (wireType === 1) pos += 8;
+                else if (wireType === 5) pos += 4;
+                else {{
+                    var length = varint();
+                    pos += length;
+                }}
+            }}
+
+            // Call onField(field number, wire type) for each field up to end
+            function fields(end, onField) {{
+                while (pos < end) {{
+                    var tag = varint();
+                    onField(tag >> 3, tag & 7);
+                }}
+            }}
+
+            function readGeometry(end) {{
+                var rings = [], ring = null, x = 0, y = 0;
+                while (pos < end) {{
+                    var command = varint();
+                    var id = command & 7, count = command >> 3;
+                    if (id === 7) {{
+                        if (ring) rings.push(ring);
+                        ring = null;
+                        continue;
+                    }}
+                    for (var c = 0; c < count; c++) {{
+                        x += zigzag(varint());
+                        y += zigzag(varint());
+                        if (id === 1) ring = [x, y];
+                        else ring.push(x, y);
+                    }}
+                }}
+                return rings;
+            }}
+
+            function readFeature(end) {{
+                var feature = {{id: null, type: 0, rings: []}};
+                fields(end, function(field, wireType) {{
+                    if (field === 1) feature.id = varint();
+                    else if (field === 3) feature.type = varint();
+                    else if (field === 4) {{
+                        var length = varint();
+                        feature.rings = readGeometry(pos + length);
+                    }} else skip(wireType);
+                }});
+                return feature;
+            }}
+
+            var layers = {{}};
+            fields(bytes.length, function(field, wireType) {{
+                if (field !== 3) return skip(wireType);
+                var length = varint();
+                var layer = {{name: '', extent: 4096, features: []}};
+                fields(pos + length, function(field, wireType) {{
+                    var length;
+                    if (field === 1) {{
+                        length = varint();
+                        layer.name = new TextDecoder().decode(bytes.subarray(pos, pos + length));
+                        pos += length;
+                    }} else if (field === 2) {{
+                        length = varint();
+                        var feature = readFeature(pos + length);
+                        // Only polygons are drawn
+                        if (feature.type === 3) layer.features.push(feature);
+                    }} else if (field === 5) layer.extent = varint();
+                    else skip(wireType);
+                }});
+                layers[layer.name] = layer;
+            }});
+            return layers;
+        }}
+
+        // A tract drawn from vector tiles: the feature, style and bounds a Leaflet
+        // path would have, so the hover, click and filter code works on either
+        function TractHandle(feature, bounds) {{
+            this.feature = feature;
+            this.options = {{}};
+            this._bounds = bounds;
+        }}
+
+        TractHandle.prototype.setStyle = function(style) {{
+            L.extend(this.options, style);
+            geojson.redrawTract(this.feature.id);
+            return this;
+        }};
+
+        TractHandle.prototype.getBounds = function() {{
+            return this._bounds;
+        }};
+
+        TractHandle.prototype.bringToFront = function() {{
+            geojson.raiseTract(this.feature.id);
+            return this;
+        }};
+
+        // Canvas tiles drawn from the vector tiles in view, styled from featureLayers;
+        // restyled tracts redraw only the loaded tiles they appear in, once per frame
+        var TractTileLayer = L.GridLayer.extend({{
+            initialize: function(source) {{
+                L.GridLayer.prototype.initialize.call(this, {{
+                    minNativeZoom: source.minZoom,
+                    maxNativeZoom: source.maxZoom,
+                    bounds: L.latLngBounds(source.bounds)
+                }});
+                this._source = source;
+                this._loaded = {{}}; // Tile key -> {{canvas, scale, features, ids}}
+                this._dirty = {{}};
+                this._frame = null;
+                this._raised = null;
+                this.on('tileunload', function(e) {{
+                    delete this._loaded[this._tileCoordsToKey(e.coords)];
+                }}, this);
+            }},
+
+            createTile: function(coords, done) {{
+                var canvas = L.DomUtil.create('canvas', 'leaflet-tile');
+                var size = this.getTileSize();
+                canvas.width = size.x;
+                canvas.height = size.y;
+                var key = this._tileCoordsToKey(coords);
+                var self = this;
+                fetch(L.Util.template(this._source.url, coords)).then(function(response) {{
+                    // Tiles without any tract are not written
+                    if (response.status === 404) return null;
+                    if (!response.ok) throw new Error('tile ' + key + ': ' + response.status);
+                    return response.arrayBuffer();
+                }}).then(function(buffer) {{
+                    var layer = buffer ? decodeVectorTile(buffer)[self._source.layer] : null;
+                    var tile = {{
+                        canvas: canvas,
+                        scale: size.x / (layer ? layer.extent : 4096),
+                        features: layer ? layer.features : [],
+                        ids: {{}}
+                    }};
+                    tile.features.forEach(function(feature) {{ tile.ids[feature.id] = true; }});
+                    self._loaded[key] = tile;
+                    self._drawTile(tile);
+                    done(null, canvas);
+                }}).catch(function(error) {{
+                    done(error, canvas);
+                }});
+                return canvas;
+            }},
+
+            _drawTile: function(tile) {{
+                var context = tile.canvas.getContext('2d');
+                context.clearRect(0, 0, tile.canvas.width, tile.canvas.height);
+                var raised = null;
+                tile.features.forEach(function(feature) {{
+                    if (feature.id === this._raised) raised = feature;
+                    else this._drawFeature(context, feature, tile.scale);
+                }}, this);
+                if (raised) this._drawFeature(context, raised, tile.scale);
+            }},
+
+            _drawFeature: function(context, feature, scale) {{
+                var layer = featureLayers[feature.id];
+                if (!layer) return;
+                var options = layer.options;
+                context.beginPath();
+                feature.rings.forEach(function(ring) {{
+                    context.moveTo(ring[0] * scale, ring[1] * scale);
+                    for (var k = 2; k < ring.length; k += 2) context.lineTo(ring[k] * scale, ring[k + 1] * scale);
+                    context.closePath();
+                }});
+                context.globalAlpha = options.fillOpacity;
+                context.fillStyle = options.fillColor;
+                context.fill('evenodd');
+                context.globalAlpha = options.opacity;
+                context.strokeStyle = options.color;
+                context.lineWidth = options.weight;
+                context.lineJoin = 'round';
+                context.stroke();
+                context.globalAlpha = 1;
+            }},
+
+            redrawTract: function(id) {{
+                for (var key in this._loaded) {{
+                    if (this._loaded[key].ids[id]) this._dirty[key] = true;
+                }}
+                if (!this._frame) this._frame = L.Util.requestAnimFrame(this._redrawDirty, this);
+            }},
+
+            _redrawDirty: function() {{
+                this._frame = null;
+                for (var key in this._dirty) {{
+                    if (this._loaded[key]) this._drawTile(this._loaded[key]);
+                }}
+                this._dirty = {{}};
+            }},
+
+            // Draw a tract above its neighbours, like bringToFront on a path
+            raiseTract: function(id) {{
+                var previous = this._raised;
+                this._raised = id;
+                if (previous !== null) this.redrawTract(previous);
+                this.redrawTract(id);
+            }},
+
+            resetStyle: function(layer) {{
+                layer.options = {{}};
+                return layer.setStyle(style(layer.feature));
+            }},
+
+            // The tract under a point among the candidate tract ordinals, tested
+            // against their outlines in the loaded tile there
+            tractAt: function(latlng, candidates) {{
+                if (this._tileZoom === undefined) return null;
+                var size = this.getTileSize();
+                var point = map.project(latlng, this._tileZoom);
+                var coords = L.point(Math.floor(point.x / size.x), Math.floor(point.y / size.y));
+                coords.z = this._tileZoom;
+                var tile = this._loaded[this._tileCoordsToKey(coords)];
+                if (!tile) return null;
+                var x = (point.x - coords.x * size.x) / tile.scale;
+                var y = (point.y - coords.y * size.y) / tile.scale;
+                for (var k = tile.features.length - 1; k >= 0; k--) {{
+                    var feature = tile.features[k];
+                    if (candidates.indexOf(feature.id) === -1) continue;
+                    if (ringsContain(feature.rings, x, y)) return featureLayers[feature.id] || null;
+                }}
+                return null;
+            }}
+        }});
+
+        // Even-odd test over flat [x0, y0, x1, y1, ...] rings
+        function ringsContain(rings, x, y) {{
+            var inside = false;
+            rings.forEach(function(ring) {{
+                for (var i = 0, j = ring.length - 2; i < ring.length; j = i, i += 2) {{
+                    var ax = ring[i], ay = ring[i + 1], bx = ring[j], by = ring[j + 1];
+                    if ((ay > y) !== (by > y) && x < (bx - ax) * (y - ay) / (by - ay) + ax) inside = !inside;
+                }}
+            }});
+            return inside;
+        }}
+
+        // Tract data: inlined below, or fetched from content-hashed assets (cached by the browser)
+        var inlineMapData = {{
+{inline_data}
+        }};
+        var mapDataUrls = {data_urls_json};
+
+        function loadMapData() {{
+            if (!mapDataUrls) return Promise.resolve(inlineMapData);
+            var names = Object.keys(mapDataUrls);
+            return Promise.all(names.map(function(name) {{
+                return fetch(mapDataUrls[name]).then(function(response) {{
+                    if (!response.ok) throw new Error(mapDataUrls[name] + ': ' + response.status);
+                    return name === 'tract_columns' ? response.arrayBuffer().then(decodeColumns) : response.json();
+                }});
+            }})).then(function(values) {{
+                var data = Object.assign({{}}, inlineMapData);
+                names.forEach(function(name, i) {{ data[name] = values[i]; }});
+                return data;
+            }});
+        }}
+
+        // Wrap each column of a binary tract column file (nsi_dash.columnar) in a
+        // typed array view of the fetched buffer; nothing is parsed or copied
+        function decodeColumns(buffer) {{
+            if (new TextDecoder().decode(new Uint8Array(buffer, 0, 4)) !== 'NSIC') {{
+                throw new Error('Not a tract column file');
+            }}
+            var headerLength = new DataView(buffer).getUint32(4, true);
+            var header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 8, headerLength)));
+            // Columns are little-endian, like the typed arrays of every browser platform
+            var arrayTypes = {{str: Int32Array, i8: Int8Array}};
+            var tables = {{display: {{}}, direction: {{}}, tracts: {{}}}};
+            header.columns.forEach(function(column) {{
+                tables[column.table] = tables[column.table] || {{}};
+                tables[column.table][column.name] = {{
+                    type: column.type,
+                    values: new arrayTypes[column.type](buffer, column.offset, header.rows),
+                    strings: header.strings
+                }};
+            }});
+            return {{rows: header.rows, strings: header.strings, tables: tables}};
+        }}
+
+        var tractDataLookup = {{}};
+
+        // Binary columns (decodeColumns) holding the tract text fields, if loaded
+        var tractColumns = null;
+
+        // Value of a binary column at a tract ordinal; missing values are null
+        function columnValue(column, ordinal) {{
+            var value = column.values[ordinal];
+            if (column.type === 'str') return value < 0 ? null : column.strings[value];
+            return value;
+        }}
+
+        // Display strings and direction flags of each domain's variables, precomputed by
+        // nsi_dash.display and keyed by tab id: JSON {{strings, display: {{variable: [string code
+        // by tract ordinal]}}, direction: {{variable: [flag]}}}} or binary columns (decodeColumns).
+        // Inlined below, or fetched when the domain's tab is first shown
+        var inlineDomainData = {{
+{inline_domain_data}
+        }};
+        var domainDataUrls = {domain_data_urls_json};
+        var domainTables = Object.assign({{}}, inlineDomainData);
+        var domainRequests = {{}};
+
+        function loadDomainTable(tab) {{
+            if (tab in domainTables) return Promise.resolve(domainTables[tab]);
+            if (!domainRequests[tab]) {{
+                var url = domainDataUrls[tab];
+                domainRequests[tab] = fetch(url).then(function(response) {{
+                    if (!response.ok) throw new Error(url + ': ' + response.status);
+                    return response.arrayBuffer();
+                }}).then(function(buffer) {{
+                    var magic = new TextDecoder().decode(new Uint8Array(buffer, 0, Math.min(4, buffer.byteLength)));
+                    domainTables[tab] = magic === 'NSIC' ? decodeColumns(buffer) : JSON.parse(new TextDecoder().decode(buffer));
+                    return domainTables[tab];
+                }}).catch(function(error) {{
+                    delete domainRequests[tab];
+                    throw error;
+                }});
+            }}
+            return domainRequests[tab];
+        }}
+
+        // What-if scenario values (nsi_dash.scenario) by variable and tract ordinal,
+        // {{display, direction}}, shown instead of the domain tables' values
+        var scenarioCells = {{}};
+        // Index, tier, top domain and domain ranks of the tracts a scenario changed, by tract ordinal
+        var scenarioFields = {{}};
+
+        // A tract's display string for a variable, from a domain's binary columns or JSON table
+        function variableDisplay(table, variable, ordinal) {{
+            if (scenarioCells[variable] && ordinal in scenarioCells[variable]) return scenarioCells[variable][ordinal].display;
+            if (table && table.tables) {{
+                var column = table.tables.display[variable];
+                return column ? columnValue(column, ordinal) : 'N/A';
+            }}
+            var codes = table && table.display[variable];
+            return codes ? table.strings[codes[ordinal]] : 'N/A';
+        }}
+
+        // A tract's direction flag for a variable: 1 above, -1 below average, 0 without a value
+        function variableDirection(table, variable, ordinal) {{
+            if (scenarioCells[variable] && ordinal in scenarioCells[variable]) return scenarioCells[variable][ordinal].direction;
+            if (table && table.tables) {{
+                var column = table.tables.direction[variable];
+                return column ? columnValue(column, ordinal) : 0;
+            }}
+            var flags = table && table.direction[variable];
+            return flags ? flags[ordinal] : 0;
+        }}
+
+        // A tractDataLookup field: its reweighted value while the domain weights are
+        // changed, its what-if scenario value if a scenario changed the tract, otherwise
+        // the published field
+        function tractField(tractData, ordinal, field) {{
+            if (weightedFields && field in weightedFields) return weightedFields[field][ordinal];
+            if (ordinal in scenarioFields && field in scenarioFields[ordinal]) return scenarioFields[ordinal][field];
+            return publishedField(tractData, ordinal, field);
+        }}
+
+        // A tractDataLookup field as published, or its binary column if it was moved there
+        function publishedField(tractData, ordinal, field) {{
+            if (field in tractData || !tractColumns) return tractData[field];
+            var column = tractColumns.tables.tracts[field];
+            return column ? columnValue(column, ordinal) : undefined;
+        }}
+
+        // Domain weighting (nsi_dash.weighting): the index, tier, domain ranks and top
+        // domain recomputed from a tracts x domains matrix of domain scores, loaded
+        // when a weight is first changed. {{domains, scores: [row-major, null if missing]}}
+        var inlineDomainScores = {inline_domain_scores};
+        var domainScoresUrl = {domain_scores_url_json};
+        var domainScoresRequest = null;
+        var weightedDomains = {weighted_domains_json};
+        var domainWeights = weightedDomains.map(function() {{ return 1; }});
+        var indexLevels = {INDEX_LEVELS};
+        var tierNames = {json.dumps(TIER_NAMES)};
+
+        // Reweighted tractField values by tract ordinal, null while the published values are shown
+        var weightedFields = null;
+        // Recomputed fields per weight vector, least recently used first
+        var weightingCache = new Map();
+        var WEIGHTING_CACHE_SIZE = 32;
+
+        function loadDomainScores() {{
+            if (inlineDomainScores) return Promise.resolve(inlineDomainScores);
+            if (!domainScoresRequest) {{
+                domainScoresRequest = fetch(domainScoresUrl).then(function(response) {{
+                    if (!response.ok) throw new Error(domainScoresUrl + ': ' + response.status);
+                    return response.json();
+                }}).then(function(data) {{
+                    inlineDomainScores = data;
+                    return data;
+                }}).catch(function(error) {{
+                    domainScoresRequest = null;
+                    throw error;
+                }});
+            }}
+            return domainScoresRequest;
+        }}
+
+        // Index level of each composite score by its share of tracts at or below it
+        function compositeLevels(composite) {{
+            var sorted = Array.from(composite).filter(function(value) {{ return !isNaN(value); }})
+                .sort(function(a, b) {{ return a - b; }});
+            var levels = new Float64Array(composite.length);
+            for (var i = 0; i < composite.length; i++) {{
+                if (isNaN(composite[i])) {{
+                    levels[i] = NaN;
+                    continue;
+                }}
+                // Number of scores at or below this one
+                var lo = 0, hi = sorted.length;
+                while (lo < hi) {{
+                    var mid = (lo + hi) >> 1;
+                    if (sorted[mid] <= composite[i]) lo = mid + 1; else hi = mid;
+                }}
+                levels[i] = Math.min(indexLevels, Math.max(1, Math.ceil(lo / sorted.length * indexLevels)));
+            }}
+            return levels;
+        }}
+
+        // tractField values of every tract under a weight per domain, memoized per weight vector
+        function weightDomains(data, weights) {{
+            var key = weights.join(',');
+            if (weightingCache.has(key)) {{
+                var cached = weightingCache.get(key);
+                weightingCache.delete(key);
+                weightingCache.set(key, cached);
+                return cached;
+            }}
+
+            var m = data.domains.length;
+            var n = data.scores.length / m;
+            var composite = new Float64Array(n);
+            var fields = {{opportunity_index: null, opportunity_tier: [], top_domain: [], domain_ranks: []}};
+            var contributions = new Float64Array(m);
+            var order = [];
+            for (var i = 0; i < n; i++) {{
+                var sum = 0, total = 0;
+                order.length = 0;
+                for (var d = 0; d < m; d++) {{
+                    var score = data.scores[i * m + d];
+                    contributions[d] = score === null ? -Infinity : score * weights[d];
+                    // Tracts missing a domain are scored on the weights of the domains they have
+                    sum += score === null ? 0 : contributions[d];
+                    if (score !== null) {{
+                        total += weights[d];
+                        order.push(d);
+                    }}
+                }}
+                composite[i] = sum / total;
+
+                // Domains by contribution, largest first
+                order.sort(function(a, b) {{ return contributions[b] - contributions[a] || a - b; }});
+                var ranks = {{}};
+                order.forEach(function(d, position) {{ ranks[data.domains[d]] = position + 1; }});
+                fields.domain_ranks.push(ranks);
+                fields.top_domain.push(order.length ? data.domains[order[0]] : '');
+            }}
+
+            fields.opportunity_index = compositeLevels(composite);
+            fields.opportunity_tier = Array.from(fields.opportunity_index, function(level) {{
+                return isNaN(level) ? '' : tierNames[Math.floor((level - 1) / 2)];
+            }});
+
+            weightingCache.set(key, fields);
+            if (weightingCache.size > WEIGHTING_CACHE_SIZE) weightingCache.delete(weightingCache.keys().next().value);
+            return fields;
+        }}
+
+        // Show the index under the current domain weights, or the published index with `published`
+        function applyDomainWeights(published) {{
+            var status = document.getElementById('domain-weights-status');
+            if (published) {{
+                weightedFields = null;
+                updateOpportunityScores();
+                status.innerHTML = scenarioShown() ? 'Showing the what-if scenario' : 'Showing the published index';
+                return Promise.resolve();
+            }}
+            var weights = domainWeights.slice();
+            if (!weights.some(function(weight) {{ return weight > 0; }})) {{
+                status.innerHTML = 'Give at least one domain a weight';
+                return Promise.resolve();
+            }}
+            return loadDomainScores().then(function(data) {{
+                // A later change may have been applied while the scores loaded
+                if (weights.join(',') !== domainWeights.join(',')) return;
+                weightedFields = weightDomains(data, weights);
+                updateOpportunityScores();
+                status.innerHTML = 'Showing the derived index under these weights';
+            }}).catch(function(error) {{
+                console.error('Could not load the domain scores', error);
+                status.innerHTML = 'Domain scores could not be loaded';
+            }});
+        }}
+
+        // Recolor the tracts, refilter them and refresh the panel after the index changed
+        function updateOpportunityScores() {{
+            updateActiveMasks();
+            featureLayers.forEach(function(layer, i) {{
+                var tractData = tractDataLookup[layer.feature.properties.CensusTract];
+                tractBuckets[i] = scoreBucket(tractField(tractData, i, 'opportunity_index'));
+                tractVisible[i] = isTractVisible(i) ? 1 : 0;
+                layer.setStyle(style(layer.feature));
+                // Keep the selected tract highlighted
+                if (layer === selectedLayer) layer.setStyle(selectedStyle);
+            }});
+            if (panelOrdinal !== null && !document.getElementById('panel').classList.contains('hidden')) {{
+                showPanel(panelOrdinal);
+            }}
+        }}
+
+        function scenarioShown() {{
+            return Object.keys(scenarioFields).length > 0 || Object.keys(scenarioCells).length > 0;
+        }}
+
+        // A tract's fields under a scenario's change (nsi_dash.scenario.Scenario.diff) to its
+        // published index and domain ranks: the index moves by index_change levels, or is
+        // opportunity_index where the change has no level to move by, and the ranks move by
+        // rank_changes and are numbered 1.. again, ties in their published order
+        function scenarioTractFields(index, ranks, change) {{
+            var level = change.index_change === null
+                ? (change.opportunity_index === null ? NaN : change.opportunity_index)
+                : Math.min(Math.max(index + change.index_change, 1), indexLevels);
+            var moved = function(domain) {{ return ranks[domain] + (change.rank_changes[domain] || 0); }};
+            var domains = Object.keys(ranks || {{}}).filter(function(domain) {{
+                return change.rank_changes[domain] !== null;
+            }});
+            var order = domains.slice().sort(function(a, b) {{ return moved(a) - moved(b) || ranks[a] - ranks[b]; }});
+            // Keep the published order of the domains
+            var domainRanks = {{}};
+            domains.forEach(function(domain) {{ domainRanks[domain] = order.indexOf(domain) + 1; }});
+            return {{
+                opportunity_index: level,
+                opportunity_tier: isNaN(level) ? '' : tierNames[Math.floor((level - 1) / 2)],
+                top_domain: order.length ? order[0] : '',
+                domain_ranks: domainRanks
+            }};
+        }}
+
+        // Show a what-if scenario's diff against its baseline (nsi_dash.scenario.Scenario.diff)
+        // once the tracts have loaded, on top of the published values. Each diff replaces the
+        // previous one; only the tracts either of them changed are restyled and re-rendered
+        function applyScenarioDiff(diff) {{
+            return mapDataReady.then(function() {{
+                var ordinals = {{}};
+                featureLayers.forEach(function(layer, i) {{
+                    ordinals[layer.feature.properties.CensusTract] = i;
+                }});
+                var changed = {{}};
+                Object.keys(scenarioFields).forEach(function(key) {{ changed[key] = true; }});
+                Object.keys(scenarioCells).forEach(function(variable) {{
+                    Object.keys(scenarioCells[variable]).forEach(function(key) {{ changed[key] = true; }});
+                }});
+
+                scenarioFields = {{}};
+                Object.keys(diff.tracts).forEach(function(tractId) {{
+                    var i = ordinals[tractId];
+                    if (i === undefined) return;
+                    var tractData = tractDataLookup[tractId];
+                    scenarioFields[i] = scenarioTractFields(publishedField(tractData, i, 'opportunity_index'),
+                                                            publishedField(tractData, i, 'domain_ranks'),
+                                                            diff.tracts[tractId]);
+                    changed[i] = true;
+                }});
+                scenarioCells = {{}};
+                Object.keys(diff.variables).forEach(function(variable) {{
+                    var cells = scenarioCells[variable] = {{}};
+                    Object.keys(diff.variables[variable]).forEach(function(tractId) {{
+                        var i = ordinals[tractId];
+                        if (i === undefined) return;
+                        cells[i] = diff.variables[variable][tractId];
+                        changed[i] = true;
+                    }});
+                }});
+
+                updateActiveMasks();
+                Object.keys(changed).forEach(function(key) {{
+                    var i = Number(key);
+                    var layer = featureLayers[i];
+                    delete panelTabCache[i];
+                    tractBuckets[i] = scoreBucket(tractField(tractDataLookup[layer.feature.properties.CensusTract], i,
+                                                             'opportunity_index'));
+                    tractVisible[i] = isTractVisible(i) ? 1 : 0;
+                    layer.setStyle(style(layer.feature));
+                    // Keep the selected tract highlighted
+                    if (layer === selectedLayer) layer.setStyle(selectedStyle);
+                }});
+                if (panelOrdinal !== null && changed[panelOrdinal]
+                        && !document.getElementById('panel').classList.contains('hidden')) {{
+                    showPanel(panelOrdinal);
+                }}
+                var status = document.getElementById('domain-weights-status');
+                if (status && !weightedFields) {{
+                    status.innerHTML = scenarioShown() ? 'Showing the what-if scenario' : 'Showing the published index';
+                }}
+            }});
+        }}
+
+        // The dashboard posts the scenario to the loaded page (nsi_dash.map_page.scenario_message)
+        // rather than rebuilding it. The page may load before or after that message, so it
+        // also asks the other frames of its parent for it
+        window.addEventListener('message', function(event) {{
+            if (event.data && event.data.type === 'nsi-dash-scenario') applyScenarioDiff(event.data.diff);
+        }});
+        if (window.parent !== window) {{
+            for (var frameIndex = 0; frameIndex < window.parent.frames.length; frameIndex++) {{
+                if (window.parent.frames[frameIndex] !== window) {{
+                    window.parent.frames[frameIndex].postMessage({{type: 'nsi-dash-scenario-request'}}, '*');
+                }}
+            }}
+        }}
+
+        // Tract outlines as a shared-arc topology, or null when the page embeds GeoJSON
+        var tractTopology = null;
+
+        // Tracts are added once their data has loaded; with vector tiles this is
+        // the tile layer, which also answers resetStyle
+        var geojson = tractTiles ? new TractTileLayer(tractTiles) : L.geoJSON(null, {{
+            style: style,
+            onEachFeature: onEachFeature,
+            interactive: false
+        }}).addTo(map);
+
+        // Finer tract outlines keyed by the zoom level they are used from
+        var geometryLevels = {{}};
+        var geometryLevelZooms = [];
+        var currentGeometryLevel = null;
+
+        function showMapData(data) {{
+            tractDataLookup = data.tract_data;
+            tractColumns = data.tract_columns || null;
+            tractIndex = new PackedRTree(data.tract_bounds.bounds);
+            if (tractTiles) {{
+                showTractTiles(data.tract_bounds);
+                return;
+            }}
+            tractTopology = data.tract_topology;
+            geometryLevels = data.geometry_levels || {{}};
+            geometryLevelZooms = Object.keys(tractTopology ? tractTopology.levels : geometryLevels)
+                .map(Number).sort(function(a, b) {{ return a - b; }});
+
+            var features = tractTopology ? topologyFeatures(tractTopology, 'tracts', tractTopology.arcs) : data.geo_data;
+            indexTractFilters(features.features);
+            geojson.addData(features);
+            tractShown = new Uint8Array(featureLayers.length).fill(1);
+            updateGeometryLevel();
+        }}
+
+        // One TractHandle per tract from its key and bounds, then the tiles in view
+        function showTractTiles(tractBounds) {{
+            var features = tractBounds.keys.map(function(key, i) {{
+                return {{type: 'Feature', id: i, properties: {{CensusTract: key}}}};
+            }});
+            indexTractFilters(features);
+            features.forEach(function(feature, i) {{
+                var b = tractBounds.bounds.slice(4 * i, 4 * i + 4);
+                var layer = new TractHandle(feature, L.latLngBounds([b[1], b[0]], [b[3], b[2]]));
+                featureLayers.push(layer);
+                layer.setStyle(style(feature));
+            }});
+            geojson.addTo(map);
+        }}
+
+        // Per-feature coordinates for a level, decoded from the topology on first use
+        function levelCoordinates(level) {{
+            if (!geometryLevels[level]) {{
+                var arcs = decodeArcs(tractTopology, tractTopology.levels[level]);
+                geometryLevels[level] = tractTopology.objects.tracts.geometries.map(function(geometry) {{
+                    return topologyCoordinates(geometry, arcs);
+                }});
+            }}
+            return geometryLevels[level];
+        }}
+
+        // Swap tract outlines to the detail level for the current zoom
+        function updateGeometryLevel() {{
+            var zoom = map.getZoom();
+            var level = null;
+            geometryLevelZooms.forEach(function(levelZoom) {{
+                if (zoom >= levelZoom) level = levelZoom;
+            }});
+            // Tracts away from the new view are left off the map before their outlines are swapped
+            cullTracts();
+            if (level === currentGeometryLevel) return;
+            currentGeometryLevel = level;
+
+            featureLayers.forEach(function(layer, i) {{
+                if (!layer.baseLatLngs) layer.baseLatLngs = layer.getLatLngs();
+                if (level === null) {{
+                    layer.setLatLngs(layer.baseLatLngs);
+                }} else {{
+                    var depth = layer.feature.geometry.type === 'Polygon' ? 1 : 2;
+                    layer.setLatLngs(L.GeoJSON.coordsToLatLngs(levelCoordinates(level)[i], depth));
+                }}
+            }});
+        }}
+
+        map.on('zoomend', updateGeometryLevel);
+
+        var info = L.control({{position: 'topright'}});
+
+        info.onAdd = function (map) {{
+            this._div = L.DomUtil.create('div', 'info');
+            this.update();
+            return this._div;
+        }};
+
+        info.update = function (props, ordinal) {{
+            var score = props ? tractField(tractDataLookup[props.CensusTract], ordinal, 'opportunity_index') : null;
+            this._div.innerHTML = '<h4>PWC Community Opportunity Index</h4>' +  (props ?
+                '<b>{geography_label}: ' + props.CensusTract + '</b><br />' +
+                'Opportunity Index: ' + (score ? score.toFixed(1) : 'N/A') + '/8'
+                : 'Hover over a {geography_noun}');
+        }};
+
+        info.addTo(map);
+
+        // District filter control - positioned on bottom (no offset)
+        var districtFilter = L.control({{position: 'bottomleft'}});
+
+        districtFilter.onAdd = function (map) {{
+            var div = L.DomUtil.create('div', 'info district-filter');
+
+            div.innerHTML = '<h4>District Filter</h4>' +
+                           '<div style="margin-bottom:8px;font-size:11px;color:#9ca3af;">Click to select multiple districts:</div>';
+
+            var districts = {district_names_json};
+
+            districts.forEach(function(district) {{
+                var filterItem = L.DomUtil.create('div', 'district-filter-item');
+                filterItem.innerHTML =
+                    '<div class="district-filter-color"></div>' +
+                    '<div class="district-filter-text">' + district + '</div>';
+
+                filterItem.onclick = function() {{
+                    toggleDistrictFilter(district, filterItem);
+                }};
+
+                div.appendChild(filterItem);
+            }});
+
+            // Add reset button
+            var resetButton = L.DomUtil.create('button', 'district-filter-reset');
+            resetButton.innerHTML = 'Show All';
+            resetButton.onclick = resetDistrictFilters;
+            div.appendChild(resetButton);
+
+            return div;
+        }};
+
+        districtFilter.addTo(map);
+
+        // Service Opportunity Score Legend - positioned on top (with offset)
+        var legend = L.control({{position: 'bottomleft', offset: [0, 280]}});
+
+        legend.onAdd = function (map) {{
+            var div = L.DomUtil.create('div', 'info legend');
+
+            div.innerHTML = '<h4>Service Opportunity Score</h4>' +
+                           '<div style="text-align:center;margin-bottom:8px;font-size:12px;">(higher = more opportunity)</div>' +
+                           '<div style="margin-bottom:8px;font-size:11px;color:#9ca3af;">Click to select multiple scores:</div>';
+
+            var grades = [1, 2, 3, 4, 5, 6, 7, 8];
+
+            grades.forEach(function(grade) {{
+                var legendItem = L.DomUtil.create('div', 'legend-item');
+                legendItem.innerHTML =
+                    '<div class="legend-color" style="background:' + getColor(grade) + '"></div>' +
+                    '<div class="legend-text">' + grade + '</div>';
+
+                legendItem.onclick = function() {{
+                    toggleScoreFilter(grade, legendItem);
+                }};
+
+                div.appendChild(legendItem);
+            }});
+
+            // Add reset button
+            var resetButton = L.DomUtil.create('button', 'legend-reset');
+            resetButton.innerHTML = 'Show All';
+            resetButton.onclick = resetAllFilters;
+            div.appendChild(resetButton);
+
+            return div;
+        }};
+
+        legend.addTo(map);
+
+        // Domain weights control - one slider per domain of the index
+        var weightControl = L.control({{position: 'topright'}});
+
+        weightControl.onAdd = function (map) {{
+            var div = L.DomUtil.create('div', 'info domain-weights');
+            L.DomEvent.disableClickPropagation(div);
+
+            div.innerHTML = '<h4>Domain Weights</h4>' +
+                           '<div style="margin-bottom:8px;font-size:11px;color:#9ca3af;">Drag to reweight the index:</div>';
+
+            var values = [];
+            weightedDomains.forEach(function(domain, d) {{
+                var row = L.DomUtil.create('div', 'domain-weight', div);
+                var name = L.DomUtil.create('span', 'domain-weight-name', row);
+                name.innerHTML = domain;
+                var slider = L.DomUtil.create('input', '', row);
+                slider.type = 'range';
+                slider.min = 0;
+                slider.max = 3;
+                slider.step = 0.5;
+                slider.value = 1;
+                var value = L.DomUtil.create('span', 'domain-weight-value', row);
+                value.innerHTML = '1';
+                values.push([slider, value]);
+                L.DomEvent.on(slider, 'input', function() {{
+                    domainWeights[d] = Number(slider.value);
+                    value.innerHTML = slider.value;
+                    applyDomainWeights(false);
+                }});
+            }});
+
+            var status = L.DomUtil.create('div', 'domain-weights-status', div);
+            status.id = 'domain-weights-status';
+            status.innerHTML = 'Showing the published index';
+
+            // Back to the index of the profile data
+            var resetButton = L.DomUtil.create('button', 'legend-reset', div);
+            resetButton.innerHTML = 'Published Index';
+            resetButton.onclick = function() {{
+                domainWeights = weightedDomains.map(function() {{ return 1; }});
+                values.forEach(function(pair) {{
+                    pair[0].value = 1;
+                    pair[1].innerHTML = '1';
+                }});
+                applyDomainWeights(true);
+            }};
+
+            return div;
+        }};
+
+        if (weightedDomains.length) weightControl.addTo(map);
+
+        // District label positions, derived from the tracts of each district
+        var placeLabels = {{
+            districts: {district_labels_json}
+        }};
+
+        var labelLayers = {{
+            districts: L.layerGroup()
+        }};
+
+        function createLabels() {{
+            placeLabels.districts.forEach(function(place) {{
+                var icon = L.divIcon({{
+                    className: 'place-label',
+                    html: '<div class="district-label">' + place.name + '</div>',
+                    iconSize: [130, 38],
+                    iconAnchor: [65, 19]
+                }});
+
+                L.marker(place.location, {{
+                    icon: icon,
+                    interactive: false,
+                    keyboard: false
+                }}).addTo(labelLayers.districts);
+            }});
+
+            labelLayers.districts.addTo(map);
+        }}
+
+        createLabels();
+        updateDistrictLabels();
+
+        map.on('zoomend', function() {{
+            var zoom = map.getZoom();
+            map.addLayer(labelLayers.districts);
+        }});
+
+        // Settles once the tracts are on the map
+        var mapDataReady = loadMapData().then(showMapData);
+        mapDataReady.catch(function(error) {{
+            console.error('Could not load the map data', error);
+            info._div.innerHTML = '<h4>PWC Community Opportunity Index</h4>Map data could not be loaded';
+        }});
+    </script>
+</body>
+</html>'''
@@ -0,0 +1,277 @@
+"""
+Assembles the map page in memory from the prepared tract data, either
+self-contained or as a small shell over content-hashed data assets.
+
+The page is cached per process by the content hashes of its inputs, so
+reruns and concurrent sessions reuse one rendered string; the only files
+written while serving are the data assets, once per data version. Where
+they cannot be written (a read-only deployment) the dashboard falls back to
+the inlined page.
+"""
+import json
+
+import geopandas as gpd
+import streamlit as st
+
+from nsi_dash.assets import STATIC_URL, plan_assets
+from nsi_dash.districts import (district_label_points, district_names, district_proportions, district_strings,
+                                summarize_districts)
+from nsi_dash.geography import DEFAULT_LEVEL, geography_level
+from nsi_dash.geometry import DEFAULT_PRECISION, DEFAULT_ZOOM_TOLERANCES, TractTopology, to_shapely
+from nsi_dash.map_html import DOMAIN_DATA_PREFIX, DOMAIN_SCORES_DATA, render_map_html
+from nsi_dash.payload import binary_columns, domain_display, feature_properties, tract_bounds
+from nsi_dash.telemetry import counted_cache, current_span, event, timed
+from nsi_dash.tiles import TILE_SUBDIR, keys_digest
+from nsi_dash.tracts import build_tract_data
+from nsi_dash.variables import reverse_variables, variable_name_map
+from nsi_dash.weighting import domain_scores, scores_payload
+
+# How tract outlines reach the page; 'tiles' draws them from a vector tile
+# pyramid built by nsi_dash.tiles and needs the page shell
+GEOMETRY_FORMATS = ('topojson', 'geojson', 'tiles')
+DEFAULT_GEOMETRY_FORMAT = 'topojson'
+
+# How variable display strings reach the page; binary columns need the data assets
+ATTRIBUTE_FORMATS = ('json', 'binary')
+DEFAULT_ATTRIBUTE_FORMAT = 'binary'
+
+# How Leaflet draws the tracts; 'auto' picks canvas from this many features up,
+# where one SVG path per tract makes panning and zooming sluggish
+RENDERERS = ('auto', 'svg', 'canvas')
+CANVAS_MIN_FEATURES = 1000
+
+
+def choose_renderer(feature_count, renderer='auto'):
+    """'svg' or 'canvas' for a number of map features."""
+    if renderer not in RENDERERS:
+        raise ValueError(f"renderer must be one of {RENDERERS}, not {renderer!r}")
+    if renderer == 'auto':
+        return 'canvas' if feature_count >= CANVAS_MIN_FEATURES else 'svg'
+    return renderer
+
+
+@timed('map_payloads', "Creating modern opportunity index map with multi-select interactive legend...")
+def build_map_payloads(grouped_data, filtered_domain_categories, variable_thresholds,
+                       zoom_tolerances=DEFAULT_ZOOM_TOLERANCES, precision=DEFAULT_PRECISION,
+                       geometry_format=DEFAULT_GEOMETRY_FORMAT, attribute_format='json', renderer='auto',
+                       tileset=None, level=DEFAULT_LEVEL):
+    """
+    Prepare everything the map page needs for one row per tract.
+
+    Returns (data, settings): `data` holds the tract payloads ({name: object},
+    None where unused) that are inlined or published as assets, `settings`
+    the small values always rendered into the page, including the district
+    names and label positions derived from the rows.
+
+    Tract outlines are quantized to `precision` decimals and simplified per
+    zoom level with `zoom_tolerances` ({min_zoom: tolerance in degrees}).
+    `geometry_format` is 'topojson' (shared arcs) or 'geojson'; pages fall
+    back to GeoJSON when the tracts are not all polygons. Variables are
+    sent as precomputed display strings and above/below-average flags
+    (nsi_dash.display against `variable_thresholds`), one payload per domain
+    named DOMAIN_DATA_PREFIX + domain slug, which the page loads when the
+    domain's tab is first shown. The domain scores behind the page's domain
+    weight sliders (nsi_dash.weighting) are DOMAIN_SCORES_DATA, loaded when a
+    weight is first changed. With `attribute_format` 'binary' the domain payloads and
+    the tract text fields are nsi_dash.columnar buffers (bytes) instead of
+    JSON. `renderer` is passed to choose_renderer.
+
+    With `geometry_format` 'tiles' the page draws the outlines from the tile
+    set described by `tileset` (nsi_dash.tiles.read_tileset) on canvas tiles
+    and only gets each row's key and bounds; raises ValueError if the tiles
+    were built from other rows. `level` names the geography level of the rows.
+    """
+    if geometry_format not in GEOMETRY_FORMATS:
+        raise ValueError(f"geometry_format must be one of {GEOMETRY_FORMATS}, not {geometry_format!r}")
+    if attribute_format not in ATTRIBUTE_FORMATS:
+        raise ValueError(f"attribute_format must be one of {ATTRIBUTE_FORMATS}, not {attribute_format!r}")
+    if geometry_format == 'tiles':
+        if tileset is None:
+            raise ValueError("geometry_format 'tiles' needs a tile set, build one with python -m nsi_dash.tiles")
+        if tileset['keys_digest'] != keys_digest(grouped_data['CensusTract'].tolist()):
+            raise ValueError("the vector tiles were built from other rows, rebuild them with python -m nsi_dash.tiles")
+
+    # Parse district assignments for all tracts at once into a tract x district
+    # proportion table and a per-tract summary
+    district_raw_by_tract = district_strings(grouped_data)
+    district_proportion_table = district_proportions(district_raw_by_tract)
+    district_info_by_tract = summarize_districts(district_proportion_table, district_raw_by_tract.index)
+
+    # Create a dictionary to prepare our tract data for JavaScript
+    tract_data = build_tract_data(grouped_data, district_raw_by_tract, district_info_by_tract)
+
+    bounds = grouped_data.total_bounds
+    center_lat = (bounds[1] + bounds[3]) / 2
+    center_lon = (bounds[0] + bounds[2]) / 2
+    # Several counties do not fit the default view; the page zooms to their extent
+    county_count = grouped_data['GEOID'].str[2:5].nunique() if 'GEOID' in grouped_data.columns else 1
+    fit_bounds = ([[round(bounds[1], 6), round(bounds[0], 6)], [round(bounds[3], 6), round(bounds[2], 6)]]
+                  if county_count > 1 else None)
+
+    if geometry_format == 'topojson' and not grouped_data.geom_type.isin(['Polygon', 'MultiPolygon']).all():
+        event('geojson_fallback', "Tract geometries are not all polygons, embedding GeoJSON instead of TopoJSON")
+        geometry_format = 'geojson'
+
+    data = {
+        'tract_data': tract_data,
+        'tract_columns': None,
+        'tract_topology': None,
+        'geo_data': None,
+        'geometry_levels': None,
+        'tract_bounds': None,
+    }
+    if attribute_format == 'binary':
+        data['tract_columns'], data['tract_data'] = binary_columns(tract_data)
+    # Each domain's variables are a payload of their own, loaded when its tab is first shown
+    for slug, payload in domain_display(grouped_data, filtered_domain_categories, variable_thresholds,
+                                        binary=attribute_format == 'binary').items():
+        data[DOMAIN_DATA_PREFIX + slug] = payload
+    # The page reweights the index from these scores without being rebuilt
+    scores = domain_scores(grouped_data, filtered_domain_categories, reverse_variables)
+    data[DOMAIN_SCORES_DATA] = scores_payload(scores)
+
+    # Features carry only the tract key and their ordinal as id; variable display
+    # strings go into columnar tables indexed by that ordinal
+    properties = feature_properties(grouped_data)
+    # Row bounding boxes for the page's spatial index (picking and viewport culling);
+    # with tiles the outlines come from the tiles in view, so the keys come along
+    data['tract_bounds'] = tract_bounds(grouped_data, precision, keys=geometry_format == 'tiles')
+    if geometry_format != 'tiles':
+        # Quantize tract outlines and cut them into shared arcs, simplified once per zoom level
+        topology = TractTopology(grouped_data.geometry.values, precision)
+
+    if geometry_format == 'topojson':
+        data['tract_topology'] = topology.to_topojson(
+            zoom_tolerances, properties=properties, ids=list(range(len(properties)))
+        )
+    elif geometry_format == 'geojson':
+        # The coarsest level goes into the GeoJSON; the page swaps in finer levels as it zooms
+        geometry_levels = {zoom: topology.coordinates(zoom_tolerances[zoom]) for zoom in sorted(zoom_tolerances)}
+        base_zoom = min(geometry_levels)
+        data['geometry_levels'] = {
+            zoom: [coords for geometry_type, coords in geometries]
+            for zoom, geometries in geometry_levels.items() if zoom != base_zoom
+        }
+        features = gpd.GeoDataFrame(properties, geometry=to_shapely(geometry_levels[base_zoom]),
+                                    crs=grouped_data.crs)
+        data['geo_data'] = features.to_geo_dict()
+
+    # Prepare domain categories and thresholds for JavaScript
+    settings = {
+        'domain_categories_json': json.dumps(filtered_domain_categories),
+        'variable_name_map_json': json.dumps(variable_name_map),
+        'center_lat': center_lat,
+        'center_lon': center_lon,
+        'fit_bounds': fit_bounds,
+        # The district filter and labels show the districts in the data
+        'district_names_json': json.dumps(district_names(district_proportion_table)),
+        'district_labels_json': json.dumps(district_label_points(grouped_data, district_info_by_tract)),
+        # Vector tiles are always drawn on canvas
+        'renderer': 'canvas' if geometry_format == 'tiles' else choose_renderer(len(grouped_data), renderer),
+        'tiles': None,
+        'geography_label': geography_level(level)['label'],
+        'weighted_domains_json': json.dumps(list(scores.columns)),
+    }
+    if geometry_format == 'tiles':
+        west, south, east, north = tileset['bounds']
+        settings['tiles'] = {
+            'layer': tileset['layer'],
+            'minZoom': tileset['minzoom'],
+            'maxZoom': tileset['maxzoom'],
+            'bounds': [[south, west], [north, east]],
+            'digest': tileset['digest'],
+        }
+    current_span().rows = len(grouped_data)
+    return data, settings
+
+
+def _payload_json(payload, strict=False):
+    # Data assets must be strict JSON; inlined in a script NaN is fine.
+    # Binary payloads are published as they are
+    if isinstance(payload, bytes):
+        return payload
+    return json.dumps(payload, separators=(',', ':'), allow_nan=not strict)
+
+
+def build_map_html(grouped_data, filtered_domain_categories, variable_thresholds, **options):
+    """
+    Build the self-contained map page with all tract data inlined, returning the HTML string.
+    `options` are passed on to build_map_payloads; attributes are always JSON here.
+    """
+    if options.get('attribute_format', 'json') != 'json':
+        raise ValueError("binary attributes are fetched as a data asset, use build_map_shell")
+    if options.get('geometry_format') == 'tiles':
+        raise ValueError("vector tiles are fetched from the tile server, use build_map_shell")
+    data, settings = build_map_payloads(grouped_data, filtered_domain_categories, variable_thresholds, **options)
+    map_data = {name: _payload_json(payload) for name, payload in data.items() if payload is not None}
+    return render_map_html(map_data, **settings)
+
+
+def build_map_shell(grouped_data, filtered_domain_categories, variable_thresholds, url_prefix=STATIC_URL,
+                    **options):
+    """
+    Build the map page as a small HTML shell that fetches the tract data from
+    content-hashed assets under `url_prefix`. Returns (html, {relative asset path: bytes})
+    for nsi_dash.assets.publish_assets. Raises ValueError if the data is not valid JSON (NaN).
+    Attributes default to binary columns here. Vector tiles are fetched from
+    `url_prefix`/tiles/{z}/{x}/{y}.pbf.
+    """
+    options.setdefault('attribute_format', DEFAULT_ATTRIBUTE_FORMAT)
+    data, settings = build_map_payloads(grouped_data, filtered_domain_categories, variable_thresholds, **options)
+    if settings['tiles'] is not None:
+        settings['tiles']['url'] = f"{url_prefix}/{TILE_SUBDIR}/{{z}}/{{x}}/{{y}}.pbf?v={settings['tiles']['digest']}"
+    payloads = {name: _payload_json(payload, strict=True) for name, payload in data.items() if payload is not None}
+    data_urls, files = plan_assets(payloads, url_prefix=url_prefix)
+    return render_map_html({}, data_urls=data_urls, **settings), files
+
+
+def scenario_message(diff):
+    """
+    A script-only page posting a what-if scenario's diff (see
+    nsi_dash.scenario.Scenario.diff) to the map page in a sibling frame, which
+    applies it without reloading. It answers the map page's request for the
+    diff too, in case the map loads after it. An empty diff clears the scenario.
+    """
+    # '</' would end the script early
+    diff_json = json.dumps(diff, separators=(',', ':')).replace('</', '<\\/')
+    return f"""<script>
+var message = {{type: 'nsi-dash-scenario', diff: {diff_json}}};
+for (var frameIndex = 0; frameIndex < window.parent.frames.length; frameIndex++) {{
+    if (window.parent.frames[frameIndex] !== window) window.parent.frames[frameIndex].postMessage(message, '*');
+}}
+window.addEventListener('message', function(event) {{
+    if (event.data && event.data.type === 'nsi-dash-scenario-request' && event.source) {{
+        event.source.postMessage(message, '*');
+    }}
+}});
+</script>
+"""
+
+
+@counted_cache('map_html', st.cache_resource(max_entries=4, show_spinner=False))
+def cached_map_html(data_version, _grouped_data, _filtered_domain_categories, _variable_thresholds,
+                    static_assets=False, _tileset=None):
+    """
+    The map page cached per process. The underscored arguments are not
+    hashed, so `data_version` must identify every input that went into them.
+
+    With `static_assets` the page is a shell over content-hashed data assets
+    (see build_map_shell), drawing the outlines from the vector tiles of
+    `_tileset` when they match the rows, and falling back to the inlined page
+    if the data cannot be published as JSON. Returns (html, asset files).
+    """
+    if static_assets and _tileset is not None:
+        try:
+            html_content, files = build_map_shell(_grouped_data, _filtered_domain_categories, _variable_thresholds,
+                                                  geometry_format='tiles', tileset=_tileset)
+            return html_content, files
+        except ValueError as e:
+            event('tiles_unused', f"Not using the vector tiles: {e}")
+    if static_assets:
+        try:
+            html_content, files = build_map_shell(_grouped_data, _filtered_domain_categories, _variable_thresholds)
+            return html_content, files
+        except ValueError as e:
+            event('inline_fallback', f"Inlining map data, it cannot be served as JSON assets: {e}")
+    html_content = build_map_html(_grouped_data, _filtered_domain_categories, _variable_thresholds)
+    return html_content, {}
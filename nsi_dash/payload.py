@@ -0,0 +1,118 @@
+"""
+Payload planner for the map page: decides what each tract contributes to
+the feature layer and what goes into the columnar attribute table.
+
+Features carry only their geometry, their ordinal as id and the CensusTract
+key; everything else the page shows comes from tractDataLookup or from one
+array per variable indexed by the tract ordinal, either JSON or the binary
+columns of nsi_dash.columnar. Variables reach the page as their display
+strings and direction flags (nsi_dash.display), not as raw values.
+"""
+import numpy as np
+import pandas as pd
+
+from nsi_dash.columnar import encode_columns
+from nsi_dash.display import display_frames
+
+# The only property kept on each feature
+FEATURE_KEY = 'CensusTract'
+
+# Text fields of tractDataLookup that move into the binary columns' string dictionary
+TRACT_TEXT_FIELDS = ('neighborhood', 'first_due', 'primary_district', 'opportunity_tier', 'top_domain')
+
+
+def attribute_variables(filtered_domain_categories):
+    """Variables the page lists, each once, in domain order."""
+    return list(dict.fromkeys(
+        variable for variables in filtered_domain_categories.values() for variable in variables
+    ))
+
+
+def feature_properties(grouped_data):
+    """Per-feature properties, in row order."""
+    return [{FEATURE_KEY: tract_id} for tract_id in grouped_data[FEATURE_KEY].tolist()]
+
+
+def tract_bounds(grouped_data, precision, keys=True):
+    """
+    {'keys': [CensusTract per ordinal], 'bounds': [west, south, east, north, ...]}
+    with each row's bounding box rounded outwards to `precision` decimals, so
+    it also holds the row's outline after quantization. The page builds its
+    spatial index from the flat bounds; leave out the `keys` when the
+    features already carry them.
+    """
+    scale = 10 ** precision
+    bounds = grouped_data.geometry.bounds.to_numpy()
+    bounds = np.column_stack([np.floor(bounds[:, :2] * scale), np.ceil(bounds[:, 2:] * scale)]) / scale
+    payload = {'bounds': [round(value, precision) for value in bounds.ravel().tolist()]}
+    if keys:
+        payload['keys'] = grouped_data[FEATURE_KEY].tolist()
+    return payload
+
+
+def _attribute_frame(grouped_data, filtered_domain_categories):
+    variables = [v for v in attribute_variables(filtered_domain_categories) if v in grouped_data.columns]
+    return pd.DataFrame(grouped_data[variables]).reset_index(drop=True)
+
+
+def domain_slug(domain):
+    """Id of a domain's details tab and data payload, e.g. 'Public Health' -> 'public-health'."""
+    return domain.lower().replace(' ', '-')
+
+
+def _display_json(display, direction):
+    # Display strings are stored once in 'strings' and referenced by their position
+    strings = {}
+    return {
+        'display': {
+            variable: [strings.setdefault(text, len(strings)) for text in display[variable].tolist()]
+            for variable in display.columns
+        },
+        'direction': {variable: direction[variable].tolist() for variable in direction.columns},
+        'strings': list(strings),
+    }
+
+
+def domain_display(grouped_data, filtered_domain_categories, variable_thresholds, binary=False):
+    """
+    One payload per domain with the display strings and direction flags of
+    its variables, keyed by domain_slug, so the page fetches a domain only
+    when its tab is first shown. Each payload is JSON-ready
+    {'strings': [...], 'display': {variable: [string code per tract ordinal]},
+    'direction': {variable: [flag per tract ordinal]}}, or with `binary` the
+    'display' and 'direction' tables as nsi_dash.columnar bytes. Variables
+    that are not in the data and domains without any are left out.
+    """
+    # Every variable is formatted once, even if it is listed in two domains
+    display, direction = display_frames(_attribute_frame(grouped_data, filtered_domain_categories),
+                                        variable_thresholds)
+    payloads = {}
+    for domain, variables in filtered_domain_categories.items():
+        variables = [variable for variable in dict.fromkeys(variables) if variable in display.columns]
+        if not variables:
+            continue
+        if binary:
+            payloads[domain_slug(domain)] = encode_columns({
+                'display': display[variables],
+                'direction': direction[variables],
+            })
+        else:
+            payloads[domain_slug(domain)] = _display_json(display[variables], direction[variables])
+    return payloads
+
+
+def binary_columns(tract_data):
+    """
+    Binary columns for the tract text fields ('tracts'). Returns (bytes,
+    tract_data without the text fields, which the page then reads from the columns).
+    """
+    text = pd.DataFrame(
+        [[record[field] for field in TRACT_TEXT_FIELDS] for record in tract_data.values()],
+        columns=list(TRACT_TEXT_FIELDS)
+    ).astype(object)
+    data = encode_columns({'tracts': text})
+    remaining = {
+        tract_id: {key: value for key, value in record.items() if key not in TRACT_TEXT_FIELDS}
+        for tract_id, record in tract_data.items()
+    }
+    return data, remaining
@@ -0,0 +1,169 @@
+"""
+Boundary preparation shared by the dashboard and the offline build:
+county filter, profile/boundary merge and district combination.
+"""
+import geopandas as gpd
+import pandas as pd
+
+from nsi_dash.telemetry import current_span, event, timed
+
+# Prince William County
+DEFAULT_COUNTY_FP = '153'
+
+# County FIPS codes (within Virginia) of the regions the dashboard is shared with
+REGIONS = {
+    'northern_virginia': ['013', '059', '107', '153', '510', '600', '610', '683', '685'],
+}
+
+COUNTY_NAMES = {
+    '013': 'Arlington County',
+    '059': 'Fairfax County',
+    '107': 'Loudoun County',
+    '153': 'Prince William County',
+    '510': 'Alexandria city',
+    '600': 'Fairfax city',
+    '610': 'Falls Church city',
+    '683': 'Manassas city',
+    '685': 'Manassas Park city',
+}
+
+
+def county_list(county_fps):
+    """
+    Sorted county FIPS codes from one code, a list of codes, a comma-separated
+    string or a REGIONS name; None (or 'all') means every county.
+    """
+    if county_fps is None or county_fps == 'all':
+        return None
+    if isinstance(county_fps, str):
+        county_fps = REGIONS.get(county_fps, county_fps.split(','))
+    return sorted({str(county_fp).strip().zfill(3) for county_fp in county_fps if str(county_fp).strip()})
+
+
+def county_label(county_fp):
+    """Display name of a county FIPS code."""
+    name = COUNTY_NAMES.get(county_fp)
+    return f"{name} ({county_fp})" if name else f"County {county_fp}"
+
+
+def profile_counties(profile_data):
+    """County FIPS codes of the units in a profile, from their GEOIDs (state, county, ...)."""
+    return sorted(profile_data['GEOID'].str[2:5].dropna().unique().tolist())
+
+
+@timed('county_filter')
+def filter_counties(census_tracts, county_fps=DEFAULT_COUNTY_FP):
+    """
+    Filter census tracts to some counties (COUNTYFP = 153 for Prince William) if present.
+    `county_fps` is anything county_list takes; None keeps the whole state.
+    """
+    county_fps = county_list(county_fps)
+    if county_fps is not None and 'COUNTYFP' in census_tracts.columns:
+        county_tracts = census_tracts[census_tracts['COUNTYFP'].isin(county_fps)]
+        if len(county_tracts) > 0:
+            counties = ', '.join(county_label(county_fp) for county_fp in county_fps)
+            current_span().message = f"Filtering to {len(county_tracts)} census tracts in {counties}"
+            current_span().rows = len(county_tracts)
+            return county_tracts
+    current_span().rows = len(census_tracts)
+    return census_tracts
+
+
+def filter_profile_counties(profile_data, county_fps=DEFAULT_COUNTY_FP):
+    """Profile rows of some counties, so rows of other counties are not reported as unmatched."""
+    county_fps = county_list(county_fps)
+    if county_fps is None:
+        return profile_data
+    county_rows = profile_data[profile_data['GEOID'].str[2:5].isin(county_fps)]
+    return county_rows if len(county_rows) > 0 else profile_data
+
+
+@timed('merge', "Merging data with boundaries...")
+def merge_profile_with_tracts(profile_data, census_tracts):
+    """Merge profile rows with tract boundaries, dropping rows without a geometry."""
+    merged_data = profile_data.merge(
+        census_tracts,
+        on="GEOID",
+        how="left"
+    )
+
+    # Convert to GeoDataFrame
+    merged_data = gpd.GeoDataFrame(merged_data, geometry='geometry')
+
+    # Check for missing merges
+    missing = merged_data.loc[merged_data.geometry.isna()].shape[0]
+    current_span().fields['unmatched'] = missing
+
+    if missing > 0:
+        event('unmatched_tracts', f"{missing} profile rows couldn't be matched to shapefile geometries",
+              rows=missing)
+        merged_data = merged_data.dropna(subset=['geometry'])
+
+    current_span().rows = len(merged_data)
+    return merged_data
+
+
+@timed('combine_districts', "Combining district information for tracts with multiple entries...")
+def combine_districts(merged_data):
+    """
+    Collapse tracts listed once per district into one row per CensusTract.
+
+    The first row of each tract is kept as its base row and District_combined is
+    resolved from the District columns only:
+    - a single row keeps its District_combined, falling back to District
+    - several rows take the first non-null District_combined, falling back to
+      the sorted, comma-separated unique non-blank District values
+    - anything left over becomes 'Not Available'
+    """
+    merged_data = merged_data[merged_data['CensusTract'].notna()]
+
+    # Base rows in CensusTract order, matching groupby's sorted keys
+    grouped_data = merged_data.drop_duplicates('CensusTract', keep='first')
+    grouped_data = grouped_data.sort_values('CensusTract', kind='stable').reset_index(drop=True)
+
+    has_combined = 'District_combined' in merged_data.columns
+    district_columns = ['CensusTract', 'District'] + (['District_combined'] if has_combined else [])
+    districts = pd.DataFrame(merged_data[district_columns])
+    by_tract = districts.groupby('CensusTract', sort=True)
+
+    rows_per_tract = by_tract.size()
+    if has_combined:
+        # first() skips nulls, i.e. the first non-null District_combined per tract
+        combined = by_tract['District_combined'].first()
+    else:
+        combined = pd.Series(pd.NA, index=rows_per_tract.index, dtype=object)
+
+    # Single-row tracts fall back to their own District value
+    single = rows_per_tract == 1
+    single_fallback = districts.drop_duplicates('CensusTract').set_index('CensusTract')['District']
+    single_fallback = single_fallback.reindex(rows_per_tract.index)
+    combined = combined.where(~(single & combined.isna()), single_fallback)
+
+    # Multi-row tracts fall back to the sorted unique non-blank districts
+    named = districts.dropna(subset=['District'])
+    named = named[named['District'].str.strip() != '']
+    joined = (named.drop_duplicates(['CensusTract', 'District'])
+                   .sort_values('District')
+                   .groupby('CensusTract')['District']
+                   .agg(', '.join))
+    joined = joined.reindex(rows_per_tract.index)
+    combined = combined.where(~(~single & combined.isna()), joined)
+
+    combined = combined.fillna('Not Available')
+    grouped_data['District_combined'] = grouped_data['CensusTract'].map(combined).values
+    current_span().rows = len(grouped_data)
+    return grouped_data
+
+
+def prepare_tracts(profile_data, census_tracts, county_fps=DEFAULT_COUNTY_FP):
+    """
+    Run the county filter, merge and district combination for the counties
+    in `county_fps` (see county_list; None for the whole state).
+    Returns None when no profile row matched a boundary.
+    """
+    census_tracts = filter_counties(census_tracts, county_fps)
+    profile_data = filter_profile_counties(profile_data, county_fps)
+    merged_data = merge_profile_with_tracts(profile_data, census_tracts)
+    if len(merged_data) == 0:
+        return None
+    return combine_districts(merged_data)
@@ -0,0 +1,382 @@
+"""
+What-if scenarios: override single tract x variable values of the profile
+and rescore only what the change reaches.
+
+A Scenario keeps each indicator's values in a sorted array with their rows
+in the same order. An override deletes the old value and inserts the new
+one instead of re-ranking the column, then recomputes the percentile ranks
+of the rows whose values lie between the two, the domain scores, domain
+ranks and composite of those rows, and the index levels of the rows whose
+composite lies between its old and new value. The variable's thresholds
+and above/below-average flags are updated the same way.
+
+Scores follow nsi_dash.scoring and nsi_dash.weighting, which do not
+reproduce the published CSV columns (see nsi_dash.scoring.check_scoring).
+The diff therefore holds how far the overrides moved a tract's derived index
+level and domain ranks from the derived baseline, and the map moves the
+published values by as much, for the tracts it changed only. A scenario is
+built over the map's rows, one per tract. Thresholds are kept over the
+rows they were computed from, e.g. the profile with a row per district,
+whose rows of a tract are changed together.
+"""
+import copy
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from nsi_dash.display import (ABOVE_AVERAGE, BELOW_AVERAGE, MISSING_TEXT, NEAR_AVERAGE, format_class,
+                              format_values)
+from nsi_dash.telemetry import counted_cache
+from nsi_dash.thresholds import DEFAULT_PERCENTILES, compute_variable_thresholds, percentile_key
+from nsi_dash.weighting import (WEIGHTED_DOMAINS, DomainWeighting, index_levels, indicator_percentiles,
+                                weigh_scores)
+
+# Past this share of changed rows the composite scores are re-sorted rather than updated one by one
+RESORT_SHARE = 0.25
+
+
+class SortedColumn:
+    """A column's values, missing ones left out, in a sorted array with their rows in the same order."""
+
+    def __init__(self, values):
+        present = np.flatnonzero(~np.isnan(values))
+        self.rows = present[np.argsort(values[present], kind='stable')]
+        self.values = values[self.rows]
+
+    def __len__(self):
+        return len(self.values)
+
+    def remove(self, value, row):
+        start = np.searchsorted(self.values, value, side='left')
+        end = np.searchsorted(self.values, value, side='right')
+        position = start + np.flatnonzero(self.rows[start:end] == row)[0]
+        self.values = np.delete(self.values, position)
+        self.rows = np.delete(self.rows, position)
+
+    def insert(self, value, row):
+        position = np.searchsorted(self.values, value, side='right')
+        self.values = np.insert(self.values, position, value)
+        self.rows = np.insert(self.rows, position, row)
+
+    def rows_between(self, low, high):
+        """Rows whose value is in [low, high]."""
+        return self.rows[np.searchsorted(self.values, low, side='left'):np.searchsorted(self.values, high, side='right')]
+
+    def percentiles(self, values):
+        """Average rank among the column's values over their count, like DataFrame.rank(pct=True)."""
+        below = np.searchsorted(self.values, values, side='left')
+        at_or_below = np.searchsorted(self.values, values, side='right')
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ranks = (below + (at_or_below - below + 1) / 2) / len(self.values)
+        ranks[np.isnan(values)] = np.nan
+        return ranks
+
+
+def _tract_rows(tracts):
+    # {tract: its row positions}, in order of first appearance
+    rows = {}
+    for row, tract in enumerate(tracts):
+        rows.setdefault(tract, []).append(row)
+    return rows
+
+
+def _move(column, values, row, j, new):
+    # Set values[row, j] to `new`, moving it in its SortedColumn; False if it was already `new`
+    old = values[row, j]
+    if old == new or (np.isnan(old) and np.isnan(new)):
+        return False
+    if not np.isnan(old):
+        column.remove(old, row)
+    if not np.isnan(new):
+        column.insert(new, row)
+    values[row, j] = new
+    return True
+
+
+class Scenario:
+    """
+    Overrides of a profile's indicator values, rescored incrementally.
+
+    `data` holds the rows to score, those of the map (a CensusTract column,
+    one row per tract), `domain_categories` the variables of each domain
+    and `variable_thresholds` their thresholds, computed from
+    `threshold_data` (by default `data`) if None. `threshold_data` are the
+    rows the thresholds come from, e.g. the profile with a row per district.
+    `weights` ({domain: weight}) weigh the domains of the index.
+    """
+
+    def __init__(self, data, domain_categories, reverse_variables=(), variable_thresholds=None, weights=None,
+                 threshold_data=None):
+        self.tracts = data['CensusTract'].tolist()
+        self._tract_rows = _tract_rows(self.tracts)
+        # First row of each tract, the one the map keeps
+        self._first_rows = np.array([rows[0] for rows in self._tract_rows.values()])
+
+        self.variables = [variable for variable in dict.fromkeys(
+            variable for variables in domain_categories.values() for variable in variables
+        ) if variable in data.columns]
+        self._columns = {variable: j for j, variable in enumerate(self.variables)}
+        reverse_variables = set(reverse_variables)
+        self._signs = np.array([-1.0 if variable in reverse_variables else 1.0 for variable in self.variables])
+
+        # Values turned so that higher is always towards a higher index, one sorted column each
+        raw = data[self.variables].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+        self._values = raw * self._signs
+        self._sorted = [SortedColumn(self._values[:, j]) for j in range(len(self.variables))]
+        # The same for the rows the thresholds come from, when they are not `data`
+        if threshold_data is None:
+            self._threshold_tract_rows = None
+            self._threshold_values = self._values
+            self._threshold_sorted = self._sorted
+        else:
+            self._threshold_tract_rows = _tract_rows(threshold_data['CensusTract'].tolist())
+            self._threshold_values = threshold_data[self.variables].apply(pd.to_numeric, errors='coerce').to_numpy(
+                dtype=np.float64) * self._signs
+            self._threshold_sorted = [SortedColumn(self._threshold_values[:, j]) for j in range(len(self.variables))]
+        self._percentiles = indicator_percentiles(data, self.variables, reverse_variables).to_numpy(dtype=np.float64)
+
+        # variables x domains membership of the domains in the index
+        self._membership = np.array([
+            [variable in domain_categories.get(domain, []) for domain in WEIGHTED_DOMAINS]
+            for variable in self.variables
+        ], dtype=np.float64).reshape(len(self.variables), len(WEIGHTED_DOMAINS))
+
+        all_rows = np.arange(len(self.tracts))
+        self._scores = self._domain_scores(all_rows)
+        self._weights = np.array(DomainWeighting(pd.DataFrame(self._scores, columns=WEIGHTED_DOMAINS)
+                                                 ).weight_vector(weights))
+        self._composite, self._ranks, self._top = weigh_scores(self._scores, self._weights)
+        self._sorted_composite = SortedColumn(self._composite)
+        self._levels = index_levels(self._composite, self._sorted_composite.values)
+
+        if variable_thresholds is None:
+            variable_thresholds = compute_variable_thresholds(data if threshold_data is None else threshold_data,
+                                                              self.variables, reverse_variables)
+        self._thresholds = {variable: dict(variable_thresholds[variable])
+                            for variable in self.variables if variable in variable_thresholds}
+        self._flags = np.column_stack([self._direction(all_rows, j) for j in range(len(self.variables))]
+                                      ) if self.variables else np.zeros((len(all_rows), 0), dtype=np.int8)
+
+        # Baseline to diff against, and the rows and cells overrides have reached
+        self._baseline = self._state()
+        self._touched_rows = set()
+        self._touched_cells = set()
+
+    def copy(self):
+        """An independent copy, e.g. of a cached baseline for one session."""
+        return copy.deepcopy(self)
+
+    def value(self, tract, variable):
+        """A tract's current value of a variable, NaN if missing."""
+        j = self._columns[variable]
+        return float(self._values[self._tract_rows[tract][0], j] * self._signs[j])
+
+    @property
+    def thresholds(self):
+        """Current {variable: {'p33', 'p67', 'reverse'}} thresholds."""
+        return copy.deepcopy(self._thresholds)
+
+    def _domain_scores(self, rows):
+        # Mean percentile rank of each domain's variables, summed element by element so a
+        # row's scores do not depend on which other rows are computed with it
+        values = self._percentiles[rows]
+        present = ~np.isnan(values)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return (np.einsum('rv,vd->rd', np.where(present, values, 0.0), self._membership)
+                    / np.einsum('rv,vd->rd', present.astype(np.float64), self._membership))
+
+    def _median(self, j):
+        thresholds = self._thresholds.get(self.variables[j])
+        return None if thresholds is None else (thresholds['p33'] + thresholds['p67']) / 2
+
+    def _direction(self, rows, j):
+        # nsi_dash.display.direction_flags for some rows of a variable
+        median = self._median(j)
+        raw = self._values[rows, j] * self._signs[j]
+        if median is None:
+            return np.full(len(rows), NEAR_AVERAGE, dtype=np.int8)
+        flags = np.where(raw > median, ABOVE_AVERAGE, BELOW_AVERAGE).astype(np.int8)
+        flags[np.isnan(raw)] = NEAR_AVERAGE
+        return flags
+
+    def _state(self):
+        return self._values.copy(), self._levels.copy(), self._ranks.copy(), self._top.copy(), self._flags.copy()
+
+    def override(self, tract, variable, value):
+        """
+        Set a tract's value of a variable (None or NaN for missing) and return
+        the diff (see diff()) of what changed since the previous state.
+        Raises KeyError for an unknown tract or variable.
+        """
+        return self.override_many({(tract, variable): value})
+
+    def override_many(self, overrides):
+        """Apply {(tract, variable): value} overrides and return the diff of what they changed."""
+        before = self._state()
+        score_rows = set()
+        cells = set()
+        for (tract, variable), value in overrides.items():
+            j = self._columns[variable]
+            ranked, flagged = self._set_value(tract, j, value)
+            score_rows.update(ranked.tolist())
+            cells.update((row, j) for row in flagged.tolist())
+        rows = self._rescore(np.array(sorted(score_rows), dtype=int)) if score_rows else set()
+        self._touched_rows.update(rows)
+        self._touched_cells.update(cells)
+        return self._diff(before, rows, cells)
+
+    def _set_value(self, tract, j, value):
+        # Move the tract's rows in the variable's sorted column and re-rank the rows between
+        # the old and new values. Returns (rows to rescore, rows whose display may have changed)
+        new = np.nan if value is None else float(value) * self._signs[j]
+        column = self._sorted[j]
+        affected = set()
+        changed = []
+        for row in self._tract_rows[tract]:
+            old = self._values[row, j]
+            if _move(column, self._values, row, j, new):
+                changed.append(row)
+                affected.add(row)
+                if np.isnan(old) or np.isnan(new):
+                    # Every rank is over a new count of values
+                    affected.update(column.rows.tolist())
+                else:
+                    affected.update(column.rows_between(min(old, new), max(old, new)).tolist())
+        empty = np.array([], dtype=int)
+        if not changed:
+            return empty, empty
+        if self._threshold_tract_rows is not None:
+            for row in self._threshold_tract_rows.get(tract, []):
+                _move(self._threshold_sorted[j], self._threshold_values, row, j, new)
+
+        affected = np.array(sorted(affected))
+        self._percentiles[affected, j] = column.percentiles(self._values[affected, j])
+        flagged = np.union1d(self._update_thresholds(j), changed)
+        self._flags[flagged, j] = self._direction(flagged, j)
+        # Only variables of the index's domains move the scores
+        return (affected if self._membership[j].any() else empty), flagged
+
+    def _update_thresholds(self, j):
+        # Thresholds from the sorted values; returns the rows between the old and new
+        # midpoints, the only unchanged ones whose flag can flip
+        variable = self.variables[j]
+        threshold_column = self._threshold_sorted[j]
+        old_median = self._median(j)
+        raw = threshold_column.values if self._signs[j] > 0 else -threshold_column.values[::-1]
+        if len(raw):
+            keys = [percentile_key(q) for q in DEFAULT_PERCENTILES]
+            self._thresholds[variable] = dict(zip(keys, np.quantile(raw, DEFAULT_PERCENTILES).tolist()))
+            self._thresholds[variable]['reverse'] = bool(self._signs[j] < 0)
+        else:
+            self._thresholds.pop(variable, None)
+        new_median = self._median(j)
+
+        if old_median is None or new_median is None:
+            rows = np.arange(len(self.tracts))
+        else:
+            # The same range among the turned values
+            low, high = sorted((old_median * self._signs[j], new_median * self._signs[j]))
+            rows = self._sorted[j].rows_between(low, high)
+        return rows
+
+    def _rescore(self, rows):
+        # Domain scores, ranks and composites of the re-ranked rows, then the index levels
+        # they move; returns the rows whose scores or levels were recomputed
+        old_composite = self._composite[rows]
+        self._scores[rows] = self._domain_scores(rows)
+        self._composite[rows], self._ranks[rows], self._top[rows] = weigh_scores(self._scores[rows], self._weights)
+        new_composite = self._composite[rows]
+
+        moved = ~((old_composite == new_composite) | (np.isnan(old_composite) & np.isnan(new_composite)))
+        if not moved.any():
+            return set(rows.tolist())
+        count = len(self._sorted_composite)
+        if moved.sum() > RESORT_SHARE * len(self.tracts):
+            self._sorted_composite = SortedColumn(self._composite)
+        else:
+            for row, old, new in zip(rows[moved], old_composite[moved], new_composite[moved]):
+                if not np.isnan(old):
+                    self._sorted_composite.remove(old, row)
+                if not np.isnan(new):
+                    self._sorted_composite.insert(new, row)
+
+        if len(self._sorted_composite) != count or moved.sum() > RESORT_SHARE * len(self.tracts):
+            level_rows = np.arange(len(self.tracts))
+        else:
+            # Only rows whose composite lies between a moved one's old and new value
+            # change their share of composites at or below them
+            level_rows = [rows[moved]] + [
+                self._sorted_composite.rows_between(min(old, new), max(old, new))
+                for old, new in zip(old_composite[moved], new_composite[moved])
+            ]
+            level_rows = np.unique(np.concatenate(level_rows))
+        self._levels[level_rows] = index_levels(self._composite[level_rows], self._sorted_composite.values)
+        return set(rows.tolist()) | set(level_rows.tolist())
+
+    def diff(self):
+        """
+        What all overrides changed against the baseline, for the tracts it changed:
+        {'tracts': {tract: {'index_change', 'opportunity_index', 'rank_changes'}},
+        'variables': {variable: {tract: {'display', 'direction'}}}}. index_change
+        is how many levels the tract's index moved, None if it is missing before
+        or after, when opportunity_index is its current level (None if missing).
+        rank_changes are {domain: how many places its rank moved}, None for a
+        domain left without a score. Variables are written like nsi_dash.display's.
+        Empty dicts without any change.
+        """
+        return self._diff(self._baseline, self._touched_rows, self._touched_cells)
+
+    @property
+    def active(self):
+        """True if the overrides changed anything against the baseline."""
+        diff = self.diff()
+        return bool(diff['tracts'] or diff['variables'])
+
+    def _diff(self, before, rows, cells):
+        values, levels, ranks, top, flags = before
+        # Rows after the first of a tract are its other districts, with the same values
+        first_rows = set(self._first_rows.tolist())
+        rows = np.array(sorted(row for row in rows if row in first_rows), dtype=int)
+        tracts = {}
+        if len(rows):
+            same_level = (levels[rows] == self._levels[rows]) | (np.isnan(levels[rows]) & np.isnan(self._levels[rows]))
+            changed = rows[~same_level | (ranks[rows] != self._ranks[rows]).any(axis=1) | (top[rows] != self._top[rows])]
+            for row in changed.tolist():
+                old_level, new_level = levels[row], self._levels[row]
+                rank_changes = {}
+                for domain, old_rank, new_rank in zip(WEIGHTED_DOMAINS, ranks[row].tolist(), self._ranks[row].tolist()):
+                    # A domain that gains a score has no baseline rank to move from
+                    if old_rank and old_rank != new_rank:
+                        rank_changes[domain] = new_rank - old_rank if new_rank else None
+                tracts[self.tracts[row]] = {
+                    'index_change': None if np.isnan(old_level) or np.isnan(new_level) else int(new_level - old_level),
+                    'opportunity_index': None if np.isnan(new_level) else float(new_level),
+                    'rank_changes': rank_changes,
+                }
+
+        variables = {}
+        for row, j in sorted(cells):
+            old, new = values[row, j], self._values[row, j]
+            same_value = old == new or (np.isnan(old) and np.isnan(new))
+            if row not in first_rows or (same_value and flags[row, j] == self._flags[row, j]):
+                continue
+            variable = self.variables[j]
+            raw = new * self._signs[j]
+            variables.setdefault(variable, {})[self.tracts[row]] = {
+                'display': MISSING_TEXT if np.isnan(raw) else format_values([raw], format_class(variable))[0],
+                'direction': int(self._flags[row, j]),
+            }
+        return {'tracts': tracts, 'variables': variables}
+
+
+@counted_cache('scenario', st.cache_resource(max_entries=4, show_spinner=False))
+def cached_scenario(data_version, _data, _domain_categories, reverse_variables=(), _variable_thresholds=None,
+                    _threshold_data=None):
+    """
+    The baseline Scenario of the map's rows, built once per process; sessions
+    work on a copy(). The underscored arguments are not hashed, so
+    `data_version` must change whenever they do.
+    """
+    return Scenario(_data, _domain_categories, reverse_variables, _variable_thresholds,
+                    threshold_data=_threshold_data)
@@ -0,0 +1,147 @@
+"""
+Indicator scoring engine: derives the columns the notebook work adds to the
+profile CSV (<Domain>_Rank, <Domain>_Var1..3, Top_Domain,
+PWC_Opportunity_Index and Opportunity_Tier) from the raw indicator columns
+listed in domain_categories, so a refreshed profile without them still maps.
+nsi_dash.loaders fills them in as it reads the profile, so they are computed
+once per version of the CSV.
+
+Every indicator is ranked once over the distinct tracts
+(nsi_dash.weighting.indicator_percentiles). A tract's domain ranks order its
+domain scores under equal weights (nsi_dash.weighting), and its top
+variables in a domain are the ones with the highest percentile ranks,
+picked with np.argpartition.
+
+This is a model of its own, not the published one: the notebook's method
+is not in the repo, and the derived index agrees with the shipped CSV's on
+less than half of the tracts. A profile with every published column keeps them,
+so the shipped CSV maps its published values only. A profile lacking any of
+them gets all of them derived, so a map never mixes the two models; the
+published columns this replaces are checked against the derived ones
+(check_scoring) and a 'scoring_mismatch' event names those that disagree.
+"""
+import numpy as np
+import pandas as pd
+
+from nsi_dash.telemetry import event, span
+from nsi_dash.weighting import (DOMAIN_PREFIXES, WEIGHTED_DOMAINS, DomainWeighting, domain_score_matrix,
+                                indicator_percentiles)
+
+# Top variables kept per tract and domain (<Domain>_Var1..3)
+TOP_VARIABLES = 3
+
+# Share of rows a published scoring column must agree with its derived
+# counterpart on before the two are used side by side without a warning
+MIN_AGREEMENT = 0.95
+
+
+def scoring_columns(k=TOP_VARIABLES):
+    """Names of the columns score_indicators derives."""
+    return (['PWC_Opportunity_Index', 'Opportunity_Tier', 'Top_Domain']
+            + [f"{DOMAIN_PREFIXES[domain]}_Rank" for domain in WEIGHTED_DOMAINS]
+            + [f"{DOMAIN_PREFIXES[domain]}_Var{i}" for domain in WEIGHTED_DOMAINS for i in range(1, k + 1)])
+
+
+def top_variables(percentiles, k=TOP_VARIABLES):
+    """
+    rows x k array of the column positions of each row's k highest values,
+    highest first, -1 where a row has fewer than k values.
+    """
+    values = percentiles.to_numpy(dtype=np.float64)
+    values = np.where(np.isnan(values), -np.inf, values)
+    k = min(k, values.shape[1])
+    if k == 0:
+        return np.full((len(values), 0), -1)
+    if values.shape[1] > k:
+        # Only the k largest of each row, in no particular order
+        picked = np.argpartition(-values, k - 1, axis=1)[:, :k]
+    else:
+        picked = np.tile(np.arange(k), (len(values), 1))
+    picked_values = np.take_along_axis(values, picked, axis=1)
+    # Highest first, ties in column order
+    order = np.lexsort((picked, -picked_values), axis=1)
+    top = np.take_along_axis(picked, order, axis=1)
+    top[np.take_along_axis(picked_values, order, axis=1) == -np.inf] = -1
+    return top
+
+
+def score_indicators(data, domain_categories, reverse_variables=(), k=TOP_VARIABLES):
+    """
+    DataFrame aligned with `data` holding the scoring_columns. Variables of
+    `domain_categories` that are not in `data` are left out.
+    """
+    variables = [variable for domain in WEIGHTED_DOMAINS for variable in domain_categories.get(domain, [])]
+    percentiles = indicator_percentiles(data, variables, reverse_variables)
+
+    scores = domain_score_matrix(percentiles, domain_categories, WEIGHTED_DOMAINS)
+    derived = DomainWeighting(scores).recompute().copy()
+
+    for domain in WEIGHTED_DOMAINS:
+        domain_variables = [variable for variable in dict.fromkeys(domain_categories.get(domain, []))
+                            if variable in percentiles.columns]
+        # Position -1 picks the trailing None for empty slots
+        names = np.array(domain_variables + [None], dtype=object)
+        top = top_variables(percentiles[domain_variables], k)
+        for i in range(k):
+            column = names[top[:, i]] if i < top.shape[1] else [None] * len(data)
+            derived[f"{DOMAIN_PREFIXES[domain]}_Var{i + 1}"] = column
+    return derived
+
+
+def scoring_agreement(data, derived, columns=None):
+    """
+    {column: share of rows on which `derived` equals `data`} for the
+    scoring_columns (or `columns`) both have; missing on both sides agrees.
+    """
+    shares = {}
+    for column in columns or scoring_columns():
+        if column not in data.columns or column not in derived.columns or not len(data):
+            continue
+        published, own = data[column], derived[column]
+        if pd.api.types.is_numeric_dtype(published) and pd.api.types.is_numeric_dtype(own):
+            published = published.astype('float64')
+            own = own.astype('float64')
+        else:
+            published = published.astype(object)
+            own = own.astype(object)
+        agree = (published.to_numpy() == own.to_numpy()) | (published.isna().to_numpy() & own.isna().to_numpy())
+        shares[column] = float(agree.mean())
+    return shares
+
+
+def check_scoring(data, derived, columns=None, min_agreement=MIN_AGREEMENT):
+    """
+    scoring_agreement of the profile's published columns and the derived
+    ones, recording a 'scoring_mismatch' event (a warning) that names every
+    column agreeing on fewer than `min_agreement` of the rows.
+    """
+    shares = scoring_agreement(data, derived, columns)
+    mismatched = {column: share for column, share in shares.items() if share < min_agreement}
+    if mismatched:
+        event('scoring_mismatch',
+              f"Derived scoring columns disagree with the profile's published ones on "
+              f"{', '.join(f'{column} ({share:.0%} agree)' for column, share in mismatched.items())}",
+              agreement={column: round(share, 4) for column, share in mismatched.items()})
+    return shares
+
+
+def with_indicator_scores(data, domain_categories, reverse_variables=(), overwrite=False):
+    """
+    `data` itself if it already has every scoring column (and not `overwrite`),
+    otherwise a copy with all of them computed by score_indicators. Published
+    columns it replaces are checked against their derived values (check_scoring).
+    """
+    if not overwrite and all(column in data.columns for column in scoring_columns()):
+        return data
+    columns = scoring_columns()
+    with span('derive_scores', f"Deriving {len(columns)} scoring columns from the indicator columns") as stage:
+        derived = score_indicators(data, domain_categories, reverse_variables)
+        published = [column for column in columns if column in data.columns]
+        if published:
+            stage.fields['agreement'] = check_scoring(data, derived, published)
+        scored = data.copy()
+        for column in columns:
+            scored[column] = derived[column]
+        stage.rows = len(scored)
+    return scored
+
@@ -0,0 +1,118 @@
+"""
+Small static server for an exported map site, sending precompressed variants.
+
+    python -m nsi_dash.serve [SITE_DIR] [--port PORT] [--mbtiles FILE]
+
+Serves SITE_DIR (see `python -m nsi_dash.export --site`) and answers each
+request with the .br or .gz variant its Accept-Encoding allows. Asset URLs
+carry their content hash as ?v=, which makes the responses cacheable for
+ten years; every response has an ETag. With --mbtiles the vector tiles
+under /tiles/ come from an MBTiles file (see `python -m nsi_dash.tiles`)
+instead of SITE_DIR/tiles/.
+"""
+import argparse
+import gzip
+import mimetypes
+import os
+import sqlite3
+import sys
+
+import tornado.ioloop
+import tornado.web
+
+from nsi_dash.compress import parse_accept_encoding, select_variant
+
+SITE_DIR = 'site'
+DEFAULT_PORT = 8502
+
+
+class PrecompressedStaticFileHandler(tornado.web.StaticFileHandler):
+    """StaticFileHandler that swaps in a precompressed variant of the requested file."""
+
+    def parse_url_path(self, url_path):
+        url_path = super().parse_url_path(url_path)
+        full_path = os.path.join(self.root, url_path)
+        if os.path.isdir(full_path) and self.default_filename:
+            url_path = os.path.join(url_path, self.default_filename)
+            full_path = os.path.join(full_path, self.default_filename)
+        self._original_path = url_path
+        self._content_encoding = None
+        if os.path.isfile(full_path):
+            variant_path, self._content_encoding = select_variant(
+                full_path, self.request.headers.get('Accept-Encoding'))
+            url_path = os.path.relpath(variant_path, self.root)
+        return url_path
+
+    def get_content_type(self):
+        # The type of the original file, not of its .gz/.br variant
+        mime_type, encoding = mimetypes.guess_type(self._original_path)
+        return mime_type or 'application/octet-stream'
+
+    def set_extra_headers(self, path):
+        self.set_header('Vary', 'Accept-Encoding')
+        if self._content_encoding:
+            self.set_header('Content-Encoding', self._content_encoding)
+
+
+class MBTilesHandler(tornado.web.RequestHandler):
+    """Vector tiles from an MBTiles file at /tiles/{z}/{x}/{y}.pbf, sent gzipped when the client accepts it."""
+
+    def initialize(self, mbtiles_path):
+        self.mbtiles_path = mbtiles_path
+
+    def get(self, z, x, y):
+        z, x, y = int(z), int(x), int(y)
+        connection = sqlite3.connect(f"file:{self.mbtiles_path}?mode=ro", uri=True)
+        try:
+            # MBTiles rows count from the south (TMS)
+            row = connection.execute(
+                "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                (z, x, 2 ** z - 1 - y)).fetchone()
+        finally:
+            connection.close()
+        if row is None:
+            raise tornado.web.HTTPError(404)
+
+        data = row[0]
+        self.set_header('Content-Type', 'application/x-protobuf')
+        self.set_header('Vary', 'Accept-Encoding')
+        if self.get_argument('v', None):
+            self.set_header('Cache-Control', f"max-age={tornado.web.StaticFileHandler.CACHE_MAX_AGE}, public")
+        if parse_accept_encoding(self.request.headers.get('Accept-Encoding')).get('gzip', 0) > 0:
+            self.set_header('Content-Encoding', 'gzip')
+        else:
+            data = gzip.decompress(data)
+        self.write(data)
+
+
+def make_app(site_dir=SITE_DIR, mbtiles_path=None):
+    handlers = []
+    if mbtiles_path is not None:
+        handlers.append((r"/tiles/(\d+)/(\d+)/(\d+)\.pbf", MBTilesHandler, {'mbtiles_path': mbtiles_path}))
+    handlers.append((r"/(.*)", PrecompressedStaticFileHandler, {'path': site_dir, 'default_filename': 'index.html'}))
+    return tornado.web.Application(handlers)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve an exported map site with precompressed variants.")
+    parser.add_argument('site_dir', nargs='?', default=SITE_DIR, help="directory written by export --site")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="port to listen on")
+    parser.add_argument('--mbtiles', help="MBTiles file to serve the vector tiles from")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.site_dir):
+        print(f"{args.site_dir} does not exist, run python -m nsi_dash.export --site {args.site_dir} first")
+        return 1
+
+    if args.mbtiles and not os.path.isfile(args.mbtiles):
+        print(f"{args.mbtiles} does not exist, run python -m nsi_dash.tiles --mbtiles {args.mbtiles} first")
+        return 1
+
+    make_app(args.site_dir, args.mbtiles).listen(args.port)
+    print(f"Serving {args.site_dir} at http://localhost:{args.port}/")
+    tornado.ioloop.IOLoop.current().start()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
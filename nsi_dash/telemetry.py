@@ -0,0 +1,313 @@
+"""
+Stage timing for the dashboard: named spans and cache counters, written as
+a structured log and as Prometheus text metrics.
+
+    with span('merge', "Merging data with boundaries...") as merge:
+        merged_data = ...
+        merge.rows = len(merged_data)
+
+A span records its wall time, the CPU time of its thread, how much the
+process's peak RSS grew while it ran, the row and byte counts and other
+fields set on it, and the events (warnings, fallbacks) recorded with
+event() while it ran; events also go to the 'nsi_dash' logger. Spans nest
+per thread. Each finished span is one JSON line in the span log, with the
+path of its parents and the trace id of its outermost span (one dashboard
+rerun), so a rerun's latency breaks down by stage. The log goes to stderr,
+or to the file named by NSI_DASH_SPAN_LOG ('off' turns it off).
+
+Per-stage totals and the hit/miss counts of the Streamlit caches wrapped in
+counted_cache accumulate for the process; write_metrics() writes them in
+the Prometheus text format to the file named by NSI_DASH_METRICS_FILE, if
+set (e.g. static/metrics/nsi_dash.prom, which Streamlit's static serving
+exposes at app/static/metrics/nsi_dash.prom). Peak RSS is the process's,
+so with concurrent sessions a span's RSS growth may include allocations of
+other sessions.
+"""
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SPAN_LOG = os.environ.get('NSI_DASH_SPAN_LOG', '-')
+METRICS_FILE = os.environ.get('NSI_DASH_METRICS_FILE') or None
+
+# Upper bounds of the stage duration histogram buckets, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_local = threading.local()
+_lock = threading.Lock()
+_log_lock = threading.Lock()
+logger = logging.getLogger('nsi_dash')
+
+# Process totals: stage name -> metrics, (cache, 'hit' or 'miss') -> count
+_stages = {}
+_cache_requests = {}
+
+
+def _peak_rss():
+    """Peak resident set size of the process in bytes, None where unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+class Span:
+    """
+    A named stage: use it as a context manager, or start() and finish() it.
+    `rows`, `bytes`, `message` and `fields` may be set while it runs.
+    """
+
+    def __init__(self, name, message=None, **fields):
+        self.name = name
+        self.message = message
+        self.rows = None
+        self.bytes = None
+        self.fields = fields
+        self.events = []
+        self.path = name
+        self.trace = None
+        self._started = None
+
+    def start(self):
+        stack = _stack()
+        if stack:
+            self.path = f"{stack[-1].path}/{self.name}"
+            self.trace = stack[-1].trace
+        else:
+            self.trace = uuid.uuid4().hex[:12]
+        stack.append(self)
+        self._started = (time.perf_counter(), time.thread_time(), _peak_rss())
+        return self
+
+    def finish(self, status='ok'):
+        """Record the span; spans started inside it and not finished are finished first."""
+        if self._started is None:
+            return
+        wall_start, cpu_start, rss_start = self._started
+        self._started = None
+        stack = _stack()
+        while stack:
+            inner = stack.pop()
+            if inner is self:
+                break
+            inner.finish(status)
+        rss = _peak_rss()
+        record = {
+            'ts': round(time.time(), 3),
+            'trace': self.trace,
+            'span': self.name,
+            'path': self.path,
+            'status': status,
+            'wall_s': round(time.perf_counter() - wall_start, 6),
+            'cpu_s': round(time.thread_time() - cpu_start, 6),
+            'rss_peak_delta_bytes': None if rss is None else rss - rss_start,
+            'rows': self.rows,
+            'bytes': self.bytes,
+        }
+        if self.message:
+            record['message'] = self.message
+        if self.events:
+            record['events'] = self.events
+        record.update(self.fields)
+        _record(record)
+        _log(record)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, traceback):
+        # Streamlit's st.stop() and reruns unwind with exceptions of their own
+        if exc_type is None:
+            status = 'ok'
+        elif exc_type.__name__ in ('StopException', 'RerunException'):
+            status = 'stopped'
+        else:
+            status = 'error'
+            self.fields['error'] = exc_type.__name__
+        self.finish(status)
+        return False
+
+
+def span(name, message=None, **fields):
+    """A Span for a stage, with a progress `message` and other fields for its log line."""
+    return Span(name, message, **fields)
+
+
+def trace(name, message=None, **fields):
+    """
+    Start a span as the outermost of this thread (e.g. a dashboard rerun),
+    dropping any spans an interrupted run left unfinished.
+    """
+    _stack().clear()
+    return Span(name, message, **fields).start()
+
+
+def current_span():
+    """The innermost running span of this thread, or a detached one that is never recorded."""
+    stack = _stack()
+    return stack[-1] if stack else Span(None)
+
+
+def event(name, message, level=logging.WARNING, **fields):
+    """
+    Record an event on the innermost running span, where it goes into the
+    span's log line, and log `message` to the 'nsi_dash' logger at `level`.
+    """
+    current_span().events.append(dict(fields, event=name, message=message))
+    logger.log(level, message)
+
+
+def timed(name, message=None):
+    """Decorator running each call of a function in a span; the function may fill in current_span()."""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name, message):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def counted_cache(name, cache_decorator):
+    """
+    Apply a Streamlit cache decorator (e.g. st.cache_resource(max_entries=4))
+    and count each call as a hit, or as a miss when the function body ran.
+    The result keeps the cached function's clear().
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def body(*args, **kwargs):
+            _local.misses = getattr(_local, 'misses', 0) + 1
+            return function(*args, **kwargs)
+
+        cached = cache_decorator(body)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            misses = getattr(_local, 'misses', 0)
+            result = cached(*args, **kwargs)
+            count_cache(name, getattr(_local, 'misses', 0) == misses)
+            return result
+
+        wrapper.clear = cached.clear
+        return wrapper
+    return decorate
+
+
+def count_cache(name, hit):
+    """Count a hit or a miss of a cache."""
+    key = (name, 'hit' if hit else 'miss')
+    with _lock:
+        _cache_requests[key] = _cache_requests.get(key, 0) + 1
+
+
+def _record(record):
+    with _lock:
+        stage = _stages.setdefault(record['span'], {
+            'count': 0, 'errors': 0, 'wall': 0.0, 'cpu': 0.0, 'rows': 0, 'bytes': 0, 'rss': None,
+            'buckets': [0] * len(DURATION_BUCKETS),
+        })
+        stage['count'] += 1
+        stage['errors'] += record['status'] == 'error'
+        stage['wall'] += record['wall_s']
+        stage['cpu'] += record['cpu_s']
+        stage['rows'] += record['rows'] or 0
+        stage['bytes'] += record['bytes'] or 0
+        stage['rss'] = record['rss_peak_delta_bytes']
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if record['wall_s'] <= bound:
+                stage['buckets'][i] += 1
+
+
+def _log(record):
+    if SPAN_LOG == 'off':
+        return
+    line = json.dumps(record, default=str) + '\n'
+    with _log_lock:
+        if SPAN_LOG == '-':
+            sys.stderr.write(line)
+            sys.stderr.flush()
+        else:
+            with open(SPAN_LOG, 'a') as f:
+                f.write(line)
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return str(value) if isinstance(value, int) else repr(round(value, 6))
+
+
+def prometheus_text():
+    """The process's stage and cache metrics in the Prometheus text exposition format."""
+    with _lock:
+        stages = {name: dict(stage, buckets=list(stage['buckets'])) for name, stage in sorted(_stages.items())}
+        caches = dict(sorted(_cache_requests.items()))
+
+    lines = [
+        '# HELP nsi_dash_stage_duration_seconds Wall time of dashboard stages.',
+        '# TYPE nsi_dash_stage_duration_seconds histogram',
+    ]
+    for name, stage in stages.items():
+        for bound, count in zip(DURATION_BUCKETS, stage['buckets']):
+            lines.append(f'nsi_dash_stage_duration_seconds_bucket{{stage="{_label(name)}",le="{bound:g}"}} {count}')
+        lines.append(f'nsi_dash_stage_duration_seconds_bucket{{stage="{_label(name)}",le="+Inf"}} {stage["count"]}')
+        lines.append(f'nsi_dash_stage_duration_seconds_sum{{stage="{_label(name)}"}} {stage["wall"]:.6f}')
+        lines.append(f'nsi_dash_stage_duration_seconds_count{{stage="{_label(name)}"}} {stage["count"]}')
+
+    for metric, key, kind, text in (
+        ('nsi_dash_stage_cpu_seconds_total', 'cpu', 'counter', 'CPU time of dashboard stages.'),
+        ('nsi_dash_stage_errors_total', 'errors', 'counter', 'Dashboard stages that raised an error.'),
+        ('nsi_dash_stage_rows_total', 'rows', 'counter', 'Rows processed by dashboard stages.'),
+        ('nsi_dash_stage_bytes_total', 'bytes', 'counter', 'Bytes read or produced by dashboard stages.'),
+        ('nsi_dash_stage_rss_peak_growth_bytes', 'rss', 'gauge',
+         'Growth of the peak RSS of the process during the last run of a stage.'),
+    ):
+        lines.append(f'# HELP {metric} {text}')
+        lines.append(f'# TYPE {metric} {kind}')
+        for name, stage in stages.items():
+            if stage[key] is not None:
+                lines.append(f'{metric}{{stage="{_label(name)}"}} {_number(stage[key])}')
+
+    lines.append('# HELP nsi_dash_cache_requests_total Lookups of the dashboard caches by result.')
+    lines.append('# TYPE nsi_dash_cache_requests_total counter')
+    for (name, result), count in caches.items():
+        lines.append(f'nsi_dash_cache_requests_total{{cache="{_label(name)}",result="{result}"}} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_metrics(path=None):
+    """
+    Write prometheus_text() to `path` (METRICS_FILE by default) in one step;
+    returns the path, or None when there is no metrics file to write.
+    """
+    path = path or METRICS_FILE
+    if path is None:
+        return None
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(prometheus_text())
+    os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,66 @@
+"""
+Percentile thresholds used to describe a tract's value as above or below average.
+
+All breakpoints for all variables are computed with a single
+DataFrame.quantile call, optionally per reference group (county, district...).
+"""
+import streamlit as st
+
+from nsi_dash.telemetry import counted_cache
+
+DEFAULT_PERCENTILES = (0.33, 0.67)
+
+
+def percentile_key(q):
+    """Threshold key for a percentile, e.g. 0.33 -> 'p33', 0.025 -> 'p2.5'."""
+    return f"p{round(q * 100, 6):g}"
+
+
+def _thresholds_from_quantiles(quantiles, reverse_variables):
+    """Turn a percentiles x variables frame into {variable: {'p33': .., 'p67': .., 'reverse': ..}}."""
+    keys = [percentile_key(q) for q in quantiles.index]
+    thresholds = {}
+    for variable in quantiles.columns:
+        values = quantiles[variable]
+        # Variables without any values have no thresholds
+        if values.isna().all():
+            continue
+        thresholds[variable] = dict(zip(keys, values.tolist()))
+        thresholds[variable]['reverse'] = variable in reverse_variables
+    return thresholds
+
+
+def compute_variable_thresholds(data, variables, reverse_variables=(),
+                                percentiles=DEFAULT_PERCENTILES, group_by=None):
+    """
+    Percentile thresholds for each variable, ignoring missing values.
+
+    `variables` may repeat (PTRAF is in two domains); each is computed once.
+    With `group_by` (a column name or a Series aligned with `data`) the result
+    is {group: thresholds} computed within each reference group.
+    """
+    variables = [v for v in dict.fromkeys(variables) if v in data.columns]
+    percentiles = list(percentiles)
+    reverse_variables = set(reverse_variables)
+
+    if group_by is None:
+        quantiles = data[variables].quantile(percentiles)
+        return _thresholds_from_quantiles(quantiles, reverse_variables)
+
+    grouped = data[variables].groupby(data[group_by] if isinstance(group_by, str) else group_by)
+    quantiles = grouped.quantile(percentiles)
+    return {
+        group: _thresholds_from_quantiles(group_quantiles.droplevel(0), reverse_variables)
+        for group, group_quantiles in quantiles.groupby(level=0)
+    }
+
+
+@counted_cache('variable_thresholds', st.cache_data(max_entries=16, show_spinner=False))
+def cached_variable_thresholds(data_version, _data, variables, reverse_variables=(),
+                               percentiles=DEFAULT_PERCENTILES, group_by=None):
+    """
+    compute_variable_thresholds cached per data version.
+    `_data` is not hashed, so `data_version` must change whenever the data does;
+    `group_by` must be a column name here.
+    """
+    return compute_variable_thresholds(_data, variables, reverse_variables, percentiles, group_by)
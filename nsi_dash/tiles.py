@@ -0,0 +1,345 @@
+"""
+Offline vector tile pyramid of the tract (or block group) outlines.
+
+    python -m nsi_dash.tiles [--level {tract,block_group}] [--out DIR | --mbtiles FILE]
+                             [--min-zoom Z] [--max-zoom Z] [--profile CSV] [--tracts SHAPEFILE]
+                             [--artifacts DIR] [--counties FIPS,...|REGION|all]
+
+Embedding every outline in the page does not scale to block groups, so the
+map page can draw them from Mapbox Vector Tiles instead and fetch only the
+tiles in view. Outlines are simplified once per zoom on the shared arcs of
+nsi_dash.geometry.TractTopology, so neighbours stay seamless, clipped to
+each tile with a small buffer, snapped to the tile grid and encoded as MVT
+2.1 with the row ordinal as feature id and CensusTract as the only property.
+
+Tiles go to DIR/{z}/{x}/{y}.pbf with .gz/.br variants (static/tiles by
+default, where Streamlit static serving picks them up) or into one MBTiles
+file for `python -m nsi_dash.serve --mbtiles`. Tiles without any feature
+are not written. The tile set's metadata records a digest of the row keys
+so a page is never drawn from tiles of other rows.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import math
+import os
+import shutil
+import sqlite3
+import sys
+import time
+
+import numpy as np
+import shapely
+from shapely.geometry.polygon import orient
+
+from nsi_dash.assets import STATIC_DIR
+from nsi_dash.build import load_prepared_data
+from nsi_dash.compress import precompress
+from nsi_dash.geometry import DEFAULT_PRECISION, TractTopology, _polygons, to_shapely
+from nsi_dash.geography import DEFAULT_LEVEL, GEOGRAPHY_LEVELS, geography_level
+
+TILE_LAYER = 'tracts'
+TILE_EXTENT = 4096
+# Tile units kept beyond each edge so outlines are stroked across tile seams
+TILE_BUFFER = 64
+DEFAULT_MIN_ZOOM = 8
+DEFAULT_MAX_ZOOM = 14
+
+TILE_SUBDIR = 'tiles'
+TILE_DIR = os.path.join(STATIC_DIR, TILE_SUBDIR)
+TILESET_FILE = 'tileset.json'
+
+# MVT geometry commands and the polygon geometry type
+MOVE_TO, LINE_TO, CLOSE_PATH = 1, 2, 7
+POLYGON = 3
+
+
+def keys_digest(keys):
+    """Digest of the row keys in ordinal order, which tile feature ids refer to."""
+    return hashlib.sha256('\n'.join(str(key) for key in keys).encode('utf-8')).hexdigest()[:16]
+
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _zigzag(value):
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def _key(number, wire_type):
+    return _varint(number << 3 | wire_type)
+
+
+def _uint_field(number, value):
+    return _key(number, 0) + _varint(value)
+
+
+def _bytes_field(number, data):
+    return _key(number, 2) + _varint(len(data)) + data
+
+
+def _packed_field(number, values):
+    return _bytes_field(number, b''.join(_varint(value) for value in values))
+
+
+def polygon_commands(geometry):
+    """
+    MVT geometry commands for a (multi)polygon in integer tile coordinates.
+    Exterior rings get a positive area in tile coordinates (y down), holes a
+    negative one; rings with fewer than three distinct points are dropped.
+    """
+    commands = []
+    x = y = 0
+    for polygon in _polygons(geometry):
+        polygon = orient(polygon, 1.0)
+        for k, ring in enumerate([polygon.exterior] + list(polygon.interiors)):
+            points = np.rint(np.asarray(ring.coords)[:-1]).astype(np.int64)
+            if len(points) > 1:
+                points = points[np.r_[True, np.any(np.diff(points, axis=0) != 0, axis=1)]]
+            if len(points) < 3:
+                if k == 0:
+                    break
+                continue
+            deltas = np.diff(points, axis=0, prepend=[[x, y]])
+            x, y = (int(value) for value in points[-1])
+            commands.append(MOVE_TO | 1 << 3)
+            commands.extend(_zigzag(int(value)) for value in deltas[0])
+            commands.append(LINE_TO | (len(points) - 1) << 3)
+            commands.extend(_zigzag(int(value)) for value in deltas[1:].ravel())
+            commands.append(CLOSE_PATH | 1 << 3)
+    return commands
+
+
+def encode_tile(features, layer_name=TILE_LAYER, extent=TILE_EXTENT):
+    """Encode [(feature id, CensusTract key, polygon commands)] as a one-layer MVT tile."""
+    values = {}
+    encoded = []
+    for feature_id, key, commands in features:
+        value_index = values.setdefault(str(key), len(values))
+        encoded.append(_bytes_field(2, (
+            _uint_field(1, feature_id)
+            + _packed_field(2, [0, value_index])
+            + _uint_field(3, POLYGON)
+            + _packed_field(4, commands)
+        )))
+    layer = (
+        _bytes_field(1, layer_name.encode('utf-8'))
+        + b''.join(encoded)
+        + _bytes_field(3, b'CensusTract')
+        + b''.join(_bytes_field(4, _bytes_field(1, value.encode('utf-8'))) for value in values)
+        + _uint_field(5, extent)
+        + _uint_field(15, 2)
+    )
+    return _bytes_field(3, layer)
+
+
+def _tile_units(zoom, extent):
+    """shapely.transform function from lon/lat to Web Mercator tile units at a zoom level."""
+    scale = extent * 2 ** zoom
+
+    def transform(coordinates):
+        lon = coordinates[:, 0]
+        lat = np.radians(np.clip(coordinates[:, 1], -85.0511, 85.0511))
+        x = (lon + 180) / 360 * scale
+        y = (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2 * scale
+        return np.column_stack([x, y])
+    return transform
+
+
+def build_tiles(geometries, keys, min_zoom=DEFAULT_MIN_ZOOM, max_zoom=DEFAULT_MAX_ZOOM,
+                precision=DEFAULT_PRECISION, extent=TILE_EXTENT, buffer=TILE_BUFFER):
+    """
+    Yield ((z, x, y), MVT bytes) for every tile of the pyramid holding a feature,
+    with the row ordinals as feature ids. Outlines are simplified to about one
+    tile unit at each zoom.
+    """
+    topology = TractTopology(geometries, precision)
+    for zoom in range(min_zoom, max_zoom + 1):
+        tolerance = 360 / (extent * 2 ** zoom)
+        shapes = np.array(to_shapely(topology.coordinates(tolerance)), dtype=object)
+        shapes = shapely.transform(shapes, _tile_units(zoom, extent))
+        invalid = ~shapely.is_valid(shapes)
+        shapes[invalid] = shapely.make_valid(shapes[invalid], method='structure', keep_collapsed=False)
+
+        # Tiles each feature reaches, buffer included
+        tile_features = {}
+        for i, (minx, miny, maxx, maxy) in enumerate(shapely.bounds(shapes)):
+            if np.isnan(minx):
+                continue
+            for x in range(math.floor((minx - buffer) / extent), math.floor((maxx + buffer) / extent) + 1):
+                for y in range(math.floor((miny - buffer) / extent), math.floor((maxy + buffer) / extent) + 1):
+                    tile_features.setdefault((x, y), []).append(i)
+
+        for x, y in sorted(tile_features):
+            features = []
+            for i in tile_features[(x, y)]:
+                clipped = shapely.clip_by_rect(shapes[i], x * extent - buffer, y * extent - buffer,
+                                               (x + 1) * extent + buffer, (y + 1) * extent + buffer)
+                local = shapely.set_precision(
+                    shapely.transform(clipped, lambda coordinates: coordinates - [x * extent, y * extent]), 1.0)
+                commands = polygon_commands(local)
+                if commands:
+                    features.append((i, keys[i], commands))
+            if features:
+                yield (zoom, x, y), encode_tile(features, extent=extent)
+
+
+def tileset_metadata(grouped_data, level, min_zoom, max_zoom, extent=TILE_EXTENT):
+    """Metadata of a tile set for these rows, without the tile counts and digest."""
+    west, south, east, north = (float(value) for value in grouped_data.total_bounds)
+    return {
+        'format': 'pbf',
+        'layer': TILE_LAYER,
+        'extent': extent,
+        'minzoom': min_zoom,
+        'maxzoom': max_zoom,
+        'bounds': [west, south, east, north],
+        'level': level,
+        'rows': int(len(grouped_data)),
+        'keys_digest': keys_digest(grouped_data['CensusTract'].tolist()),
+    }
+
+
+def write_tile_directory(tiles, out_dir, metadata):
+    """
+    Write tiles to out_dir/{z}/{x}/{y}.pbf with precompressed variants,
+    replacing any earlier pyramid, then the tile set metadata. Returns the metadata.
+    """
+    if os.path.isdir(out_dir):
+        for name in os.listdir(out_dir):
+            if name.isdigit():
+                shutil.rmtree(os.path.join(out_dir, name))
+    sha = hashlib.sha256()
+    paths = []
+    for (z, x, y), data in tiles:
+        path = os.path.join(out_dir, str(z), str(x), f"{y}.pbf")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        sha.update(f"{z}/{x}/{y}".encode() + data)
+        paths.append(path)
+    rows = precompress(paths)
+
+    metadata = dict(metadata, tiles=len(paths), bytes=sum(row['bytes'] for row in rows),
+                    digest=sha.hexdigest()[:16])
+    with open(os.path.join(out_dir, TILESET_FILE), 'w') as f:
+        json.dump(metadata, f, indent=2)
+    return metadata
+
+
+def write_mbtiles(tiles, path, metadata):
+    """Write tiles (gzipped, TMS rows) and metadata to an MBTiles file. Returns the metadata."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    connection = sqlite3.connect(tmp_path)
+    connection.execute("CREATE TABLE metadata (name TEXT, value TEXT)")
+    connection.execute("CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, "
+                       "tile_data BLOB)")
+    connection.execute("CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row)")
+
+    sha = hashlib.sha256()
+    count = size = 0
+    for (z, x, y), data in tiles:
+        connection.execute("INSERT INTO tiles VALUES (?, ?, ?, ?)",
+                           (z, x, 2 ** z - 1 - y, gzip.compress(data, compresslevel=9, mtime=0)))
+        sha.update(f"{z}/{x}/{y}".encode() + data)
+        count += 1
+        size += len(data)
+
+    metadata = dict(metadata, tiles=count, bytes=size, digest=sha.hexdigest()[:16])
+    west, south, east, north = metadata['bounds']
+    rows = {
+        'name': f"nsi_dash {metadata['level']}",
+        'format': 'pbf',
+        'minzoom': metadata['minzoom'],
+        'maxzoom': metadata['maxzoom'],
+        'bounds': f"{west},{south},{east},{north}",
+        'center': f"{(west + east) / 2},{(south + north) / 2},{metadata['minzoom']}",
+        'json': json.dumps({'vector_layers': [{
+            'id': metadata['layer'], 'fields': {'CensusTract': 'String'},
+            'minzoom': metadata['minzoom'], 'maxzoom': metadata['maxzoom'],
+        }]}),
+        # The full tile set metadata, read back by read_tileset
+        'nsi_dash': json.dumps(metadata),
+    }
+    connection.executemany("INSERT INTO metadata VALUES (?, ?)", [(k, str(v)) for k, v in rows.items()])
+    connection.commit()
+    connection.close()
+    os.replace(tmp_path, path)
+    return metadata
+
+
+def read_tileset(path=TILE_DIR):
+    """Metadata of a tile directory or MBTiles file, or None if there is no tile set."""
+    if path.endswith('.mbtiles'):
+        if not os.path.isfile(path):
+            return None
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            row = connection.execute("SELECT value FROM metadata WHERE name = 'nsi_dash'").fetchone()
+        finally:
+            connection.close()
+        return json.loads(row[0]) if row else None
+    metadata_path = os.path.join(path, TILESET_FILE)
+    if not os.path.isfile(metadata_path):
+        return None
+    with open(metadata_path) as f:
+        return json.load(f)
+
+
+def generate(grouped_data, out_path=TILE_DIR, level=DEFAULT_LEVEL,
+             min_zoom=DEFAULT_MIN_ZOOM, max_zoom=DEFAULT_MAX_ZOOM):
+    """Build the pyramid for prepared rows into a directory or an .mbtiles file. Returns the metadata."""
+    start = time.perf_counter()
+    metadata = tileset_metadata(grouped_data, level, min_zoom, max_zoom)
+    tiles = build_tiles(grouped_data.geometry.values, grouped_data['CensusTract'].tolist(), min_zoom, max_zoom)
+    if out_path.endswith('.mbtiles'):
+        metadata = write_mbtiles(tiles, out_path, metadata)
+    else:
+        metadata = write_tile_directory(tiles, out_path, metadata)
+    print(f"Wrote {metadata['tiles']} tiles for zooms {min_zoom}-{max_zoom} "
+          f"({metadata['bytes'] / 1024:.0f} KB) to {out_path} in {time.perf_counter() - start:.2f}s")
+    return metadata
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the vector tile pyramid of the map outlines.")
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument('--out', default=TILE_DIR, help="tile directory to write (default: %(default)s)")
+    output.add_argument('--mbtiles', help="MBTiles file to write instead of a directory")
+    parser.add_argument('--level', choices=tuple(GEOGRAPHY_LEVELS), default=DEFAULT_LEVEL,
+                        help="geography level (default: %(default)s)")
+    parser.add_argument('--min-zoom', type=int, default=DEFAULT_MIN_ZOOM, help="lowest zoom (default: %(default)s)")
+    parser.add_argument('--max-zoom', type=int, default=DEFAULT_MAX_ZOOM,
+                        help="highest zoom; the map scales these tiles beyond it (default: %(default)s)")
+    parser.add_argument('--profile', help="opportunity profile CSV (default: the level's)")
+    parser.add_argument('--tracts', help="TIGER boundary shapefile (default: the level's)")
+    parser.add_argument('--artifacts', help="precompiled artifact directory (default: the level's)")
+    parser.add_argument('--counties', default='all',
+                        help="county FIPS codes to tile, comma separated, or a region (default: all)")
+    args = parser.parse_args(argv)
+
+    grouped_data = load_prepared_data(args.level, args.profile, args.tracts, args.artifacts,
+                                      county_fps=args.counties)
+    if grouped_data is None or len(grouped_data) == 0:
+        print("No data available after merging. Please check your data files.")
+        return 1
+    label = geography_level(args.level)['label'].lower()
+    print(f"Tiling {len(grouped_data)} {label} outlines")
+    generate(grouped_data, args.mbtiles or args.out, args.level, args.min_zoom, args.max_zoom)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""
+Columnar builder for the per-tract records the map reads as tractDataLookup.
+"""
+import pandas as pd
+
+from nsi_dash.districts import clean_text
+from nsi_dash.variables import csv_domains, get_readable_name, old_to_new_domain_map
+
+
+def _domain_ranks(grouped_data):
+    """Domain rank dict per tract, in csv_domains order, skipping missing ranks."""
+    rank_columns = {f"{domain}_Rank": old_to_new_domain_map[domain]
+                    for domain in csv_domains if f"{domain}_Rank" in grouped_data.columns}
+    ranks = [{} for _ in range(len(grouped_data))]
+    if not rank_columns:
+        return ranks
+
+    # stack() walks row by row in column order and drops missing ranks
+    stacked = grouped_data[list(rank_columns)].reset_index(drop=True).stack()
+    positions = stacked.index.get_level_values(0).tolist()
+    domains = stacked.index.get_level_values(1).map(rank_columns).tolist()
+    for position, domain, rank in zip(positions, domains, stacked.astype(int).tolist()):
+        ranks[position][domain] = rank
+    return ranks
+
+
+def _domain_variables(grouped_data):
+    """Readable top-variable names per tract and domain, skipping empty slots."""
+    var_columns = {f"{domain}_Var{i}": old_to_new_domain_map[domain]
+                   for domain in csv_domains for i in range(1, 4)
+                   if f"{domain}_Var{i}" in grouped_data.columns}
+    variables = [{} for _ in range(len(grouped_data))]
+    if not var_columns:
+        return variables
+
+    stacked = grouped_data[list(var_columns)].reset_index(drop=True).stack()
+    stacked = stacked[stacked.astype(bool)]
+
+    # Look up each distinct variable name once
+    readable = {name: get_readable_name(name) for name in stacked.unique()}
+
+    positions = stacked.index.get_level_values(0).tolist()
+    domains = stacked.index.get_level_values(1).map(var_columns).tolist()
+    for position, domain, name in zip(positions, domains, stacked.tolist()):
+        variables[position].setdefault(domain, []).append(readable[name])
+    return variables
+
+
+def build_tract_data(grouped_data, district_raw, district_info):
+    """
+    Build the tract lookup used by the map, keyed by CensusTract.
+
+    `district_raw` and `district_info` come from nsi_dash.districts and are
+    aligned with the rows of `grouped_data`.
+    """
+    n = len(grouped_data)
+    columns = grouped_data.columns
+    is_multi = district_info['is_multi_district'].astype(bool).tolist()
+    tract_ids = grouped_data['CensusTract'].tolist()
+
+    if 'Top_Domain' in columns:
+        top_domain = grouped_data['Top_Domain'].map(lambda d: old_to_new_domain_map.get(d, d)).tolist()
+    else:
+        top_domain = [''] * n
+
+    records = pd.DataFrame({
+        'opportunity_index': grouped_data['PWC_Opportunity_Index'].astype(float).tolist(),
+        'opportunity_tier': grouped_data['Opportunity_Tier'].tolist() if 'Opportunity_Tier' in columns else [''] * n,
+        'top_domain': top_domain,
+        'domain_ranks': _domain_ranks(grouped_data),
+        'domain_variables': _domain_variables(grouped_data),
+        'district': district_info['display_text'].tolist(),
+        'district_raw': district_raw.tolist(),
+        'districts': district_info['districts'].tolist(),
+        'proportions': district_info['proportions'].tolist(),
+        'primary_district': district_info['primary_district'].tolist(),
+        'neighborhood': clean_text(grouped_data, 'Neighborhood').tolist(),
+        'first_due': clean_text(grouped_data, '1st Due').tolist(),
+        # Add asterisk to tract ID if it spans multiple districts
+        'display_tract_id': [f"{tract_id}*" if multi else tract_id
+                             for tract_id, multi in zip(tract_ids, is_multi)],
+        'is_multi_district': is_multi
+    })
+
+    return dict(zip(tract_ids, records.to_dict('records')))
@@ -0,0 +1,179 @@
+"""
+Indicator variables shown on the dashboard: display names, domain membership
+and scoring direction, plus the mapping from the domain names used in the
+profile CSV to the names shown in the dashboard.
+"""
+from nsi_dash.telemetry import span
+
+variable_name_map = {
+    # Socioeconomic
+    "LOWINCPCT": "Low Income Population",
+    "UNEMPPCT": "Unemployment Rate",
+    "LINGISOPCT": "Limited English Proficiency",
+    "LESSHSPCT": "Less than High School Education",
+    "E_POV150_P": "Population Below 150% Poverty Level",
+    "With_PublicAssIncome_P": "Public Assistance Income",
+    "With_SSI_P": "Supplemental Security Income",
+    "E_UNINSUR_P": "Uninsured Population",
+    "With_Medicaid_P": "Medicaid Coverage",
+    "percent_food_insecure": "Food Insecurity Rate",
+    "LIFEEXPPCT": "Life Expectancy",
+
+    # Housing
+    "PRE1960PCT": "Housing Built Before 1960",
+    "E_HBURD_P": "Housing Cost Burden",
+    "House_Vacant_P": "Vacant Housing",
+    "E_MUNIT_P": "Multi-Unit Housing",
+    "E_MOBILE_P": "Mobile Homes",
+    "E_CROWD_P": "Crowded Housing",
+    "Owner_occupied_P": "Owner-Occupied Housing",
+    "Mean_Proportion_HHIncome": "Housing Cost as % of Income",
+    "percent_homeowners": "Homeownership Rate",
+
+    # Mobility (formerly Transportation)
+    "PTRAF": "Traffic Volume",
+    "E_NOVEH_P": "No Vehicle Access",
+    "Mean_Transportation_time(min)": "Average Commute Time",
+    "Work_Drivealone_P": "Drive Alone to Work",
+    "Work_Carpooled_P": "Carpool to Work",
+    "Work_PublicTransportation_P": "Public Transit to Work",
+    "Work_Walk_P": "Walk to Work",
+    "Work_Fromhome_P": "Work from Home",
+
+    # Transportation Safety (formerly TransportationSafety)
+    "Percent_Severe/Fatal": "Severe/Fatal Crashes",
+    "Avg_Person_Injured/Kill": "Person Injuries/Fatalities",
+    "Avg_Pedestrian_Injured/Kill": "Pedestrian Injuries/Fatalities",
+    "Percent_Alcohol_Related": "Alcohol-Related Crashes",
+    "Percent_Distracted_Related": "Distracted Driving Crashes",
+    "Percent_Drowsy_Related": "Drowsy Driving Crashes",
+    "Percent_Drug_Related": "Drug-Related Crashes",
+    "Percent_Speed_Related": "Speed-Related Crashes",
+    "Percent_Hitrun_Related": "Hit and Run Crashes",
+    "Percent_Schoolzone_Related": "School Zone Crashes",
+    "Percent_Lgtruck_Related": "Large Truck Crashes",
+    "Percent_Young_Related": "Young Driver Crashes",
+    "Percent_Senior_Related": "Senior Driver Crashes",
+    "Percent_Bike_Related": "Bicycle Crashes",
+    "Percent_Night_Related": "Nighttime Crashes",
+    "Percent_Workzone_Related": "Work Zone Crashes",
+
+    # Environmental
+    "PM25": "Fine Particulate Matter",
+    "OZONE": "Ozone Level",
+    "DSLPM": "Diesel Particulate Matter",
+    "NO2": "Nitrogen Dioxide",
+    "CANCER": "Cancer Risk",
+    "RESP": "Respiratory Hazard",
+    "PTRAF": "Traffic Proximity",
+    "PWDIS": "Wastewater Discharge",
+    "PNPL": "Superfund Sites",
+    "PRMP": "RMP Facilities",
+    "PTSDF": "Hazardous Waste Sites",
+    "UST": "Underground Storage Tanks",
+    "WATR": "Water Discharge Sites",
+    "RSEI_AIR": "Air Releases",
+
+    # Public Health (formerly PublicHealth)
+    "Total_Calls": "Fire and EMS Incidents",
+    "Chronic_History": "Chronic Health Conditions",
+    "Violence_Calls": "Violence-Related Calls",
+    "CPR_Calls": "Cardiac Arrests",
+    "Homeless": "Homelessness-Related Calls",
+    "Domestic": "Domestic-Related Calls",
+    "Opioid_Calls": "Opioid-Related Emergency Calls",
+    "Calls_Per_HVU_Caller": "Calls per High Volume User",
+
+    # Demographics
+    "DISABILITYPCT": "Disability Rate",
+    "UNDER5PCT": "Under 5 Years Old",
+    "OVER64PCT": "Over 64 Years Old",
+    "E_SNGPNT_P": "Single Parent Households",
+    "E_GROUPQ_P": "Group Quarters Population",
+    "Total_Population": "Total Population",
+    "Median_Age": "Median Age",
+    "Age_Dependency_Ratio": "Age Dependency Ratio",
+    "Old-age_Dependency_Ratio": "Old-Age Dependency Ratio",
+    "Child_Dependency_Ratio": "Child Dependency Ratio",
+    "Prop_White": "White Population",
+    "Sex_Ratio(males per 100 females)": "Sex Ratio (males per 100 females)",
+    "Prop_Black": "Black Population",
+    "Prop_Hisp": "Hispanic Population"
+}
+
+# Enhanced domain categorization with updated domain names
+domain_categories = {
+    "Socioeconomic": [
+        "LOWINCPCT", "UNEMPPCT", "LINGISOPCT", "LESSHSPCT", "E_POV150_P",
+        "With_PublicAssIncome_P", "With_SSI_P", "E_UNINSUR_P", "With_Medicaid_P",
+        "percent_food_insecure", "LIFEEXPPCT"
+    ],
+    "Housing": [
+        "PRE1960PCT", "E_HBURD_P", "House_Vacant_P", "E_MUNIT_P", "E_MOBILE_P",
+        "E_CROWD_P", "Owner_occupied_P", "Mean_Proportion_HHIncome", "percent_homeowners"
+    ],
+    "Mobility": [  # Changed from Transportation
+        "PTRAF", "E_NOVEH_P", "Mean_Transportation_time(min)", "Work_Drivealone_P",
+        "Work_Carpooled_P", "Work_PublicTransportation_P", "Work_Walk_P", "Work_Fromhome_P"
+    ],
+    "Transportation Safety": [  # Changed from TransportationSafety (added space)
+        "Percent_Severe/Fatal", "Avg_Person_Injured/Kill", "Avg_Pedestrian_Injured/Kill",
+        "Percent_Alcohol_Related", "Percent_Distracted_Related", "Percent_Drowsy_Related",
+        "Percent_Drug_Related", "Percent_Speed_Related", "Percent_Hitrun_Related",
+        "Percent_Schoolzone_Related", "Percent_Lgtruck_Related", "Percent_Young_Related",
+        "Percent_Senior_Related", "Percent_Bike_Related", "Percent_Night_Related",
+        "Percent_Workzone_Related"
+    ],
+    "Environmental": [
+        "PM25", "OZONE", "DSLPM", "NO2", "CANCER", "RESP", "PTRAF", "PWDIS",
+        "PNPL", "PRMP", "PTSDF", "UST", "WATR", "RSEI_AIR"
+    ],
+    "Public Health": [  # Changed from PublicHealth (added space)
+        "Total_Calls", "Chronic_History", "Violence_Calls", "CPR_Calls", "Homeless", "Domestic", "Opioid_Calls", "Calls_Per_HVU_Caller",
+    ],
+    "Demographics": [
+        "DISABILITYPCT", "UNDER5PCT", "OVER64PCT", "E_SNGPNT_P", "E_GROUPQ_P",
+        "Total_Population", "Median_Age", "Age_Dependency_Ratio",
+        "Old-age_Dependency_Ratio", "Child_Dependency_Ratio", "Prop_White",
+        "Sex_Ratio(males per 100 females)", "Prop_Black", "Prop_Hisp"
+    ]
+}
+
+# Variables where higher values are better (reverse scoring for opportunity interpretation)
+reverse_variables = [
+    'percent_homeowners', 'Owner_occupied_P', 'Work_Carpooled_P', 'Work_PublicTransportation_P',
+    'Work_Walk_P', 'Work_Fromhome_P', 'Total_Population', 'LIFEEXPPCT'
+]
+
+# Domain column prefixes used in the profile CSV (<Domain>_Rank, <Domain>_Var1..3)
+csv_domains = ['Socioeconomic', 'Housing', 'Transportation', 'TransportationSafety', 'Environmental', 'PublicHealth']
+
+# Map old domain names from CSV to new display names
+old_to_new_domain_map = {
+    'Socioeconomic': 'Socioeconomic',
+    'Housing': 'Housing',
+    'Transportation': 'Mobility',
+    'TransportationSafety': 'Transportation Safety',
+    'Environmental': 'Environmental',
+    'PublicHealth': 'Public Health'
+}
+
+
+# Function to get a readable variable name
+def get_readable_name(var_name):
+    return variable_name_map.get(var_name, var_name.replace('_', ' '))
+
+
+def filter_domain_categories(columns):
+    """Domain categories restricted to the variables that exist in the data."""
+    with span('filter_variables', "Filtering variables to only include those that exist in the data...") as stage:
+        filtered_domain_categories = {}
+        found = {}
+        for domain_name, variables in domain_categories.items():
+            existing_variables = [var for var in variables if var in columns]
+            filtered_domain_categories[domain_name] = existing_variables
+            found[domain_name] = f"{len(existing_variables)}/{len(variables)}"
+        # Variables found per domain, out of those listed
+        stage.fields['variables_found'] = found
+        stage.rows = sum(len(variables) for variables in filtered_domain_categories.values())
+    return filtered_domain_categories
@@ -0,0 +1,211 @@
+"""
+Domain weighting engine: recomputes the opportunity index, its tier, the
+domain ranks and the top domain of every tract from a tracts x domains
+matrix of domain scores and one weight per domain.
+
+The profile CSV's <Domain>_Rank columns order the domains within each tract
+(1 to 6), so they add up to the same total everywhere and cannot carry a
+weighting. The engine weights domain scores instead: the mean percentile
+rank, among the rows shown, of each domain's variables, reversed for
+reverse_variables, so a higher score means a higher index like the CSV's.
+The map page repeats the recomputation in JavaScript from the same matrix.
+"""
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from nsi_dash.variables import csv_domains, old_to_new_domain_map
+
+# Domains that make up the index, by their display names, and their CSV column prefixes
+WEIGHTED_DOMAINS = [old_to_new_domain_map[domain] for domain in csv_domains]
+DOMAIN_PREFIXES = dict(zip(WEIGHTED_DOMAINS, csv_domains))
+
+# The index runs from 1 to INDEX_LEVELS in equal-count bins; each tier covers two levels
+INDEX_LEVELS = 8
+TIER_NAMES = ['Less Opportunity', 'Moderate Opportunity', 'High Opportunity', 'Exceptional Opportunity']
+
+# Decimals of the domain scores sent to the page
+SCORE_PRECISION = 4
+
+
+def indicator_percentiles(data, variables, reverse_variables=()):
+    """
+    rows x variables DataFrame of percentile ranks between 0 and 1, computed
+    in one ranking pass with reverse_variables flipped, so a higher rank
+    always points to a higher index; missing values stay NaN. Rows of the
+    same CensusTract, a tract's districts in the profile, are ranked once.
+    """
+    variables = [variable for variable in dict.fromkeys(variables) if variable in data.columns]
+    values = data[variables].apply(pd.to_numeric, errors='coerce')
+    reverse_variables = set(reverse_variables)
+    signs = np.array([-1.0 if variable in reverse_variables else 1.0 for variable in variables])
+    if 'CensusTract' not in data.columns or not data['CensusTract'].duplicated().any():
+        return (values * signs).rank(pct=True)
+    # A tract's rows share its indicator values; rank its first one and copy the ranks to the others
+    first = ~data['CensusTract'].duplicated().to_numpy()
+    ranks = (values[first] * signs).rank(pct=True).set_axis(data['CensusTract'][first])
+    return ranks.reindex(data['CensusTract']).set_axis(data.index)
+
+
+def domain_score_matrix(percentiles, filtered_domain_categories, domains=WEIGHTED_DOMAINS):
+    """
+    tracts x domains DataFrame of the mean percentile rank of each domain's
+    variables (columns of `percentiles`), missing values skipped, NaN for a
+    domain without any value in a row.
+    """
+    variables = list(percentiles.columns)
+    # variables x domains membership; a variable listed in two domains counts in both
+    membership = np.array([
+        [variable in filtered_domain_categories.get(domain, []) for domain in domains]
+        for variable in variables
+    ], dtype=np.float64).reshape(len(variables), len(domains))
+    values = percentiles.to_numpy(dtype=np.float64)
+    present = ~np.isnan(values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        scores = (np.where(present, values, 0.0) @ membership) / (present @ membership)
+    return pd.DataFrame(scores, index=percentiles.index, columns=list(domains))
+
+
+def domain_scores(data, filtered_domain_categories, reverse_variables=(), domains=WEIGHTED_DOMAINS):
+    """tracts x domains DataFrame of domain scores between 0 and 1, aligned with `data`."""
+    variables = [variable for domain in domains for variable in filtered_domain_categories.get(domain, [])]
+    percentiles = indicator_percentiles(data, variables, reverse_variables)
+    return domain_score_matrix(percentiles, filtered_domain_categories, domains)
+
+
+def scores_payload(scores):
+    """JSON-ready {'domains': [...], 'scores': [row-major scores, None if missing]} for the page."""
+    values = scores.to_numpy(dtype=np.float64).round(SCORE_PRECISION).ravel()
+    return {
+        'domains': list(scores.columns),
+        'scores': [None if np.isnan(value) else value for value in values.tolist()],
+    }
+
+
+def weigh_scores(scores, weights):
+    """
+    (composite score, domain ranks, top domain position) of each row of a
+    rows x domains array of domain scores under a weight vector. Ranks order
+    a row's domains by weighted score, 1 first and 0 for missing domains;
+    the top domain is -1 for rows without any score.
+    """
+    present = ~np.isnan(scores)
+    contributions = np.where(present, scores, 0.0) * weights
+    # Rows missing a domain are scored on the weights of the domains they have
+    with np.errstate(invalid='ignore', divide='ignore'):
+        composite = contributions.sum(axis=1) / (present * weights).sum(axis=1)
+
+    # Domains by contribution within each row, largest first; missing domains go last
+    order = np.argsort(-np.where(present, contributions, -np.inf), axis=1, kind='stable')
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.arange(1, scores.shape[1] + 1), axis=1)
+    ranks[~present] = 0
+    top = np.where(present.any(axis=1), order[:, 0], -1)
+    return composite, ranks, top
+
+
+def index_levels(composite, ranked=None):
+    """
+    Index level 1..INDEX_LEVELS of each composite score by its share of the
+    `ranked` scores (sorted, none missing; by default the composites
+    themselves) at or below it, NaN if missing.
+    """
+    composite = np.asarray(composite, dtype=np.float64)
+    valid = np.sort(composite[~np.isnan(composite)]) if ranked is None else ranked
+    levels = np.full(len(composite), np.nan)
+    if len(valid) == 0:
+        return levels
+    share = np.searchsorted(valid, composite, side='right') / len(valid)
+    levels = np.clip(np.ceil(share * INDEX_LEVELS), 1, INDEX_LEVELS)
+    levels[np.isnan(composite)] = np.nan
+    return levels
+
+
+def tier_names(levels):
+    """Tier name of each index level, '' where it is missing."""
+    levels = np.asarray(levels, dtype=np.float64)
+    tiers = np.array(TIER_NAMES + [''], dtype=object)
+    positions = np.where(np.isnan(levels), len(TIER_NAMES), (np.nan_to_num(levels) - 1) // 2).astype(int)
+    return tiers[np.clip(positions, 0, len(TIER_NAMES))]
+
+
+def parse_weights(text, domains=WEIGHTED_DOMAINS):
+    """
+    Weights from 'Domain=weight,...', matching domain names case-insensitively
+    with '-' or '_' for spaces; domains not given weigh 1. Raises ValueError.
+    """
+    names = {domain.lower().replace(' ', '-'): domain for domain in domains}
+    weights = {}
+    for item in filter(None, (part.strip() for part in text.split(','))):
+        name, _, value = item.partition('=')
+        key = name.strip().lower().replace(' ', '-').replace('_', '-')
+        if key not in names or not value.strip():
+            raise ValueError(f"expected Domain=weight with a domain out of {', '.join(domains)}, not {item!r}")
+        weights[names[key]] = float(value)
+    return weights
+
+
+class DomainWeighting:
+    """
+    Index, tiers, domain ranks and top domain of the rows of a domain score
+    matrix (domain_scores) under a weight per domain, memoized per weight vector.
+    """
+
+    def __init__(self, scores, cache_size=32):
+        self.domains = list(scores.columns)
+        self.index = scores.index
+        self.scores = scores.to_numpy(dtype=np.float64)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+
+    def weight_vector(self, weights=None):
+        """Weights in domain order from {domain: weight}; domains not given weigh 1. Raises ValueError."""
+        weights = weights or {}
+        unknown = set(weights) - set(self.domains)
+        if unknown:
+            raise ValueError(f"no domain scores for {', '.join(sorted(unknown))}")
+        vector = tuple(float(weights.get(domain, 1.0)) for domain in self.domains)
+        if any(weight < 0 or np.isnan(weight) for weight in vector) or not any(vector):
+            raise ValueError("domain weights must be non-negative and not all zero")
+        return vector
+
+    def recompute(self, weights=None):
+        """
+        DataFrame aligned with the scores holding PWC_Opportunity_Index,
+        Opportunity_Tier, Top_Domain and <Domain>_Rank under `weights`, named
+        like the profile CSV's columns. Do not modify it, it is shared with later calls.
+        """
+        vector = self.weight_vector(weights)
+        if vector in self._cache:
+            self._cache.move_to_end(vector)
+            return self._cache[vector]
+
+        composite, ranks, top = weigh_scores(self.scores, np.array(vector))
+        levels = index_levels(composite)
+        # Position -1 picks the trailing '' for rows without scores
+        top_domain = np.array([DOMAIN_PREFIXES.get(domain, domain) for domain in self.domains] + [''],
+                              dtype=object)[top]
+
+        result = pd.DataFrame({
+            'PWC_Opportunity_Index': levels,
+            'Opportunity_Tier': tier_names(levels),
+            'Top_Domain': top_domain,
+        }, index=self.index)
+        for position, domain in enumerate(self.domains):
+            rank = pd.Series(ranks[:, position], index=self.index, dtype='Int64')
+            result[f"{DOMAIN_PREFIXES.get(domain, domain)}_Rank"] = rank.mask(ranks[:, position] == 0)
+
+        self._cache[vector] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result
+
+
+def apply_weights(data, filtered_domain_categories, reverse_variables=(), weights=None):
+    """A copy of `data` with the index, tier, top domain and domain rank columns recomputed under `weights`."""
+    weighting = DomainWeighting(domain_scores(data, filtered_domain_categories, reverse_variables))
+    weighted = data.copy()
+    for column, values in weighting.recompute(weights).items():
+        weighted[column] = values
+    return weighted
@@ -0,0 +1,17 @@
+import os
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Read when nsi_dash.telemetry is imported, so set before any test module imports it
+os.environ['NSI_DASH_SPAN_LOG'] = 'off'
+
+
+@pytest.fixture(scope='session', autouse=True)
+def repo_dir():
+    # The data files are read by paths relative to the repository, like the
+    # dashboard does; session scoped so module fixtures run there too
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.chdir(REPO_DIR)
+        yield REPO_DIR
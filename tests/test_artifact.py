@@ -0,0 +1,102 @@
+import os
+
+import geopandas as gpd
+import pandas as pd
+import pytest
+
+from nsi_dash import artifact
+from nsi_dash.artifact import covers_counties, partition_file, read_artifact, selection_digest, write_artifact
+from nsi_dash.build import build
+from nsi_dash.loaders import (PROFILE_CSV, TRACTS_GEOJSON, file_fingerprint, load_tract_artifact,
+                              read_census_tracts, read_profile_data, tract_artifact_version)
+from nsi_dash.pipeline import prepare_tracts
+
+
+def _shapefile(path, rows=None):
+    tracts = gpd.read_file(TRACTS_GEOJSON)
+    tracts['GEOID'] = tracts['GEOID'].astype(str)
+    (tracts if rows is None else tracts.iloc[:rows]).to_file(path)
+    return str(path)
+
+
+def test_artifact_is_current_with_its_sources(tmp_path):
+    shapefile = _shapefile(tmp_path / 'tracts.shp')
+    out_dir = str(tmp_path / 'artifacts')
+    manifest = build(tracts_path=shapefile, county_fps='153', out_dir=out_dir)
+
+    assert set(manifest['sources']) == {'profile', 'tracts'}
+    assert tract_artifact_version(out_dir, county_fps=['153'], tracts_path=shapefile) is not None
+    assert tract_artifact_version(out_dir, county_fps=['059'], tracts_path=shapefile) is None
+
+    tracts, version = load_tract_artifact(out_dir, county_fps=['153'], tracts_path=shapefile)
+    assert version == tract_artifact_version(out_dir, county_fps=['153'], tracts_path=shapefile)
+    assert len(tracts) == manifest['rows']
+
+
+def test_artifact_is_stale_after_the_boundaries_change(tmp_path):
+    shapefile = _shapefile(tmp_path / 'tracts.shp')
+    out_dir = str(tmp_path / 'artifacts')
+    build(tracts_path=shapefile, county_fps='153', out_dir=out_dir)
+
+    _shapefile(tmp_path / 'tracts.shp', rows=-1)
+    assert tract_artifact_version(out_dir, county_fps=['153'], tracts_path=shapefile) is None
+    # Without a path the boundaries are found where the manifest recorded them
+    assert tract_artifact_version(out_dir, county_fps=['153']) is None
+    assert load_tract_artifact(out_dir, county_fps=['153'], tracts_path=shapefile) == (None, None)
+
+
+@pytest.fixture(scope='module')
+def two_counties():
+    """The mapped tracts with every other one moved to a second county."""
+    grouped_data = prepare_tracts(read_profile_data(), read_census_tracts(TRACTS_GEOJSON), ['153'])
+    grouped_data = grouped_data.copy()
+    moved = grouped_data.index % 2 == 1
+    grouped_data.loc[moved, 'GEOID'] = '51059' + grouped_data.loc[moved, 'GEOID'].str[5:]
+    return grouped_data
+
+
+def _sources():
+    return {'profile': file_fingerprint(PROFILE_CSV)}
+
+
+def test_a_county_subset_reads_only_its_partitions(tmp_path, monkeypatch, two_counties):
+    out_dir = str(tmp_path / 'artifacts')
+    manifest = write_artifact(two_counties, _sources(), out_dir=out_dir)
+    assert sorted(manifest['partitions']) == ['059', '153']
+    assert covers_counties(manifest, ['059']) and covers_counties(manifest, None)
+
+    read = []
+    read_feather = artifact.gpd.read_feather
+
+    def recorded_read_feather(path, **kwargs):
+        read.append(path)
+        return read_feather(path, **kwargs)
+    monkeypatch.setattr(artifact.gpd, 'read_feather', recorded_read_feather)
+
+    subset = read_artifact(out_dir, ['059'])
+    assert read == [os.path.join(out_dir, partition_file('059'))]
+    expected = two_counties[two_counties['GEOID'].str[2:5] == '059'].reset_index(drop=True)
+    assert subset['GEOID'].tolist() == expected['GEOID'].tolist()
+    assert subset.drop(columns='geometry').equals(pd.DataFrame(expected.drop(columns='geometry')))
+    assert subset.geometry.geom_equals(expected.geometry).all()
+
+    read.clear()
+    everything = read_artifact(out_dir)
+    assert len(read) == 2 and len(everything) == len(two_counties)
+    assert sorted(everything['GEOID']) == sorted(two_counties['GEOID'])
+    assert read_artifact(out_dir, ['001']) is None
+
+    # The version of a selection changes with its partitions only
+    assert selection_digest(manifest, ['059']) != selection_digest(manifest, ['153'])
+    assert selection_digest(manifest, ['153', '059']) == selection_digest(manifest, None)
+
+
+def test_an_artifact_without_a_requested_county_is_rejected(tmp_path, two_counties):
+    out_dir = str(tmp_path / 'artifacts')
+    manifest = write_artifact(two_counties[two_counties['GEOID'].str[2:5] == '153'], _sources(), county_fps=['153'],
+                              out_dir=out_dir)
+    assert not covers_counties(manifest, ['153', '059'])
+    assert not covers_counties(manifest, None)
+    assert tract_artifact_version(out_dir, county_fps=['153']) is not None
+    assert tract_artifact_version(out_dir, county_fps=['153', '059']) is None
+    assert load_tract_artifact(out_dir, county_fps=['059']) == (None, None)
@@ -0,0 +1,28 @@
+import os
+
+from nsi_dash.assets import plan_assets, publish_assets
+from nsi_dash.compress import select_variant
+
+
+def test_publish_writes_each_version_once_without_variants(tmp_path):
+    urls, files = plan_assets({'tract_data': '{"a":1}', 'tract_columns': b'\x00\x01'})
+    assert urls['tract_data'].endswith('.json?v=' + urls['tract_data'].split('?v=')[1])
+
+    written = publish_assets(files, static_dir=str(tmp_path))
+    assert len(written) == 2
+    assert sorted(os.listdir(tmp_path / 'map')) == sorted(os.path.basename(path) for path in files)
+    assert publish_assets(files, static_dir=str(tmp_path)) == []
+
+    # A new version of one asset replaces the old one
+    _, new_files = plan_assets({'tract_data': '{"a":2}', 'tract_columns': b'\x00\x01'})
+    publish_assets(new_files, static_dir=str(tmp_path))
+    assert sorted(os.listdir(tmp_path / 'map')) == sorted(os.path.basename(path) for path in new_files)
+
+
+def test_select_variant_prefers_accepted_encodings(tmp_path):
+    path = tmp_path / 'page.html'
+    path.write_text('x')
+    (tmp_path / 'page.html.gz').write_bytes(b'gz')
+    assert select_variant(str(path), 'gzip, deflate') == (str(path) + '.gz', 'gzip')
+    assert select_variant(str(path), 'br;q=1.0, gzip;q=0') == (str(path), None)
+    assert select_variant(str(path), None) == (str(path), None)
@@ -0,0 +1,53 @@
+import copy
+import json
+
+from nsi_dash import bench
+from nsi_dash.bench import regressions
+
+
+def _report(seconds=1.0, peak_mb=10.0, page=1000):
+    return {'1': {
+        'tracts': 92,
+        'stages': {
+            'merge': {'seconds': 0.5, 'peak_mb': 5.0, 'rows': 92},
+            'tract_data': {'seconds': seconds, 'peak_mb': peak_mb, 'rows': 92},
+        },
+        'bytes': {'page': page, 'page_gzip': page // 4, 'payloads': {'tract_data': 400}},
+    }}
+
+
+def test_regressions_over_tolerance():
+    baseline = _report()
+    assert regressions(_report(), baseline) == []
+    # Within the tolerance, or slower only by less than the noise floor
+    assert regressions(_report(seconds=1.4), baseline, tolerance=0.5) == []
+    assert regressions(_report(seconds=1.0 + bench.SECONDS_FLOOR / 2), baseline, tolerance=0.0) == []
+
+    messages = regressions(_report(seconds=1.4, peak_mb=20.0, page=1100), baseline, tolerance=0.3)
+    assert len(messages) == 3
+    assert messages[0].startswith('1x tract_data: 1.400 s')
+    assert messages[1].startswith('1x tract_data: 20.000 MB')
+    assert messages[2].startswith('1x page: 1100 bytes')
+    # Scales and stages without a baseline are not compared
+    assert regressions({'10': _report(seconds=9.0)['1']}, baseline) == []
+    stages = copy.deepcopy(baseline)
+    del stages['1']['stages']['tract_data']
+    assert regressions(_report(seconds=9.0), stages) == []
+
+
+def test_main_exit_code(tmp_path, monkeypatch, capsys):
+    baseline_path = str(tmp_path / 'baseline.json')
+    report = _report()
+    monkeypatch.setattr(bench, 'benchmark', lambda scales, repeat: report)
+
+    assert bench.main(['--scales', '1', '--baseline', baseline_path]) == 0
+    assert 'No baseline' in capsys.readouterr().out
+    assert bench.main(['--scales', '1', '--baseline', baseline_path, '--save-baseline']) == 0
+    with open(baseline_path) as f:
+        assert json.load(f) == report
+
+    assert bench.main(['--scales', '1', '--baseline', baseline_path, '--tolerance', '0.3']) == 0
+    report = _report(seconds=2.0)
+    assert bench.main(['--scales', '1', '--baseline', baseline_path, '--tolerance', '0.3']) == 1
+    assert 'Regression: 1x tract_data: 2.000 s, baseline 1.000 s' in capsys.readouterr().out
+    assert bench.main(['--scales', '1', '--baseline', baseline_path, '--tolerance', '1.5']) == 0
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from nsi_dash.columnar import MAGIC, decode_columns, encode_columns
+
+
+def _tables():
+    return {
+        'display': pd.DataFrame({
+            'percent_homeowners': ['50%', 'N/A', '25%', '50%'],
+            'Median_Age': ['35 years', '41 years', None, np.nan],
+        }),
+        'direction': pd.DataFrame({
+            'percent_homeowners': np.array([1, 0, -1, 1], dtype=np.int8),
+            'Median_Age': np.array([-1, 1, 0, 0], dtype=np.int8),
+        }),
+    }
+
+
+def test_round_trip():
+    data = encode_columns(_tables())
+    assert data[:4] == MAGIC
+    decoded = decode_columns(data)
+
+    assert decoded['display']['percent_homeowners'] == ['50%', 'N/A', '25%', '50%']
+    assert decoded['display']['Median_Age'] == ['35 years', '41 years', None, None]
+    for name, flags in _tables()['direction'].items():
+        assert decoded['direction'][name].dtype == np.int8
+        assert decoded['direction'][name].tolist() == flags.tolist()
+
+
+def test_columns_are_aligned_and_strings_shared():
+    data = encode_columns(_tables())
+    decoded = decode_columns(data)
+    start = np.frombuffer(data, dtype=np.uint8).ctypes.data
+    assert all((values.ctypes.data - start) % 8 == 0 for values in decoded['direction'].values())
+    # Repeated strings are stored once in the dictionary
+    assert data.count(b'"50%"') == 1
+
+
+def test_only_text_and_int8_columns_are_encoded():
+    with pytest.raises(ValueError):
+        encode_columns({'values': pd.DataFrame({'Population': [1200.0, 3400.0]})})
+    with pytest.raises(ValueError):
+        encode_columns({'a': pd.DataFrame({'x': ['1', '2']}), 'b': pd.DataFrame({'y': ['1']})})
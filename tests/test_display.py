@@ -0,0 +1,165 @@
+import json
+import math
+import shutil
+import subprocess
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from nsi_dash.display import (ABOVE_AVERAGE, BELOW_AVERAGE, MISSING_TEXT, NEAR_AVERAGE, direction_flags,
+                              display_frames, format_class, format_values, js_number, js_round, js_to_fixed)
+from nsi_dash.loaders import read_profile_data
+from nsi_dash.thresholds import compute_variable_thresholds
+from nsi_dash.variables import filter_domain_categories, reverse_variables
+
+
+def test_format_class():
+    assert format_class('Owner_occupied_P') == 'percent'
+    assert format_class('percent_homeowners') == 'percent'
+    assert format_class('Work_Walk_P') == 'percent'
+    # Names with a percent marker and an exception are plain numbers
+    assert format_class('LIFEEXPPCT') == 'number'
+    assert format_class('EMS_Calls_P') == 'number'
+    assert format_class('Median_Age') == 'years'
+    assert format_class('Income_Ratio') == 'ratio'
+    assert format_class('PTRAF') == 'number'
+
+
+def test_js_rounding():
+    assert js_round(np.array([2.5, -2.5, 0.49999999999999994, -0.5, 1.5])).tolist() == [3, -2, 0, -0, 2]
+    # toFixed rounds the exact binary value: 1.005 is 1.00499999999999989...
+    assert [js_to_fixed(value) for value in (1.005, 1.125, 2.5, -1.125, 0.0, -0.0, -0.001, 1e21)] == \
+        ['1.00', '1.13', '2.50', '-1.13', '0.00', '0.00', '-0.00', '1e+21']
+    assert [js_number(value) for value in (0.0, 2.0, 0.1 + 0.2, 1e-7, 1.5e21, 123.45, float('nan'))] == \
+        ['0', '2', '0.30000000000000004', '1e-7', '1.5e+21', '123.45', 'NaN']
+
+
+def test_format_values():
+    values = [0.125, 0.005, 1.0, 45.5, np.nan]
+    assert format_values(values, 'percent') == ['13%', '1%', '1%', '46%', 'NaN%']
+    # 2.675 * 100 is exactly 267.5 in binary, and Math.round takes -100.49999... up to -100
+    assert format_values([2.675, 10.0, -1.005], 'number') == ['2.68', '10', '-1']
+    assert format_values([34.5, 34.49], 'years') == ['35 years', '34 years']
+    assert format_values([1.005, 3.0], 'ratio') == ['1.00', '3.00']
+
+
+def test_direction_flags():
+    thresholds = {'p33': 10.0, 'p67': 20.0, 'reverse': False}
+    flags = direction_flags([15.0, 15.000001, 2.0, np.nan], thresholds)
+    assert flags.dtype == np.int8
+    # At the midpoint counts as below, like the page's `value > median`
+    assert flags.tolist() == [BELOW_AVERAGE, ABOVE_AVERAGE, BELOW_AVERAGE, NEAR_AVERAGE]
+    # Reversed variables compare the same way; without thresholds nothing is flagged
+    assert direction_flags([15.000001], dict(thresholds, reverse=True)).tolist() == [ABOVE_AVERAGE]
+    assert direction_flags([1.0, 2.0], None).tolist() == [NEAR_AVERAGE, NEAR_AVERAGE]
+
+
+def test_display_frames_text_and_missing_values():
+    frame = pd.DataFrame({
+        'percent_homeowners': [0.5, None, 0.25],
+        'Notes_Ratio': ['1.005', 'n/a', ''],
+    })
+    display, direction = display_frames(frame, {'percent_homeowners': {'p33': 0.2, 'p67': 0.4}})
+    assert display['percent_homeowners'].tolist() == ['50%', MISSING_TEXT, '25%']
+    # Text is read like parseFloat; unreadable text is shown as it is, blanks as missing
+    assert display['Notes_Ratio'].tolist() == ['1.00', 'n/a', MISSING_TEXT]
+    assert direction['percent_homeowners'].tolist() == [ABOVE_AVERAGE, NEAR_AVERAGE, BELOW_AVERAGE]
+    assert direction['Notes_Ratio'].tolist() == [NEAR_AVERAGE] * 3
+
+
+# The page's createVariableList formatting and getOpportunityDirection before
+# the display strings were computed ahead of time
+BASELINE_SCRIPT = r"""
+function getOpportunityDirection(value, variable) {
+    var numValue = parseFloat(value);
+    if (isNaN(numValue)) return 'near-average';
+    var threshold = variableThresholds[variable];
+    if (!threshold) return 'near-average';
+    var median = (threshold.p33 + threshold.p67) / 2;
+    return numValue > median ? 'above-average' : 'below-average';
+}
+
+function displayValue(value, variable) {
+    var displayValue = 'N/A';
+    if (value !== null && value !== undefined && value !== '') {
+        var numValue = parseFloat(value);
+        if (!isNaN(numValue)) {
+            var isPercentage = (variable.includes('PCT') || variable.includes('_P') ||
+                              variable.includes('Percent_') || variable.includes('percent_') ||
+                              variable.includes('Work_') || variable.includes('With_') ||
+                              variable.includes('Owner_occupied') || variable.includes('House_Vacant') ||
+                              variable.includes('Prop_')) &&
+                              !variable.includes('Calls') && !variable.includes('_Calls') &&
+                              !variable.includes('EMS') && !variable.includes('Medical') &&
+                              !variable.includes('Violence') && !variable.includes('Opioid') &&
+                              !variable.includes('Fires') && !variable.includes('Homeless') &&
+                              !variable.includes('VMC') && !variable.includes('SFPC') &&
+                              !variable.includes('Vegetation') && !variable.includes('LIFEEXPPCT') &&
+                              !variable.includes('PM25') && !variable.includes('OZONE') &&
+                              !variable.includes('NO2') && !variable.includes('PTRAF') &&
+                              !variable.includes('Total_Population') && !variable.includes('Median_Age');
+
+            if (isPercentage && numValue < 1) {
+                displayValue = Math.round(numValue * 100) + '%';
+            } else if (isPercentage && numValue >= 1) {
+                displayValue = Math.round(numValue) + '%';
+            } else if (variable === 'Median_Age') {
+                displayValue = Math.round(numValue) + ' years';
+            } else if (variable.includes('Ratio')) {
+                displayValue = numValue.toFixed(2);
+            } else {
+                displayValue = Math.round(numValue * 100) / 100;
+            }
+        } else {
+            displayValue = value;
+        }
+    }
+    return String(displayValue);
+}
+
+var input = JSON.parse(require('fs').readFileSync(0, 'utf8'));
+var variableThresholds = input.thresholds;
+var out = {};
+Object.keys(input.columns).forEach(function(variable) {
+    out[variable] = input.columns[variable].map(function(value) {
+        return [displayValue(value, variable), getOpportunityDirection(value, variable)];
+    });
+});
+process.stdout.write(JSON.stringify(out));
+"""
+
+FLAGS = {'above-average': ABOVE_AVERAGE, 'below-average': BELOW_AVERAGE, 'near-average': NEAR_AVERAGE}
+
+
+def _json_value(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return value.item() if isinstance(value, np.generic) else value
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason="needs Node.js to run the baseline script")
+def test_display_matches_the_baseline_page_script():
+    profile = read_profile_data()
+    variables = list(dict.fromkeys(variable for variables in filter_domain_categories(profile.columns).values()
+                                   for variable in variables))
+    frame = pd.DataFrame(profile[variables])
+    # Half-way and boundary values in every format class
+    edge_values = [0.125, 0.005, 0.995, 1.0, 1.005, 2.675, -1.005, 34.5, 0.0, -0.0, 1e-7, 1e21, 123456.785, None]
+    edges = pd.DataFrame({
+        'percent_edge': edge_values, 'Median_Age': edge_values, 'Edge_Ratio': edge_values, 'PTRAF_edge': edge_values,
+        'Text_Ratio': ['1.005', '12abc', 'abc', '', ' 7.5', '-0', 'Infinity', '.5', '1e3', '0x10', None, '3', '4', '5'],
+    })
+    thresholds = compute_variable_thresholds(profile, variables, reverse_variables)
+    thresholds.update({name: {'p33': 0.1, 'p67': 2.0, 'reverse': False} for name in edges.columns})
+
+    for data in (frame, edges):
+        columns = {variable: [_json_value(value) for value in data[variable].tolist()] for variable in data.columns}
+        result = subprocess.run(['node', '-e', BASELINE_SCRIPT],
+                                input=json.dumps({'columns': columns, 'thresholds': thresholds}),
+                                capture_output=True, text=True, check=True)
+        expected = json.loads(result.stdout)
+        display, direction = display_frames(data, thresholds)
+        for variable in data.columns:
+            assert display[variable].tolist() == [text for text, flag in expected[variable]], variable
+            assert direction[variable].tolist() == [FLAGS[flag] for text, flag in expected[variable]], variable
@@ -0,0 +1,138 @@
+import re
+
+import pandas as pd
+
+from nsi_dash.districts import NOT_AVAILABLE, district_names, district_proportions, district_strings, summarize_districts
+from nsi_dash.loaders import read_profile_data
+
+
+# The per-tract parser that district_proportions and summarize_districts replaced
+def parse_district_info(district_str):
+    """Parse district string that may contain proportions like 'WOODBRIDGE:100%' or 'COLES:39.91%,POTOMAC:60.09%' or 'GAINESVILLE15.18%'"""
+
+    if district_str == 'Not Available' or not district_str:
+        return {
+            'districts': [],
+            'proportions': {},
+            'display_text': 'Not Available',
+            'is_multi_district': False,
+            'primary_district': 'Not Available'
+        }
+
+    # Split by comma to handle multiple districts
+    district_parts = [part.strip() for part in district_str.split(',')]
+
+    districts = []
+    proportions = {}
+
+    for part in district_parts:
+        if ':' in part:
+            # Format: "DISTRICT:PROPORTION%"
+            district_name, proportion_str = part.split(':', 1)
+            district_name = district_name.strip()
+            proportion_str = proportion_str.strip().replace('%', '')
+
+            try:
+                proportion = float(proportion_str)
+                districts.append(district_name)
+                proportions[district_name] = proportion
+            except ValueError:
+                # If proportion parsing fails, treat as district name only
+                districts.append(district_name)
+                proportions[district_name] = 100.0
+        else:
+            # Check if there's a percentage without a colon (e.g., "GAINESVILLE15.18%")
+            # Use regex to find digits followed by %
+            match = re.search(r'(\d+\.?\d*)%$', part)
+            if match:
+                # Extract district name (everything before the percentage)
+                proportion_str = match.group(1)
+                district_name = part[:match.start()].strip()
+
+                try:
+                    proportion = float(proportion_str)
+                    districts.append(district_name)
+                    proportions[district_name] = proportion
+                except ValueError:
+                    # If proportion parsing fails, treat as district name only
+                    districts.append(part)
+                    proportions[part] = 100.0
+            else:
+                # Format: "DISTRICT" (no proportion)
+                districts.append(part)
+                proportions[part] = 100.0
+
+    # Determine primary district (highest proportion)
+    primary_district = max(proportions.keys(), key=lambda k: proportions[k]) if proportions else 'Not Available'
+
+    # Create display text
+    if len(districts) == 1:
+        display_text = districts[0]
+    else:
+        # Sort by proportion (descending) for display
+        sorted_districts = sorted(districts, key=lambda d: proportions[d], reverse=True)
+        display_parts = []
+        for district in sorted_districts:
+            prop = proportions[district]
+            if prop == 100.0:
+                display_parts.append(district)
+            else:
+                display_parts.append(f"{district} ({prop:.2f}%)")
+        display_text = ', '.join(display_parts)
+
+    is_multi_district = len(districts) > 1
+
+    return {
+        'districts': districts,
+        'proportions': proportions,
+        'display_text': display_text,
+        'is_multi_district': is_multi_district,
+        'primary_district': primary_district
+    }
+
+
+
+EDGE_CASES = [
+    'WOODBRIDGE:100%',
+    'COLES:39.91%,POTOMAC:60.09%',
+    'GAINESVILLE15.18%',
+    'GAINESVILLE15.18%, BRENTSVILLE84.82%',
+    'COLES',
+    'COLES, POTOMAC',
+    'COLES:abc%,POTOMAC:50%',
+    'COLES:50%,COLES:30%,POTOMAC:20%',
+    'POTOMAC:50%, COLES:50%',
+    'COLES:100,NEABSCO',
+    ' OCCOQUAN : 12.5% , WOODBRIDGE:87.5%',
+    'Not Available',
+    '',
+]
+
+
+def _compare(strings):
+    raw = pd.Series(strings, index=pd.Index([f"t{i}" for i in range(len(strings))], name='CensusTract'))
+    table = district_proportions(raw)
+    summary = summarize_districts(table, raw.index)
+    for tract, text in raw.items():
+        expected = parse_district_info(text)
+        row = summary.loc[tract]
+        assert row['districts'] == expected['districts'], text
+        assert row['proportions'] == expected['proportions'], text
+        assert list(row['proportions']) == list(expected['proportions']), text
+        assert row['display_text'] == expected['display_text'], text
+        assert bool(row['is_multi_district']) == expected['is_multi_district'], text
+        assert row['primary_district'] == expected['primary_district'], text
+    return table
+
+
+def test_summary_matches_the_per_tract_parser_on_edge_cases():
+    table = _compare(EDGE_CASES)
+    assert NOT_AVAILABLE not in table['district'].tolist()
+    assert 'GAINESVILLE' in district_names(table)
+    assert district_names(table) == sorted(district_names(table))
+
+
+def test_summary_matches_the_per_tract_parser_on_the_profile():
+    profile = read_profile_data()
+    raw = district_strings(profile.drop_duplicates('CensusTract'))
+    _compare(raw.tolist())
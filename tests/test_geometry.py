@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+import shapely
+
+from nsi_dash.geometry import DEFAULT_ZOOM_TOLERANCES, TractTopology, _simplify_arcs, to_shapely
+from nsi_dash.loaders import TRACTS_GEOJSON, read_census_tracts, read_profile_data
+from nsi_dash.pipeline import prepare_tracts
+
+
+@pytest.fixture(scope='module')
+def geometries():
+    return prepare_tracts(read_profile_data(), read_census_tracts(TRACTS_GEOJSON), ['153']).geometry.values
+
+
+def _segment_distances(points, line):
+    return shapely.distance(shapely.points(points), shapely.LineString(line))
+
+
+def test_simplify_arcs_keeps_points_within_tolerance():
+    rng = np.random.default_rng(0)
+    walk = np.column_stack([np.arange(200) * 10, np.cumsum(rng.normal(0, 30, 200))]).round().astype(np.int64)
+    line = np.array([[0, 0], [1, 1], [2, 2], [3, 3]], dtype=np.int64)
+    ring = np.array([[0, 0], [40, 0], [40, 40], [0, 40], [0, 0]], dtype=np.int64)
+    arcs = [walk, line, ring]
+    for tolerance in (5, 20, 100):
+        simplified = _simplify_arcs(arcs, tolerance)
+        assert len(simplified) == len(arcs)
+        for arc, result in zip(arcs, simplified):
+            assert (result[0] == arc[0]).all() and (result[-1] == arc[-1]).all()
+        # Kept points are a subsequence and every dropped point is near the result
+        walk_result = simplified[0]
+        assert len(walk_result) < len(walk)
+        assert np.isin(walk_result[:, 0], walk[:, 0]).all() and (np.diff(walk_result[:, 0]) > 0).all()
+        assert _segment_distances(walk, walk_result).max() <= tolerance + 1e-9
+        assert simplified[1].tolist() == [[0, 0], [3, 3]]
+
+    assert all((result == arc).all() for arc, result in zip(arcs, _simplify_arcs(arcs, 0)))
+    # A closed arc keeps its end points and the point farthest from them
+    assert len(_simplify_arcs([ring], 5)[0]) >= 3
+
+
+def test_full_detail_coordinates_are_the_quantized_outlines(geometries):
+    topology = TractTopology(geometries)
+    shapes = to_shapely(topology.coordinates(0))
+    assert len(shapes) == len(geometries)
+    # Every vertex moves by at most half a grid cell in each direction
+    half_cell = 0.5 * 10 ** -topology.precision
+    for shape, original in zip(shapes, geometries):
+        assert shapely.get_num_geometries(shape) == shapely.get_num_geometries(original)
+        assert shapely.hausdorff_distance(shape, original) <= half_cell * np.sqrt(2) + 1e-12
+
+
+def test_neighbours_share_boundaries_when_simplified(geometries):
+    topology = TractTopology(geometries)
+    # Most tracts share their edges with neighbours
+    assert len(topology.arcs) < sum(len(ring) for polygons in topology.features for rings in polygons
+                                    for ring in rings)
+    for tolerance in DEFAULT_ZOOM_TOLERANCES.values():
+        shapes = to_shapely(topology.coordinates(tolerance * 10))
+        total = sum(shape.area for shape in shapes)
+        union = shapely.union_all(shapes)
+        original = shapely.union_all(shapely.make_valid(geometries))
+        # No overlaps between neighbours and no gaps opened inside the county
+        assert total == pytest.approx(union.area, rel=1e-6)
+        assert union.area == pytest.approx(original.area, rel=1e-3)
+
+
+def _decode(topology_json, arcs):
+    """The page's decodeArcs and stitchRing in Python."""
+    scale = topology_json['transform']['scale']
+    translate = topology_json['transform']['translate']
+    decoded = []
+    for arc in arcs:
+        positions = np.cumsum(np.asarray(arc, dtype=np.float64), axis=0)
+        decoded.append(positions * scale + translate)
+
+    features = []
+    for geometry in topology_json['objects']['tracts']['geometries']:
+        polygons = [geometry['arcs']] if geometry['type'] == 'Polygon' else geometry['arcs']
+        coordinates = []
+        for rings in polygons:
+            ring_coordinates = []
+            for position, refs in enumerate(rings):
+                parts = [decoded[ref] if ref >= 0 else decoded[~ref][::-1] for ref in refs]
+                ring = np.concatenate([parts[0]] + [part[1:] for part in parts[1:]])
+                if position == 0 or len(ring) >= 4:
+                    ring_coordinates.append(ring)
+            coordinates.append(ring_coordinates)
+        features.append((geometry['type'], coordinates[0] if geometry['type'] == 'Polygon' else coordinates))
+    return features
+
+
+def test_topojson_round_trip(geometries):
+    topology = TractTopology(geometries)
+    keys = [f"tract {i}" for i in range(len(geometries))]
+    topology_json = topology.to_topojson(ids=list(range(len(keys))),
+                                        properties=[{'CensusTract': key} for key in keys])
+    geometries_json = topology_json['objects']['tracts']['geometries']
+    assert [geometry['properties']['CensusTract'] for geometry in geometries_json] == keys
+
+    zooms = sorted(DEFAULT_ZOOM_TOLERANCES)
+    levels = {zooms[0]: topology_json['arcs']}
+    levels.update({int(zoom): arcs for zoom, arcs in topology_json['levels'].items()})
+    assert sorted(levels) == zooms
+    for zoom in zooms:
+        expected = topology.coordinates(DEFAULT_ZOOM_TOLERANCES[zoom])
+        decoded = _decode(topology_json, levels[zoom])
+        for (expected_type, expected_coordinates), (decoded_type, decoded_coordinates) in zip(expected, decoded):
+            assert decoded_type == expected_type
+            for expected_shape, decoded_shape in zip(to_shapely([(expected_type, expected_coordinates)]),
+                                                     to_shapely([(decoded_type, decoded_coordinates)])):
+                assert shapely.equals_exact(expected_shape, decoded_shape, tolerance=1e-9)
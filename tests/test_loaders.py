@@ -0,0 +1,62 @@
+import functools
+import json
+import os
+
+from nsi_dash.loaders import _cached_load, file_fingerprint
+
+
+def _write(path, data, mtime_ns=None):
+    with open(path, 'w') as f:
+        json.dump(data, f)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_fingerprint_follows_mtime_and_content(tmp_path):
+    path = str(tmp_path / 'a.geojson')
+    _write(path, {'value': 1}, mtime_ns=1_000_000_000)
+    first = file_fingerprint(path)
+    assert first[0] == os.path.abspath(path) and first[1] == 1_000_000_000
+
+    # Touched but unchanged: new mtime, same content hash
+    os.utime(path, ns=(2_000_000_000, 2_000_000_000))
+    touched = file_fingerprint(path)
+    assert touched[1] == 2_000_000_000 and touched[2] == first[2]
+
+    _write(path, {'value': 2}, mtime_ns=3_000_000_000)
+    assert file_fingerprint(path)[2] != first[2]
+
+
+def test_shapefile_fingerprint_covers_the_sidecar_files(tmp_path):
+    for suffix in ('.shp', '.shx', '.dbf'):
+        (tmp_path / f"tracts{suffix}").write_bytes(b'x')
+    path = str(tmp_path / 'tracts.shp')
+    before = file_fingerprint(path)
+    (tmp_path / 'tracts.dbf').write_bytes(b'y')
+    assert file_fingerprint(path)[2] != before[2]
+
+
+def test_a_changed_file_is_reloaded_without_dropping_other_files(tmp_path):
+    # Streamlit only caches inside a running app, so stand in for the cache with a memo by key
+    calls = []
+
+    @functools.lru_cache(maxsize=4)
+    def loader(path, mtime_ns, digest):
+        calls.append(path)
+        with open(path) as f:
+            return json.load(f)
+
+    changed = str(tmp_path / 'changed.geojson')
+    other = str(tmp_path / 'other.geojson')
+    _write(changed, {'value': 1})
+    _write(other, {'value': 'other'})
+
+    first = _cached_load(loader, changed)
+    other_first = _cached_load(loader, other)
+    assert _cached_load(loader, changed) is first and len(calls) == 2
+
+    _write(changed, {'value': 2}, mtime_ns=os.stat(changed).st_mtime_ns + 1_000_000_000)
+    assert _cached_load(loader, changed) == {'value': 2}
+    # Other files, possibly in use by other sessions, stay cached
+    assert _cached_load(loader, other) is other_first
+    assert calls == [os.path.abspath(changed), os.path.abspath(other), os.path.abspath(changed)]
@@ -0,0 +1,30 @@
+import pytest
+
+from nsi_dash.loaders import TRACTS_GEOJSON, read_census_tracts, read_profile_data
+from nsi_dash.map_page import CANVAS_MIN_FEATURES, build_map_html, choose_renderer
+from nsi_dash.pipeline import prepare_tracts
+from nsi_dash.thresholds import compute_variable_thresholds
+from nsi_dash.variables import filter_domain_categories, reverse_variables
+
+
+def test_choose_renderer():
+    assert choose_renderer(0) == 'svg'
+    assert choose_renderer(CANVAS_MIN_FEATURES - 1) == 'svg'
+    assert choose_renderer(CANVAS_MIN_FEATURES) == 'canvas'
+    assert choose_renderer(CANVAS_MIN_FEATURES, 'svg') == 'svg'
+    assert choose_renderer(1, 'canvas') == 'canvas'
+    with pytest.raises(ValueError):
+        choose_renderer(1, 'webgl')
+
+
+def test_page_uses_the_chosen_renderer():
+    profile = read_profile_data()
+    grouped_data = prepare_tracts(profile, read_census_tracts(TRACTS_GEOJSON), ['153'])
+    domain_categories = filter_domain_categories(profile.columns)
+    thresholds = compute_variable_thresholds(
+        profile, [variable for variables in domain_categories.values() for variable in variables], reverse_variables)
+
+    assert len(grouped_data) < CANVAS_MIN_FEATURES
+    assert "var tractRenderer = 'svg';" in build_map_html(grouped_data, domain_categories, thresholds)
+    assert "var tractRenderer = 'canvas';" in build_map_html(grouped_data, domain_categories, thresholds,
+                                                             renderer='canvas')
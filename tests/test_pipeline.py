@@ -0,0 +1,87 @@
+import warnings
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+import shapely
+
+from nsi_dash.loaders import TRACTS_GEOJSON, read_census_tracts, read_profile_data
+from nsi_dash.pipeline import combine_districts, filter_counties, filter_profile_counties, merge_profile_with_tracts
+
+
+# The per-tract combination that combine_districts replaced
+def combine_districts_for_tract(tract_df):
+    if len(tract_df) == 1:
+        row = tract_df.iloc[0].copy()
+        if 'District_combined' not in row or pd.isna(row['District_combined']):
+            row['District_combined'] = row['District'] if pd.notna(row['District']) else 'Not Available'
+        return row
+
+    row = tract_df.iloc[0].copy()
+    if 'District_combined' in tract_df.columns:
+        district_combined_values = tract_df['District_combined'].dropna()
+        if len(district_combined_values) > 0:
+            row['District_combined'] = district_combined_values.iloc[0]
+            return row
+
+    districts = tract_df['District'].dropna()
+    districts = districts[districts.str.strip() != '']
+    unique_districts = districts.unique()
+    if len(unique_districts) > 1:
+        row['District_combined'] = ', '.join(sorted(unique_districts))
+    else:
+        row['District_combined'] = unique_districts[0] if len(unique_districts) > 0 else 'Not Available'
+    return row
+
+
+def _reference(merged_data):
+    with warnings.catch_warnings():
+        # The baseline applied over the grouping column too, which pandas deprecates
+        warnings.simplefilter('ignore', FutureWarning)
+        return merged_data.groupby('CensusTract').apply(combine_districts_for_tract).reset_index(drop=True)
+
+
+def _assert_same(combined, expected):
+    assert combined['CensusTract'].tolist() == expected['CensusTract'].tolist()
+    assert combined['District_combined'].tolist() == expected['District_combined'].tolist()
+    for column in expected.columns.drop('District_combined'):
+        if column == 'geometry':
+            assert all(a.equals(b) for a, b in zip(combined.geometry, expected['geometry']))
+        else:
+            pd.testing.assert_series_equal(combined[column].reset_index(drop=True).astype(object),
+                                           expected[column].reset_index(drop=True).astype(object),
+                                           check_names=False)
+
+
+def test_combine_matches_the_per_tract_combination_on_the_profile():
+    profile = read_profile_data()
+    tracts = filter_counties(read_census_tracts(TRACTS_GEOJSON), ['153'])
+    merged_data = merge_profile_with_tracts(filter_profile_counties(profile, ['153']), tracts)
+    assert merged_data['CensusTract'].duplicated().any()
+
+    combined = combine_districts(merged_data)
+    assert combined['CensusTract'].is_unique
+    assert combined.crs == merged_data.crs
+    _assert_same(combined, _reference(merged_data))
+
+
+@pytest.mark.parametrize('with_combined', [True, False])
+def test_combine_matches_the_per_tract_combination_on_edge_cases(with_combined):
+    box = shapely.box(0, 0, 1, 1)
+    frame = pd.DataFrame({
+        'CensusTract': ['3', '1', '1', '2', '2', '2', '4', '5', '5', '6'],
+        'District': ['COLES', 'POTOMAC', 'COLES', 'NEABSCO', ' ', np.nan, np.nan, 'OCCOQUAN', 'OCCOQUAN', ''],
+        'District_combined': [np.nan, np.nan, 'COLES:40%,POTOMAC:60%', np.nan, np.nan, np.nan, np.nan,
+                              np.nan, np.nan, np.nan],
+        'Value': [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0],
+    })
+    if not with_combined:
+        frame = frame.drop(columns='District_combined')
+    merged_data = gpd.GeoDataFrame(frame, geometry=[box] * len(frame))
+
+    combined = combine_districts(merged_data)
+    _assert_same(combined, _reference(merged_data))
+    if with_combined:
+        assert combined['District_combined'].tolist() == [
+            'COLES:40%,POTOMAC:60%', 'NEABSCO', 'COLES', 'Not Available', 'OCCOQUAN', '']
@@ -0,0 +1,96 @@
+import json
+import shutil
+import subprocess
+
+import numpy as np
+import pytest
+
+from nsi_dash.geometry import DEFAULT_PRECISION
+from nsi_dash.loaders import TRACTS_GEOJSON, read_census_tracts, read_profile_data
+from nsi_dash.map_page import build_map_html
+from nsi_dash.payload import tract_bounds
+from nsi_dash.pipeline import prepare_tracts
+from nsi_dash.thresholds import compute_variable_thresholds
+from nsi_dash.variables import filter_domain_categories, reverse_variables
+
+
+@pytest.fixture(scope='module')
+def inputs():
+    profile = read_profile_data()
+    grouped_data = prepare_tracts(profile, read_census_tracts(TRACTS_GEOJSON), ['153'])
+    domain_categories = filter_domain_categories(profile.columns)
+    thresholds = compute_variable_thresholds(
+        profile, [variable for variables in domain_categories.values() for variable in variables], reverse_variables)
+    return grouped_data, domain_categories, thresholds
+
+
+def test_tract_bounds_hold_the_outlines(inputs):
+    grouped_data = inputs[0]
+    payload = tract_bounds(grouped_data, DEFAULT_PRECISION)
+    assert payload['keys'] == grouped_data['CensusTract'].tolist()
+    bounds = np.array(payload['bounds']).reshape(-1, 4)
+    exact = grouped_data.geometry.bounds.to_numpy()
+    assert (bounds[:, :2] <= exact[:, :2]).all() and (bounds[:, 2:] >= exact[:, 2:]).all()
+    assert np.abs(bounds - exact).max() < 10 ** -DEFAULT_PRECISION
+    assert 'keys' not in tract_bounds(grouped_data, DEFAULT_PRECISION, keys=False)
+
+
+SEARCH_SCRIPT = """
+var input = JSON.parse(require('fs').readFileSync(0, 'utf8'));
+var results = input.queries.map(function(query) {
+    var tree = new PackedRTree(query.boxes, query.nodeSize);
+    return query.searches.map(function(box) {
+        return tree.search(box[0], box[1], box[2], box[3]).sort(function(a, b) { return a - b; });
+    });
+});
+process.stdout.write(JSON.stringify(results));
+"""
+
+
+def _page_rtree(page):
+    """The page's PackedRTree and hilbertIndex functions."""
+    start = page.index('function PackedRTree(')
+    hilbert = page.index('function hilbertIndex(')
+    end = page.index('return d;', hilbert)
+    end = page.index('}', end) + 1
+    return page[start:end]
+
+
+def _brute_force(boxes, box):
+    boxes = np.asarray(boxes).reshape(-1, 4)
+    west, south, east, north = box
+    hits = ~((east < boxes[:, 0]) | (north < boxes[:, 1]) | (west > boxes[:, 2]) | (south > boxes[:, 3]))
+    return np.flatnonzero(hits).tolist()
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason="needs Node.js to run the page's script")
+def test_page_rtree_search_matches_brute_force(inputs):
+    page = build_map_html(*inputs)
+    rng = np.random.default_rng(0)
+    tract_boxes = tract_bounds(inputs[0], DEFAULT_PRECISION)['bounds']
+    queries = []
+    for boxes, node_size in [(tract_boxes, 16), (tract_boxes, 4), ([], 16), ([0, 0, 1, 1], 16)]:
+        queries.append({'boxes': boxes, 'nodeSize': node_size, 'searches': []})
+    for n in (1, 17, 300, 1000):
+        corners = rng.uniform(0, 100, (n, 2))
+        boxes = np.column_stack([corners, corners + rng.uniform(0, 5, (n, 2))]).ravel().tolist()
+        queries.append({'boxes': boxes, 'nodeSize': 16, 'searches': []})
+
+    for query in queries:
+        if query['boxes']:
+            boxes = np.asarray(query['boxes'], dtype=np.float64).reshape(-1, 4)
+            low, high = boxes[:, :2].min(axis=0), boxes[:, 2:].max(axis=0)
+        else:
+            low, high = np.zeros(2), np.ones(2)
+        for _ in range(50):
+            a, b = rng.uniform(low, high, (2, 2))
+            query['searches'].append(np.concatenate([np.minimum(a, b), np.maximum(a, b)]).tolist())
+        # Points, and a box around everything
+        query['searches'].append(np.concatenate([low, low]).tolist())
+        query['searches'].append(np.concatenate([low - 1, high + 1]).tolist())
+
+    result = subprocess.run(['node', '-e', _page_rtree(page) + SEARCH_SCRIPT], input=json.dumps({'queries': queries}),
+                            capture_output=True, text=True, check=True)
+    for query, found in zip(queries, json.loads(result.stdout)):
+        for box, hits in zip(query['searches'], found):
+            assert hits == _brute_force(query['boxes'], box)
@@ -0,0 +1,177 @@
+import json
+import shutil
+import subprocess
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from nsi_dash.loaders import TRACTS_GEOJSON, read_census_tracts, read_profile_data
+from nsi_dash.map_page import build_map_html, scenario_message
+from nsi_dash.pipeline import prepare_tracts
+from nsi_dash.scenario import Scenario, SortedColumn
+from nsi_dash.thresholds import compute_variable_thresholds
+from nsi_dash.variables import filter_domain_categories, reverse_variables
+from nsi_dash.weighting import INDEX_LEVELS, TIER_NAMES, WEIGHTED_DOMAINS, DomainWeighting, domain_scores, tier_names
+
+
+@pytest.fixture(scope='module')
+def inputs():
+    profile = read_profile_data()
+    grouped_data = prepare_tracts(profile, read_census_tracts(TRACTS_GEOJSON), ['153'])
+    domain_categories = filter_domain_categories(profile.columns)
+    return profile, grouped_data, domain_categories
+
+
+def _scenario(profile, grouped_data, domain_categories):
+    thresholds = compute_variable_thresholds(
+        profile, [variable for variables in domain_categories.values() for variable in variables], reverse_variables)
+    return Scenario(grouped_data, domain_categories, reverse_variables, thresholds, threshold_data=profile)
+
+
+def _same_rows(a, b):
+    a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+    return (a == b) | (np.isnan(a) & np.isnan(b))
+
+
+def _same(a, b):
+    return bool(_same_rows(a, b).all())
+
+
+def test_sorted_column_matches_pandas_ranks():
+    values = np.array([3.0, np.nan, 1.0, 3.0, 2.0, 5.0])
+    column = SortedColumn(values)
+    assert _same(column.percentiles(values), pd.Series(values).rank(pct=True))
+    column.remove(3.0, 3)
+    column.insert(0.5, 3)
+    values[3] = 0.5
+    assert _same(column.percentiles(values), pd.Series(values).rank(pct=True))
+    assert sorted(column.rows_between(1.0, 3.0).tolist()) == [0, 2, 4]
+
+
+def test_baseline_is_the_weighting_engine_over_the_map_rows(inputs):
+    profile, grouped_data, domain_categories = inputs
+    scenario = _scenario(profile, grouped_data, domain_categories)
+    weighted = DomainWeighting(domain_scores(grouped_data, domain_categories, reverse_variables)).recompute()
+
+    assert scenario.tracts == grouped_data['CensusTract'].tolist()
+    assert _same(scenario._levels, weighted['PWC_Opportunity_Index'])
+    assert tier_names(scenario._levels).tolist() == weighted['Opportunity_Tier'].tolist()
+    assert not scenario.active and scenario.diff() == {'tracts': {}, 'variables': {}}
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_incremental_overrides_match_a_rebuild(inputs, seed):
+    profile, grouped_data, domain_categories = inputs
+    scenario = _scenario(profile, grouped_data, domain_categories)
+    baseline = scenario.copy()
+    rng = np.random.default_rng(seed)
+    changed_profile, changed_rows = profile.copy(), grouped_data.copy()
+    tracts = grouped_data['CensusTract'].tolist()
+    for _ in range(40):
+        tract = tracts[rng.integers(len(tracts))]
+        variable = scenario.variables[rng.integers(len(scenario.variables))]
+        column = pd.to_numeric(profile[variable], errors='coerce')
+        draw = rng.random()
+        if draw < 0.1:
+            value = None
+        elif draw < 0.4:
+            value = float(column.dropna().iloc[rng.integers(column.notna().sum())])
+        else:
+            value = float(rng.normal(column.mean(), column.std()))
+        scenario.override(tract, variable, value)
+        for frame in (changed_profile, changed_rows):
+            frame[variable] = pd.to_numeric(frame[variable], errors='coerce').astype(np.float64)
+            frame.loc[frame['CensusTract'] == tract, variable] = np.nan if value is None else value
+
+    rebuilt = _scenario(changed_profile, changed_rows, domain_categories)
+    assert _same(scenario._levels, rebuilt._levels)
+    assert (scenario._ranks == rebuilt._ranks).all() and (scenario._top == rebuilt._top).all()
+    assert _same(scenario._percentiles, rebuilt._percentiles)
+    assert (scenario._flags == rebuilt._flags).all()
+    for variable, thresholds in rebuilt.thresholds.items():
+        assert np.isclose(scenario.thresholds[variable]['p33'], thresholds['p33'])
+        assert np.isclose(scenario.thresholds[variable]['p67'], thresholds['p67'])
+
+    # The diff names exactly the tracts whose fields moved from the baseline, by how much
+    moved = ~_same_rows(baseline._levels, scenario._levels) | (baseline._ranks != scenario._ranks).any(axis=1)
+    tracts = scenario.diff()['tracts']
+    assert set(tracts) == {tract for tract, row_moved in zip(baseline.tracts, moved) if row_moved}
+    for row, tract in enumerate(baseline.tracts):
+        if tract not in tracts:
+            continue
+        before, after = baseline._levels[row], scenario._levels[row]
+        change = tracts[tract]
+        assert change['index_change'] == (None if np.isnan(before) or np.isnan(after) else after - before)
+        for position, domain in enumerate(WEIGHTED_DOMAINS):
+            old_rank, new_rank = baseline._ranks[row, position], scenario._ranks[row, position]
+            if old_rank and old_rank != new_rank:
+                assert change['rank_changes'][domain] == (new_rank - old_rank if new_rank else None)
+            else:
+                assert domain not in change['rank_changes']
+
+
+def test_scenario_message_posts_the_diff(inputs):
+    profile, grouped_data, domain_categories = inputs
+    scenario = _scenario(profile, grouped_data, domain_categories)
+    tract = grouped_data['CensusTract'].iloc[0]
+    scenario.override(tract, 'E_UNINSUR_P', 0)
+    assert scenario.active
+    message = scenario_message(scenario.diff())
+    assert json.dumps(scenario.diff(), separators=(',', ':')) in message
+    assert "type: 'nsi-dash-scenario'" in message and 'nsi-dash-scenario-request' in message
+    # A display string cannot end the script
+    assert '</b>' not in scenario_message({'tracts': {}, 'variables': {'x': {'1': {'display': '</b>'}}}})
+
+
+def _page_function(page, name):
+    """Source of a top-level function of the page's script."""
+    start = page.index(f'function {name}(')
+    depth = 0
+    for position in range(page.index('{', start), len(page)):
+        depth += {'{': 1, '}': -1}.get(page[position], 0)
+        if depth == 0:
+            return page[start:position + 1]
+
+
+SCENARIO_SCRIPT = """
+var indexLevels = %d, tierNames = %s;
+var input = JSON.parse(require('fs').readFileSync(0, 'utf8'));
+process.stdout.write(JSON.stringify(input.map(function(test) {
+    var fields = scenarioTractFields(test.index, test.ranks, test.change);
+    if (isNaN(fields.opportunity_index)) fields.opportunity_index = null;
+    return fields;
+})));
+"""
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason="needs Node.js to run the page's script")
+def test_page_moves_the_published_values_by_the_diff(inputs):
+    profile, grouped_data, domain_categories = inputs
+    thresholds = compute_variable_thresholds(
+        grouped_data, [variable for variables in domain_categories.values() for variable in variables],
+        reverse_variables)
+    page = build_map_html(grouped_data, domain_categories, thresholds)
+    script = _page_function(page, 'scenarioTractFields') + SCENARIO_SCRIPT % (INDEX_LEVELS, json.dumps(TIER_NAMES))
+    ranks = {'Housing': 1, 'Education': 2, 'Socioeconomic': 3}
+    tests = [
+        # Up two levels; Education moves above Housing
+        {'index': 3, 'ranks': ranks, 'change': {'index_change': 2, 'opportunity_index': 6.0,
+                                                'rank_changes': {'Housing': 1, 'Education': -1}}},
+        # Levels stay within 1..INDEX_LEVELS; a tie keeps the published order
+        {'index': INDEX_LEVELS - 1, 'ranks': ranks, 'change': {'index_change': 3, 'opportunity_index': 8.0,
+                                                               'rank_changes': {'Housing': 2}}},
+        # No level to move by, and a domain left without a score
+        {'index': 4, 'ranks': ranks, 'change': {'index_change': None, 'opportunity_index': None,
+                                                'rank_changes': {'Housing': None}}},
+    ]
+    result = subprocess.run(['node', '-e', script], input=json.dumps(tests), capture_output=True, text=True,
+                            check=True)
+    assert json.loads(result.stdout) == [
+        {'opportunity_index': 5, 'opportunity_tier': TIER_NAMES[2], 'top_domain': 'Education',
+         'domain_ranks': {'Housing': 2, 'Education': 1, 'Socioeconomic': 3}},
+        {'opportunity_index': INDEX_LEVELS, 'opportunity_tier': TIER_NAMES[-1], 'top_domain': 'Education',
+         'domain_ranks': {'Housing': 2, 'Education': 1, 'Socioeconomic': 3}},
+        {'opportunity_index': None, 'opportunity_tier': '', 'top_domain': 'Education',
+         'domain_ranks': {'Education': 1, 'Socioeconomic': 2}},
+    ]
@@ -0,0 +1,79 @@
+import logging
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from nsi_dash.loaders import PROFILE_CSV, read_profile_data
+from nsi_dash.geography import profile_keys
+from nsi_dash.scoring import (check_scoring, score_indicators, scoring_agreement, scoring_columns, top_variables,
+                              with_indicator_scores)
+from nsi_dash.variables import domain_categories, reverse_variables
+from nsi_dash.weighting import DomainWeighting, domain_scores, indicator_percentiles
+
+
+@pytest.fixture(scope='module')
+def profile():
+    return profile_keys(pd.read_csv(PROFILE_CSV))
+
+
+def test_top_variables_match_a_full_sort():
+    rng = np.random.default_rng(0)
+    values = pd.DataFrame(rng.random((50, 7)))
+    values[values > 0.8] = np.nan
+    top = top_variables(values, 3)
+    for row, picked in zip(values.to_numpy(), top):
+        order = [j for j in np.argsort(-np.nan_to_num(row, nan=-np.inf), kind='stable') if not np.isnan(row[j])]
+        expected = (order + [-1, -1, -1])[:3]
+        assert picked.tolist() == expected
+
+
+def test_derived_columns_follow_the_weighting_engine(profile):
+    derived = score_indicators(profile, domain_categories, reverse_variables)
+    assert list(derived.columns[:3]) == ['PWC_Opportunity_Index', 'Opportunity_Tier', 'Top_Domain']
+    assert set(scoring_columns()) == set(derived.columns)
+
+    weighted = DomainWeighting(domain_scores(profile, domain_categories, reverse_variables)).recompute()
+    pd.testing.assert_frame_equal(derived[weighted.columns], weighted)
+    assert derived['PWC_Opportunity_Index'].between(1, 8).all()
+
+
+def test_percentiles_rank_distinct_tracts(profile):
+    variables = [variable for variables in domain_categories.values() for variable in variables]
+    # The profile has a row per district of a tract
+    assert profile['CensusTract'].duplicated().any()
+    percentiles = indicator_percentiles(profile, variables, reverse_variables)
+    tracts = profile.drop_duplicates('CensusTract')
+    expected = indicator_percentiles(tracts, variables, reverse_variables).set_axis(tracts['CensusTract'])
+    pd.testing.assert_frame_equal(percentiles, expected.reindex(profile['CensusTract']).set_axis(profile.index))
+
+
+def test_complete_profile_is_returned_as_it_is(profile):
+    assert with_indicator_scores(profile, domain_categories, reverse_variables) is profile
+    # The map reads the published columns of the shipped CSV
+    pd.testing.assert_frame_equal(read_profile_data()[scoring_columns()], profile[scoring_columns()])
+
+
+def test_agreement_with_published_columns(profile):
+    derived = score_indicators(profile, domain_categories, reverse_variables)
+    assert set(scoring_agreement(derived, derived).values()) == {1.0}
+
+    shares = scoring_agreement(profile, derived)
+    assert set(shares) == set(scoring_columns())
+    # The shipped CSV was scored by another method
+    assert shares['PWC_Opportunity_Index'] < 0.95
+
+
+def test_partial_profile_is_scored_by_the_derived_model_only(profile, caplog):
+    partial = profile.drop(columns=['Top_Domain'])
+    with caplog.at_level(logging.WARNING, logger='nsi_dash'):
+        scored = with_indicator_scores(partial, domain_categories, reverse_variables)
+    # The replaced published columns are checked, and none of them is kept
+    assert 'PWC_Opportunity_Index' in caplog.text and 'Top_Domain' not in caplog.text
+    derived = score_indicators(profile, domain_categories, reverse_variables)
+    pd.testing.assert_frame_equal(scored[scoring_columns()], derived[scoring_columns()])
+
+    caplog.clear()
+    with caplog.at_level(logging.WARNING, logger='nsi_dash'):
+        check_scoring(profile, profile)
+    assert caplog.text == ''
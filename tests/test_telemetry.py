@@ -0,0 +1,34 @@
+import logging
+
+from nsi_dash import telemetry
+from nsi_dash.telemetry import event, prometheus_text, span, trace, write_metrics
+
+
+def test_spans_nest_and_carry_events(monkeypatch, caplog):
+    records = []
+    monkeypatch.setattr(telemetry, '_log', records.append)
+
+    rerun = trace('rerun')
+    with span('merge') as merge:
+        merge.rows = 3
+        with caplog.at_level(logging.INFO, logger='nsi_dash'):
+            event('unmatched_tracts', "1 profile rows couldn't be matched", rows=1)
+    rerun.finish()
+
+    assert [record['path'] for record in records] == ['rerun/merge', 'rerun']
+    assert records[0]['trace'] == records[1]['trace']
+    assert records[0]['rows'] == 3
+    assert records[0]['events'] == [{'event': 'unmatched_tracts', 'rows': 1,
+                                     'message': "1 profile rows couldn't be matched"}]
+    assert "couldn't be matched" in caplog.text
+    assert 'nsi_dash_stage_duration_seconds_count{stage="merge"}' in prometheus_text()
+
+
+def test_metrics_file_is_opt_in(monkeypatch, tmp_path):
+    monkeypatch.setattr(telemetry, 'METRICS_FILE', None)
+    assert write_metrics() is None
+
+    path = str(tmp_path / 'metrics' / 'nsi_dash.prom')
+    assert write_metrics(path) == path
+    with open(path) as f:
+        assert f.read() == prometheus_text()
@@ -0,0 +1,44 @@
+import pytest
+
+from nsi_dash.loaders import read_profile_data
+from nsi_dash.thresholds import compute_variable_thresholds, percentile_key
+from nsi_dash.variables import filter_domain_categories, reverse_variables
+
+
+# The per-variable loop that compute_variable_thresholds replaced
+def reference_thresholds(profile_data, filtered_domain_categories):
+    variable_thresholds = {}
+    for domain_name, variables in filtered_domain_categories.items():
+        for variable in variables:
+            if variable in profile_data.columns:
+                values = profile_data[variable].dropna()
+                if len(values) > 0:
+                    variable_thresholds[variable] = {
+                        'p33': values.quantile(0.33),
+                        'p67': values.quantile(0.67),
+                        'reverse': variable in reverse_variables
+                    }
+    return variable_thresholds
+
+
+def test_thresholds_match_the_per_variable_loop():
+    profile = read_profile_data()
+    domain_categories = filter_domain_categories(profile.columns)
+    thresholds = compute_variable_thresholds(
+        profile, [variable for variables in domain_categories.values() for variable in variables], reverse_variables)
+    assert thresholds == reference_thresholds(profile, domain_categories)
+
+
+def test_thresholds_per_group():
+    profile = read_profile_data()
+    variables = ['PTRAF', 'percent_homeowners', 'PTRAF']
+    by_district = compute_variable_thresholds(profile, variables, reverse_variables, (0.1, 0.5, 0.9),
+                                              group_by='District')
+    assert len(by_district) > 1
+    for district, thresholds in by_district.items():
+        rows = profile[profile['District'] == district]
+        # Grouped quantiles may differ from a single group's in the last bit
+        expected = compute_variable_thresholds(rows, variables, reverse_variables, (0.1, 0.5, 0.9))
+        assert thresholds == {variable: pytest.approx(values) for variable, values in expected.items()}
+        assert set(thresholds['PTRAF']) == {'p10', 'p50', 'p90', 'reverse'}
+    assert percentile_key(0.025) == 'p2.5'
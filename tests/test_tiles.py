@@ -0,0 +1,192 @@
+import numpy as np
+import pytest
+import shapely
+
+from nsi_dash.loaders import TRACTS_GEOJSON, read_census_tracts, read_profile_data
+from nsi_dash.pipeline import prepare_tracts
+from nsi_dash.tiles import (
+    CLOSE_PATH, LINE_TO, MOVE_TO, POLYGON, TILE_EXTENT, TILE_LAYER, _varint, _zigzag, build_tiles, encode_tile,
+    polygon_commands,
+)
+
+
+# A minimal protobuf reader, enough for the MVT messages the encoder writes
+
+def _read_varint(data, position):
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, position
+
+
+def _fields(data):
+    """[(field number, int or bytes)] of a message."""
+    fields = []
+    position = 0
+    while position < len(data):
+        key, position = _read_varint(data, position)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, position = _read_varint(data, position)
+        elif wire_type == 2:
+            length, position = _read_varint(data, position)
+            value = data[position:position + length]
+            position += length
+        else:
+            raise ValueError(f"unexpected wire type {wire_type}")
+        fields.append((number, value))
+    return fields
+
+
+def _packed(data):
+    values = []
+    position = 0
+    while position < len(data):
+        value, position = _read_varint(data, position)
+        values.append(value)
+    return values
+
+
+def _unzigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def decode_tile(data):
+    """{layer name: {'extent', 'version', 'features': [(id, {key: value}, type, rings)]}}."""
+    layers = {}
+    for number, layer_data in _fields(data):
+        assert number == 3
+        layer = {'features': []}
+        keys, values, features = [], [], []
+        for field, value in _fields(layer_data):
+            if field == 1:
+                name = value.decode('utf-8')
+            elif field == 2:
+                features.append(dict(_fields(value)))
+            elif field == 3:
+                keys.append(value.decode('utf-8'))
+            elif field == 4:
+                values.append(dict(_fields(value))[1].decode('utf-8'))
+            elif field == 5:
+                layer['extent'] = value
+            elif field == 15:
+                layer['version'] = value
+        for feature in features:
+            tags = _packed(feature[2])
+            properties = {keys[k]: values[v] for k, v in zip(tags[::2], tags[1::2])}
+            layer['features'].append((feature[1], properties, feature[3], decode_commands(_packed(feature[4]))))
+        layers[name] = layer
+    return layers
+
+
+def decode_commands(commands):
+    """Rings of closed paths, as lists of (x, y)."""
+    rings = []
+    x = y = 0
+    i = 0
+    while i < len(commands):
+        command, count = commands[i] & 7, commands[i] >> 3
+        i += 1
+        if command == CLOSE_PATH:
+            rings[-1].append(rings[-1][0])
+            continue
+        assert command in (MOVE_TO, LINE_TO)
+        if command == MOVE_TO:
+            rings.append([])
+        for _ in range(count):
+            x += _unzigzag(commands[i])
+            y += _unzigzag(commands[i + 1])
+            i += 2
+            rings[-1].append((x, y))
+    return rings
+
+
+def _signed_area(ring):
+    ring = np.asarray(ring, dtype=np.float64)
+    return float(np.sum(ring[:-1, 0] * ring[1:, 1] - ring[1:, 0] * ring[:-1, 1]) / 2)
+
+
+def _polygons(rings):
+    """Shapely geometry from MVT rings: a positive ring starts a polygon, negative ones are its holes."""
+    polygons = []
+    for ring in rings:
+        if _signed_area(ring) > 0:
+            polygons.append([ring])
+        else:
+            polygons[-1].append(ring)
+    return shapely.MultiPolygon([(rings[0], rings[1:]) for rings in polygons])
+
+
+def test_varint_and_zigzag():
+    assert _varint(0) == b'\x00'
+    assert _varint(1) == b'\x01'
+    assert _varint(300) == b'\xac\x02'
+    assert [_zigzag(value) for value in (0, -1, 1, -2, 2, 2147483647, -2147483648)] == \
+        [0, 1, 2, 3, 4, 4294967294, 4294967295]
+    for value in (0, 5, 127, 128, 300, 2 ** 40):
+        assert _read_varint(_varint(value), 0) == (value, len(_varint(value)))
+    for value in range(-50, 50):
+        assert _unzigzag(_zigzag(value)) == value
+
+
+def test_polygon_commands_round_trip():
+    square = shapely.Polygon([(0, 0), (100, 0), (100, 100), (0, 100)], [[(20, 20), (40, 20), (40, 40), (20, 40)]])
+    triangle = shapely.Polygon([(200, 200), (300, 200), (250, 300)])
+    geometry = shapely.MultiPolygon([square, triangle])
+
+    rings = decode_commands(polygon_commands(geometry))
+    assert len(rings) == 3
+    # Exterior rings have a positive area in tile coordinates, holes a negative one
+    assert [_signed_area(ring) > 0 for ring in rings] == [True, False, True]
+    assert _polygons(rings).equals(geometry)
+
+
+def test_polygon_commands_drop_collapsed_rings():
+    sliver = shapely.Polygon([(0, 0), (0.2, 0), (0.2, 0.2)])
+    assert polygon_commands(sliver) == []
+    with_tiny_hole = shapely.Polygon([(0, 0), (10, 0), (10, 10), (0, 10)], [[(5, 5), (5.2, 5), (5.2, 5.2)]])
+    rings = decode_commands(polygon_commands(with_tiny_hole))
+    assert len(rings) == 1
+
+
+def test_encode_tile_round_trip():
+    first = polygon_commands(shapely.box(0, 0, 10, 10))
+    second = polygon_commands(shapely.box(20, 20, 30, 40))
+    layers = decode_tile(encode_tile([(0, '9001.01', first), (7, '9002', second), (8, '9001.01', second)]))
+
+    layer = layers[TILE_LAYER]
+    assert layer['extent'] == TILE_EXTENT and layer['version'] == 2
+    assert [(feature_id, properties, kind) for feature_id, properties, kind, rings in layer['features']] == [
+        (0, {'CensusTract': '9001.01'}, POLYGON),
+        (7, {'CensusTract': '9002'}, POLYGON),
+        (8, {'CensusTract': '9001.01'}, POLYGON),
+    ]
+    assert _polygons(layer['features'][1][3]).equals(shapely.box(20, 20, 30, 40))
+
+
+@pytest.fixture(scope='module')
+def grouped_data():
+    return prepare_tracts(read_profile_data(), read_census_tracts(TRACTS_GEOJSON), ['153'])
+
+
+def test_build_tiles_covers_every_row(grouped_data):
+    keys = grouped_data['CensusTract'].tolist()
+    tiles = dict(build_tiles(grouped_data.geometry.values, keys, min_zoom=8, max_zoom=10))
+    assert {z for z, x, y in tiles} == {8, 9, 10}
+
+    for zoom in (8, 9, 10):
+        seen = set()
+        for (z, x, y), data in tiles.items():
+            if z != zoom:
+                continue
+            for feature_id, properties, kind, rings in decode_tile(data)[TILE_LAYER]['features']:
+                assert properties['CensusTract'] == str(keys[feature_id])
+                assert kind == POLYGON
+                shape = _polygons(rings)
+                assert shape.is_valid and shape.area > 0
+                seen.add(feature_id)
+        assert seen == set(range(len(keys)))
@@ -0,0 +1,91 @@
+import json
+
+import pandas as pd
+import pytest
+
+from nsi_dash.districts import district_proportions, district_strings, summarize_districts
+from nsi_dash.loaders import TRACTS_GEOJSON, read_census_tracts, read_profile_data
+from nsi_dash.pipeline import prepare_tracts
+from nsi_dash.tracts import build_tract_data
+from nsi_dash.variables import csv_domains, get_readable_name, old_to_new_domain_map
+
+
+# The iterrows loop that build_tract_data replaced
+def reference_tract_data(grouped_data, district_raw_by_tract, district_info_by_tract):
+    tract_data = {}
+    for position, (idx, row) in enumerate(grouped_data.iterrows()):
+        tract_id = row['CensusTract']
+
+        domain_ranks = {}
+        for old_domain in csv_domains:
+            rank_col = f"{old_domain}_Rank"
+            if rank_col in row and pd.notna(row[rank_col]):
+                domain_ranks[old_to_new_domain_map[old_domain]] = int(row[rank_col])
+
+        domain_variables = {}
+        for old_domain in csv_domains:
+            domain_vars = []
+            for i in range(1, 4):
+                var_col = f"{old_domain}_Var{i}"
+                if var_col in row and pd.notna(row[var_col]) and row[var_col]:
+                    domain_vars.append(get_readable_name(row[var_col]))
+            if domain_vars:
+                domain_variables[old_to_new_domain_map[old_domain]] = domain_vars
+
+        def safe_get(column_name, default="Not Available"):
+            if column_name in row and pd.notna(row[column_name]) and str(row[column_name]).strip():
+                return str(row[column_name]).strip()
+            return default
+
+        district_raw = district_raw_by_tract.iloc[position]
+        district_info = district_info_by_tract.iloc[position]
+        display_tract_id = f"{tract_id}*" if district_info['is_multi_district'] else tract_id
+
+        tract_data[tract_id] = {
+            'opportunity_index': float(row['PWC_Opportunity_Index']),
+            'opportunity_tier': row['Opportunity_Tier'] if 'Opportunity_Tier' in row else '',
+            'top_domain': old_to_new_domain_map.get(row['Top_Domain'], row['Top_Domain']) if 'Top_Domain' in row else '',
+            'domain_ranks': domain_ranks,
+            'domain_variables': domain_variables,
+            'district': district_info['display_text'],
+            'district_raw': district_raw,
+            'districts': district_info['districts'],
+            'proportions': district_info['proportions'],
+            'primary_district': district_info['primary_district'],
+            'neighborhood': safe_get('Neighborhood'),
+            'first_due': safe_get('1st Due'),
+            'display_tract_id': display_tract_id,
+            'is_multi_district': bool(district_info['is_multi_district'])
+        }
+    return tract_data
+
+
+@pytest.fixture(scope='module')
+def grouped_data():
+    return prepare_tracts(read_profile_data(), read_census_tracts(TRACTS_GEOJSON), ['153'])
+
+
+def _both(grouped_data):
+    raw = district_strings(grouped_data)
+    info = summarize_districts(district_proportions(raw), raw.index)
+    return build_tract_data(grouped_data, raw, info), reference_tract_data(grouped_data, raw, info)
+
+
+def _json(tract_data):
+    return json.dumps(tract_data, default=str)
+
+
+def test_tract_data_matches_the_iterrows_loop(grouped_data):
+    tract_data, expected = _both(grouped_data)
+    assert len(tract_data) == len(grouped_data)
+    assert _json(tract_data) == _json(expected)
+
+
+def test_tract_data_matches_with_gaps(grouped_data):
+    # Missing optional columns, empty top-variable slots and blank text fields
+    data = grouped_data.drop(columns=['Top_Domain', 'Opportunity_Tier', 'Housing_Rank', 'Environmental_Var2'])
+    data['Socioeconomic_Var1'] = data['Socioeconomic_Var1'].where(data.index % 3 != 0, '')
+    data['Socioeconomic_Rank'] = data['Socioeconomic_Rank'].where(data.index % 4 != 0)
+    data['Neighborhood'] = data['Neighborhood'].where(data.index % 5 != 0, '  ')
+    tract_data, expected = _both(data)
+    assert _json(tract_data) == _json(expected)
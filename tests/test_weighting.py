@@ -0,0 +1,163 @@
+import json
+import shutil
+import subprocess
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from nsi_dash.loaders import TRACTS_GEOJSON, read_census_tracts, read_profile_data
+from nsi_dash.map_page import build_map_html
+from nsi_dash.pipeline import prepare_tracts
+from nsi_dash.thresholds import compute_variable_thresholds
+from nsi_dash.variables import filter_domain_categories, reverse_variables
+from nsi_dash.weighting import (
+    DOMAIN_PREFIXES, INDEX_LEVELS, TIER_NAMES, WEIGHTED_DOMAINS, DomainWeighting, apply_weights, domain_scores,
+    index_levels, parse_weights, scores_payload, tier_names, weigh_scores,
+)
+
+
+@pytest.fixture(scope='module')
+def inputs():
+    profile = read_profile_data()
+    grouped_data = prepare_tracts(profile, read_census_tracts(TRACTS_GEOJSON), ['153'])
+    return grouped_data, filter_domain_categories(profile.columns)
+
+
+def test_weigh_scores():
+    scores = np.array([
+        [0.2, 0.8, 0.5],
+        [0.9, np.nan, 0.1],
+        [np.nan, np.nan, np.nan],
+    ])
+    composite, ranks, top = weigh_scores(scores, np.array([1.0, 1.0, 2.0]))
+    np.testing.assert_allclose(composite[:2], [(0.2 + 0.8 + 1.0) / 4, (0.9 + 0.2) / 3])
+    assert np.isnan(composite[2])
+    assert ranks.tolist() == [[3, 2, 1], [1, 0, 2], [0, 0, 0]]
+    assert top.tolist() == [2, 0, -1]
+
+
+def test_index_levels_are_equal_count_bins():
+    composite = np.arange(16, dtype=np.float64)
+    assert index_levels(composite).tolist() == [level for level in range(1, INDEX_LEVELS + 1) for _ in range(2)]
+    levels = index_levels(np.array([0.5, np.nan, 0.5, 0.1]))
+    assert np.isnan(levels[1]) and levels[[0, 2, 3]].tolist() == [8, 8, 3]
+    assert np.isnan(index_levels(np.array([np.nan]))).all()
+    assert tier_names(np.array([1, 2, 3, 8, np.nan])).tolist() == [
+        TIER_NAMES[0], TIER_NAMES[0], TIER_NAMES[1], TIER_NAMES[3], '']
+
+
+def test_parse_weights():
+    assert parse_weights("Housing=2, public-health=0,Transportation_Safety=0.5") == {
+        'Housing': 2.0, 'Public Health': 0.0, 'Transportation Safety': 0.5}
+    assert parse_weights("") == {}
+    for text in ("Housing", "Nowhere=1", "Housing="):
+        with pytest.raises(ValueError):
+            parse_weights(text)
+
+
+def _reference(scores, weights):
+    """Index, tier, top domain and domain ranks one row at a time."""
+    weights = np.array([weights.get(domain, 1.0) for domain in scores.columns])
+    composite = []
+    tops = []
+    ranks = []
+    for row in scores.to_numpy():
+        present = [d for d in range(len(row)) if not np.isnan(row[d])]
+        composite.append(sum(row[d] * weights[d] for d in present) / sum(weights[d] for d in present)
+                         if present else np.nan)
+        order = sorted(present, key=lambda d: (-row[d] * weights[d], d))
+        tops.append(DOMAIN_PREFIXES[scores.columns[order[0]]] if order else '')
+        ranks.append({d: position + 1 for position, d in enumerate(order)})
+    composite = np.array(composite)
+    valid = composite[~np.isnan(composite)]
+    levels = [np.nan if np.isnan(value) else
+              min(INDEX_LEVELS, max(1, np.ceil((valid <= value).sum() / len(valid) * INDEX_LEVELS)))
+              for value in composite]
+    return levels, tops, ranks
+
+
+@pytest.mark.parametrize('weights', [{}, {'Housing': 2.0, 'Public Health': 0.0}, {'Mobility': 0.25}])
+def test_recompute_matches_a_row_by_row_reference(inputs, weights):
+    grouped_data, domain_categories = inputs
+    scores = domain_scores(grouped_data, domain_categories, reverse_variables)
+    assert list(scores.columns) == WEIGHTED_DOMAINS
+    assert ((scores.to_numpy() >= 0) & (scores.to_numpy() <= 1) | scores.isna().to_numpy()).all()
+
+    result = DomainWeighting(scores).recompute(weights)
+    levels, tops, ranks = _reference(scores, weights)
+    np.testing.assert_array_equal(result['PWC_Opportunity_Index'].to_numpy(), levels)
+    assert result['Top_Domain'].tolist() == tops
+    for position, domain in enumerate(WEIGHTED_DOMAINS):
+        column = result[f"{DOMAIN_PREFIXES[domain]}_Rank"]
+        assert [None if pd.isna(rank) else rank for rank in column] == [row.get(position) for row in ranks]
+
+    weighted = apply_weights(grouped_data, domain_categories, reverse_variables, weights)
+    assert weighted['PWC_Opportunity_Index'].equals(result['PWC_Opportunity_Index'])
+    assert weighted['Opportunity_Tier'].tolist() == result['Opportunity_Tier'].tolist()
+
+
+def test_weights_are_scale_free_and_memoized(inputs):
+    grouped_data, domain_categories = inputs
+    weighting = DomainWeighting(domain_scores(grouped_data, domain_categories, reverse_variables))
+    equal = weighting.recompute()
+    assert weighting.recompute({domain: 3.0 for domain in WEIGHTED_DOMAINS}).equals(equal)
+    assert weighting.recompute({}) is equal
+    for weights in ({'Nowhere': 1.0}, {'Housing': -1.0}, {domain: 0.0 for domain in WEIGHTED_DOMAINS}):
+        with pytest.raises(ValueError):
+            weighting.recompute(weights)
+
+
+def _page_function(page, name):
+    """Source of a top-level function of the page's script."""
+    start = page.index(f'function {name}(')
+    depth = 0
+    for position in range(page.index('{', start), len(page)):
+        depth += {'{': 1, '}': -1}.get(page[position], 0)
+        if depth == 0:
+            return page[start:position + 1]
+
+
+WEIGHT_SCRIPT = """
+var indexLevels = %d, tierNames = %s, weightingCache = new Map(), WEIGHTING_CACHE_SIZE = 32;
+var input = JSON.parse(require('fs').readFileSync(0, 'utf8'));
+process.stdout.write(JSON.stringify(input.weights.map(function(weights) {
+    var fields = weightDomains(input.data, weights);
+    return {opportunity_index: Array.from(fields.opportunity_index, function(level) { return isNaN(level) ? null : level; }),
+            opportunity_tier: fields.opportunity_tier, top_domain: fields.top_domain, domain_ranks: fields.domain_ranks};
+})));
+"""
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason="needs Node.js to run the page's script")
+def test_page_weighting_matches_the_engine(inputs):
+    grouped_data, domain_categories = inputs
+    thresholds = compute_variable_thresholds(
+        grouped_data, [variable for variables in domain_categories.values() for variable in variables],
+        reverse_variables)
+    page = build_map_html(grouped_data, domain_categories, thresholds)
+    script = (_page_function(page, 'compositeLevels') + _page_function(page, 'weightDomains')
+              + WEIGHT_SCRIPT % (INDEX_LEVELS, json.dumps(TIER_NAMES)))
+
+    scores = domain_scores(grouped_data, domain_categories, reverse_variables)
+    # The page gets the scores rounded, so the engine runs on the same values
+    data = scores_payload(scores)
+    rounded = pd.DataFrame(np.array([np.nan if value is None else value for value in data['scores']])
+                           .reshape(scores.shape), index=scores.index, columns=scores.columns)
+    all_weights = [{}, {'Housing': 2.0, 'Public Health': 0.0}, {'Socioeconomic': 0.5, 'Environmental': 3.0}]
+    vectors = [[weights.get(domain, 1.0) for domain in data['domains']] for weights in all_weights]
+    result = subprocess.run(['node', '-e', script], input=json.dumps({'data': data, 'weights': vectors}),
+                            capture_output=True, text=True, check=True)
+
+    weighting = DomainWeighting(rounded)
+    for weights, fields in zip(all_weights, json.loads(result.stdout)):
+        expected = weighting.recompute(weights)
+        assert fields['opportunity_index'] == [None if pd.isna(level) else level
+                                               for level in expected['PWC_Opportunity_Index']]
+        assert fields['opportunity_tier'] == expected['Opportunity_Tier'].tolist()
+        assert [DOMAIN_PREFIXES.get(domain, '') for domain in fields['top_domain']] == \
+            expected['Top_Domain'].tolist()
+        for domain in WEIGHTED_DOMAINS:
+            column = expected[f"{DOMAIN_PREFIXES[domain]}_Rank"]
+            assert [ranks.get(domain) for ranks in fields['domain_ranks']] == \
+                [None if pd.isna(rank) else rank for rank in column]